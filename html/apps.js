@@ -1,4 +1,5 @@
 const SEVEN_SECONDS = 7*1000;
+const ONE_SECOND = 1000;
 
 class ScheduleDialog {
 
@@ -264,13 +265,18 @@ async function loadScreenshot(ms) {
     const random = Math.random().toString(36).substring(2, 15); 
 
     const img = document.getElementById("kiosk-screenshot");
-    img.src = `./display/screenshot.png?${timestamp}-${random}`; 
+    img.src = `./display/screenshot?scale=10&${timestamp}-${random}`; 
 
     img.addEventListener("load", () => {
         document.getElementById("kiosk-screenshot-loading").classList.add("d-none");
     }, { once: true });
 }
 
+function loadLiveView() {
+    const img = document.getElementById("kiosk-screenshot");
+    img.src = "./display/stream";
+}
+
 async function loadBrowser() {
     const browser = await getJson("/browser");
 
@@ -279,9 +285,6 @@ async function loadBrowser() {
 }
 
 async function saveBrowser() {
-    // Schedule a screenshot in 10 sec, chrome starts very slow...
-    loadScreenshot(SEVEN_SECONDS);   
-
     const data = {
         url : document.getElementById("kiosk-browser-url").value,
         scale : parseFloat(document.getElementById("kiosk-browser-scale").value) / 100
@@ -292,6 +295,9 @@ async function saveBrowser() {
     if (!response.ok)
         throw new Error(`An error occurred while updating browser settings.`);
 
+    // The page is reloaded in place, give it a moment to render.
+    loadScreenshot(ONE_SECOND);
+
     await loadBrowser();    
 }
 
@@ -813,6 +819,10 @@ async function populate() {
         loadScreenshot();
     })
 
+    document.getElementById("kiosk-screenshot-live").addEventListener("click", () => {
+        loadLiveView();
+    })
+
     addProgressEventHandler('kiosk-password-save', async() => {
         await savePassword();        
     });
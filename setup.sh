@@ -55,6 +55,7 @@ install_window_manager() {
 
   mkdir -p /etc/kiosk
   mkdir -p /etc/kiosk/screens.d
+  mkdir -p /var/cache/kiosk/proxy
 
   # Set reasonable default for our screens.
   if [ ! -f /etc/kiosk/screens.d/HDMI-1 ]; then
@@ -119,6 +120,7 @@ install_browser() {
   cat > /etc/kiosk/browser.conf << EOF
 KIOSK_HOME=https://www.example.com/
 KIOSK_SCALE_FACTOR=1.0
+KIOSK_FLAGS=
 EOF
 
   cat > /etc/systemd/system/kiosk-browser.service << EOF
@@ -136,7 +138,7 @@ Environment=DISPLAY=:0
 # Which prevents chromium from starting.
 ExecStartPre=/bin/bash -c "rm -rf ~/.config/chromium/Singleton*"
 
-ExecStart=/bin/bash -c "/usr/bin/chromium-browser --hide-scrollbars --high-dpi-support=1 --force-device-scale-factor=\$KIOSK_SCALE_FACTOR --enable-offline-auto-reload --kiosk --incognito --window-position=0,0 \$KIOSK_HOME"
+ExecStart=/bin/bash -c "/usr/bin/chromium-browser --hide-scrollbars --high-dpi-support=1 --force-device-scale-factor=\$KIOSK_SCALE_FACTOR --enable-offline-auto-reload --remote-debugging-address=127.0.0.1 --remote-debugging-port=9222 \$KIOSK_FLAGS --kiosk --incognito --window-position=0,0 \$KIOSK_HOME"
 
 [Install]
 WantedBy=multi-user.target
@@ -149,14 +151,15 @@ EOF
 install_application() {
   echo Installing Application
 
-  # Needed to convert screenshots.
+  # Needed to convert screenshots, it is the fallback in case the
+  # in process capture is not available.
   apt-get install imagemagick x11-apps -yy -qq
 
   # Install python
   mkdir -p /opt/kiosk
   python -mvenv /opt/kiosk/.venv 
 
-  /opt/kiosk/.venv/bin/pip install flask --quiet
+  /opt/kiosk/.venv/bin/pip install flask numpy pillow --quiet
 
   cp __init__.py /opt/kiosk/
 
@@ -2,18 +2,37 @@
 Tha main application logic
 """
 from pathlib import Path
+import base64
+import logging
 import mimetypes
-import time
 
 from flask import Flask, request, jsonify, session, redirect, send_file, Response
 
+from src.browserprofile import BrowserProfile, BrowserProfileException
 from src.cert import Cert
 from src.display import Browser, Display
-from src.motionsensor import MotionSensor
+from src.httpcache import HttpCache
+from src.reload import RELOAD_TIMEOUT, ReloadHandle, ReloadScheduler
+from src.scheduler import DeadlineScheduler
+from src.screenconfig import ScreenConfigStore
+from src.memory import MemoryGovernor
+from src.gpioloop import GpioEventLoop
+from src.linepolicy import LinePolicy, LinePolicyException
+from src.motionsensor import MotionSensor, MotionSensorException, Sensor
 from src.config import Config
 from src.cron import CronFile, CronFileRebootItem, CronFileDisplayOnItem, CronFileDisplayOffItem
 from src.network import Network
+from src.playlist import Playlist, PlaylistException, PlaylistPlayer
+from src.snapshot import MIN_CAPTURE_INTERVAL, OfflineFallback, SnapshotStore
+from src.screenshot import MIME_TYPES, ScreenshotCache, ScreenshotOptionException
+from src.stream import STREAM_MIME_TYPE, ScreenshotStream
 from src.system import System
+from src.telemetry import PerformanceCollector
+from src.watchdog import MIN_FREEZE_TIMEOUT, FreezeWatchdog
+from src.worker.proxy import CachingProxyWorker
+
+# Jpeg is preferred for clients which accept anything.
+SCREENSHOT_FORMATS = ["jpeg", "webp", "png"]
 
 PUBLIC_FUNCTION =  ['on_get_index','on_login','on_is_authenticated','on_logout', 'on_get_resource']
 
@@ -27,17 +46,79 @@ class App:
         Creates a new instance.
         """
         self.__config = config
-        self.__display = Display()
-        self.__browser = Browser()
+        self.__screenshots = ScreenshotCache(config.get_screenshot_ttl())
+        self.__screen_configs = ScreenConfigStore()
+        self.__screen_configs.watch()
+        # Browser and display share the scheduler, so that their reloads are merged.
+        self.__reloads = ReloadScheduler()
+        self.__display = Display(
+            screenshots=self.__screenshots, screen_configs=self.__screen_configs,
+            reloads=self.__reloads)
+        self.__display.watch_topology()
+        self.__browser = Browser(self.__screenshots, reloads=self.__reloads)
+
+        self.__proxy = None
+        if config.is_proxy_enabled():
+            self.__start_proxy()
+
+        # Created before anything opens a devtools session, so that every
+        # session gets the performance domain enabled.
+        self.__performance = PerformanceCollector(
+            self.__browser.get_cdp(), config.get_browser_metrics_interval())
+
+        if config.is_browser_metrics_enabled():
+            self.__performance.start()
+
+        self.__memory = self.__create_memory_governor()
+        if config.is_memory_governor_enabled():
+            self.__memory.start()
+
+        self.__playlist = PlaylistPlayer(self.__browser.get_cdp())
+        try:
+            self.__playlist.set_playlist(Playlist.from_list(config.get_playlist()))
+        except PlaylistException as ex:
+            logging.getLogger('flask.app').warning("Ignoring invalid playlist: %s", ex)
+
+        if config.is_playlist_enabled():
+            self.__playlist.start()
+
+        self.__offline = OfflineFallback(
+            self.__browser, SnapshotStore(), config.get_snapshot_interval())
+
+        if config.is_snapshot_enabled():
+            self.__offline.start()
+
+        stream_scale = config.get_stream_scale()
+        stream_quality = config.get_stream_quality()
+        self.__stream = ScreenshotStream(
+            lambda max_age: self.__display.get_screenshot(
+                stream_scale, "jpeg", stream_quality, max_age=max_age),
+            config.get_stream_fps())
+        self.__watchdog = FreezeWatchdog(
+            self.__display, self.__browser, config.get_watchdog_timeout())
+
+        if config.is_watchdog_enabled():
+            self.__watchdog.start()
+
         self.__cert = Cert(root=config.get_root())
-        self.__system = System()
+        self.__scheduler = DeadlineScheduler()
+        self.__system = System(self.__scheduler)
         self.__network = Network()
 
-        self.__motion_sensor = MotionSensor(
-            self.__display, self.__config.get_motion_sensor_delay())
+        try:
+            policy = LinePolicy.from_dict(self.__config.get_motion_sensor_line())
+        except (LinePolicyException, TypeError) as ex:
+            logging.getLogger('flask.app').warning("Invalid motion sensor line settings: %s", ex)
+            policy = LinePolicy()
+
+        self.__gpio = GpioEventLoop()
+        self.__motion_sensor = self.__create_motion_sensor(policy)
 
         if self.__config.is_motion_sensor_enabled():
-            self.__motion_sensor.enable()
+            try:
+                self.__motion_sensor.enable()
+            except MotionSensorException as ex:
+                logging.getLogger('flask.app').error("Motion sensor not started: %s", ex)
 
         self.__cron = CronFile()
         self.__cron.add_cron_item(CronFileRebootItem())
@@ -46,15 +127,81 @@ class App:
 
 
     # Screen related function.
-    def on_get_screenshot(self):
+    def on_get_screenshot(self, picture_format:str = None):
+        """
+        Takes a screenshot and returns it in the requested format.
+        The format is either fixed by the route, given as query parameter
+        or negotiated via the accept header.
         """
-        Takes a screenshot and returns it as png.
+        if not picture_format:
+            picture_format = request.args.get("format")
+
+        if not picture_format:
+            mime_type = request.accept_mimetypes.best_match(
+                [MIME_TYPES[item] for item in SCREENSHOT_FORMATS], default=MIME_TYPES["png"])
+
+            picture_format = next(
+                key for key, value in MIME_TYPES.items() if value == mime_type)
+
+        try:
+            screenshot = self.__display.get_screenshot(
+                request.args.get("scale"), picture_format,
+                request.args.get("quality"),
+                request.args.get("max_width"), request.args.get("max_height"))
+        except ScreenshotOptionException as e:
+            return f"Invalid screenshot request: {e}", 400
+        except Exception as e:
+            return f"Error occurred: {e}", 500
+
+        response = Response(screenshot, mimetype=MIME_TYPES[picture_format])
+        response.headers["Vary"] = "Accept"
+        return response
+
+    def on_get_screenshot_delta(self):
+        """
+        Returns the tiles which changed since the frame given as since
+        parameter. Each tile is encoded separately and embedded as base64.
         """
+        since = request.args.get("since", type=int)
+
         try:
-            return Response(self.__display.get_screenshot(), mimetype='image/png')
+            delta = self.__display.get_screenshot_delta(
+                since, request.args.get("scale"),
+                request.args.get("format", "jpeg"), request.args.get("quality"))
+        except ScreenshotOptionException as e:
+            return f"Invalid screenshot request: {e}", 400
         except Exception as e:
             return f"Error occurred: {e}", 500
 
+        tiles = []
+        for region, data in delta.get_tiles():
+            tile = { "data" : base64.b64encode(data).decode("ascii") }
+
+            if region:
+                tile.update({
+                    "x" : region.get_x(),
+                    "y" : region.get_y(),
+                    "width" : region.get_width(),
+                    "height" : region.get_height()
+                })
+
+            tiles.append(tile)
+
+        return jsonify({
+            "frame" : delta.get_frame_id(),
+            "keyframe" : delta.is_keyframe(),
+            "width" : delta.get_width(),
+            "height" : delta.get_height(),
+            "mimetype" : MIME_TYPES[request.args.get("format", "jpeg")],
+            "tiles" : tiles
+        })
+
+    def on_get_stream(self):
+        """
+        Streams the screen as motion jpeg.
+        """
+        return Response(self.__stream.frames(), mimetype=STREAM_MIME_TYPE)
+
     def on_get_browser(self):
         """
         Gets the browser related configuration like the url and the scale.
@@ -62,21 +209,306 @@ class App:
 
         return jsonify({
             "url" : self.__browser.get_url(),
-            "scale" : self.__browser.get_scale()
+            "scale" : self.__browser.get_scale(),
+            "profile" : self.__browser.get_profile().to_dict()
         })
 
     def on_set_browser(self):
         """
         Sets the browser related configuration, and reloads it.
+        A changed profile or scale restarts the browser.
         """
         data = request.json
+
+        profile = None
+        if "profile" in data:
+            try:
+                profile = BrowserProfile.from_dict(data.pop("profile"))
+            except (BrowserProfileException, TypeError) as ex:
+                return jsonify({"error": str(ex)}), 400
+
         self.__browser.set_url(data.pop("url"))
         self.__browser.set_scale_factor(data.pop("scale"))
 
-        self.__browser.reload()
+        if profile is not None:
+            self.__browser.set_profile(profile)
+
+        error = self.__wait_for_reload(self.__browser.reload())
+        if error is not None:
+            return error
 
         return self.on_get_browser()
 
+    def __wait_for_reload(self, handle: ReloadHandle):
+        """
+        Waits for the scheduled reload, returns an error response in case
+        it failed. A reload which takes too long keeps running.
+        """
+        if not handle.wait(RELOAD_TIMEOUT):
+            logging.getLogger('flask.app').warning("Browser reload still pending")
+            return None
+
+        if handle.get_error() is not None:
+            return jsonify({"error": f"Reload failed: {handle.get_error()}"}), 500
+
+        return None
+
+    def __start_proxy(self):
+        """
+        Starts the caching proxy for the configured upstream, which
+        defaults to the homepage's origin.
+        """
+        upstream = self.__config.get_proxy_upstream() or self.__browser.get_url()
+
+        try:
+            proxy = CachingProxyWorker(
+                upstream,
+                HttpCache(max_size=self.__config.get_proxy_cache_size() * 1024 * 1024),
+                self.__config.get_proxy_port())
+            proxy.run()
+        except (ValueError, OSError) as ex:
+            logging.getLogger('flask.app').warning("Failed to start the proxy: %s", ex)
+            self.__browser.set_proxy(None)
+            return
+
+        self.__proxy = proxy
+        self.__browser.set_proxy(proxy)
+
+    def __stop_proxy(self):
+        """
+        Stops the caching proxy, the browser loads the homepage directly again.
+        """
+        if self.__proxy is None:
+            return
+
+        self.__browser.set_proxy(None)
+        self.__proxy.stop()
+        self.__proxy = None
+
+    def on_get_proxy(self):
+        """
+        Gets the proxy configuration along with its hit and miss metrics.
+        """
+        return jsonify({
+            "enabled" : self.__config.is_proxy_enabled(),
+            "running" : self.__proxy is not None,
+            "upstream" : self.__config.get_proxy_upstream(),
+            "cache_size" : self.__config.get_proxy_cache_size(),
+            "origin" : self.__proxy.get_origin() if self.__proxy else None,
+            "metrics" : self.__proxy.get_metrics() if self.__proxy else None
+        })
+
+    def on_set_proxy(self):
+        """
+        Configures the proxy, it is restarted and the browser reloaded.
+        """
+        data = request.json
+
+        try:
+            cache_size = int(data.get("cache_size", self.__config.get_proxy_cache_size()))
+        except (TypeError, ValueError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        enabled = data.get("enabled", False)
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "Enabled has to be a boolean"}), 400
+
+        self.__config.set_proxy(enabled, data.get("upstream") or None, cache_size)
+
+        self.__stop_proxy()
+        if self.__config.is_proxy_enabled():
+            self.__start_proxy()
+
+        error = self.__wait_for_reload(self.__browser.reload())
+        if error is not None:
+            return error
+
+        return self.on_get_proxy()
+
+    def on_get_browser_metrics(self):
+        """
+        Gets the browser's performance samples, the since parameter
+        limits them to the ones taken after the given unix timestamp.
+        """
+        since = request.args.get("since", None, type=float)
+
+        return jsonify({
+            "enabled" : self.__performance.is_running(),
+            "interval" : self.__performance.get_interval(),
+            "samples" : self.__performance.get_samples(since)
+        })
+
+    def __create_memory_governor(self) -> MemoryGovernor:
+        """
+        Creates the memory governor with the configured limits.
+        """
+        limit = self.__config.get_memory_limit()
+
+        return MemoryGovernor(
+            self.__browser, self.__display,
+            limit * 1024 * 1024 if limit else None,
+            self.__config.get_memory_pressure_limit(),
+            self.__config.get_memory_quiet_wait())
+
+    def on_get_memory(self):
+        """
+        Gets the browser's memory usage along with the governor's counters and events.
+        """
+        status = self.__memory.get_status()
+        status["enabled"] = self.__memory.is_running()
+
+        return jsonify(status)
+
+    def on_set_memory(self):
+        """
+        Configures the memory governor, a limit of null means half of the system's memory.
+        """
+        data = request.json
+
+        try:
+            limit = int(data["limit"]) if data.get("limit") else None
+            pressure = float(data.get("pressure", self.__config.get_memory_pressure_limit()))
+            quiet_wait = float(data.get("quiet_wait", self.__config.get_memory_quiet_wait()))
+        except (TypeError, ValueError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        enabled = data.get("enabled", False)
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "Enabled has to be a boolean"}), 400
+
+        self.__config.set_memory_governor(enabled, limit, pressure, quiet_wait)
+
+        self.__memory.stop()
+        self.__memory = self.__create_memory_governor()
+
+        if self.__config.is_memory_governor_enabled():
+            self.__memory.start()
+
+        return self.on_get_memory()
+
+    def on_get_snapshot(self):
+        """
+        Gets the offline snapshot configuration and its counters.
+        """
+        latest = self.__offline.get_store().get_latest(self.__browser.get_url())
+
+        return jsonify({
+            "enabled" : self.__offline.is_running(),
+            "interval" : self.__config.get_snapshot_interval(),
+            "latest" : latest.name if latest else None,
+            "counters" : self.__offline.get_counters()
+        })
+
+    def on_set_snapshot(self):
+        """
+        Enables or disables the offline snapshots, disabling deletes them.
+        """
+        data = request.json
+
+        try:
+            interval = float(data.get("interval", self.__config.get_snapshot_interval()))
+        except (TypeError, ValueError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        if interval < MIN_CAPTURE_INTERVAL:
+            return jsonify({
+                "error": f"Interval must be at least {MIN_CAPTURE_INTERVAL} seconds"}), 400
+
+        enabled = data.get("enabled", False)
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "Enabled has to be a boolean"}), 400
+
+        self.__config.set_snapshot(enabled, interval)
+
+        self.__offline.set_capture_interval(interval)
+
+        if enabled:
+            self.__offline.start()
+        else:
+            self.__offline.stop()
+            self.__offline.get_store().clear()
+
+        return self.on_get_snapshot()
+
+    def on_get_playlist(self):
+        """
+        Gets the playlist and the item currently shown.
+        """
+        current = self.__playlist.get_current()
+
+        return jsonify({
+            "enabled" : self.__playlist.is_running(),
+            "items" : self.__playlist.get_playlist().to_list(),
+            "current" : current.get_url() if current else None
+        })
+
+    def on_set_playlist(self):
+        """
+        Sets the playlist, an enabled playlist replaces the homepage.
+        """
+        data = request.json
+
+        try:
+            playlist = Playlist.from_list(data.get("items", []))
+        except (PlaylistException, AttributeError, TypeError, ValueError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        enabled = data.get("enabled", False)
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "Enabled has to be a boolean"}), 400
+
+        self.__config.set_playlist(enabled, playlist.to_list())
+        self.__playlist.set_playlist(playlist)
+
+        if enabled:
+            self.__playlist.start()
+        elif self.__playlist.is_running():
+            # Go back to the homepage.
+            self.__playlist.stop()
+            self.__browser.reload()
+
+        return self.on_get_playlist()
+
+    def on_get_watchdog(self):
+        """
+        Gets the frozen screen watchdog's settings and counters.
+        """
+        return jsonify({
+            "enabled" : self.__watchdog.is_running(),
+            "timeout" : self.__watchdog.get_freeze_timeout(),
+            "unchanged" : self.__watchdog.get_unchanged(),
+            "counters" : self.__watchdog.get_counters()
+        })
+
+    def on_set_watchdog(self):
+        """
+        Enables or disables the frozen screen watchdog.
+        """
+        data = request.json
+
+        try:
+            timeout = float(data.get("timeout", self.__config.get_watchdog_timeout()))
+        except (TypeError, ValueError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        if timeout < MIN_FREEZE_TIMEOUT:
+            return jsonify({
+                "error": f"Timeout must be at least {MIN_FREEZE_TIMEOUT} seconds"}), 400
+
+        enabled = data.get("enabled", self.__watchdog.is_running())
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "Enabled has to be a boolean"}), 400
+
+        self.__config.set_watchdog(enabled, timeout)
+        self.__watchdog.set_freeze_timeout(timeout)
+
+        if enabled:
+            self.__watchdog.start()
+        else:
+            self.__watchdog.stop()
+
+        return self.on_get_watchdog()
+
     def on_set_display_off(self):
         """
         Turns the screen off.
@@ -140,11 +572,6 @@ class App:
 
         self.__display.set_screen(name, data.pop("orientation"))
 
-        # We are racing here against the window manager reload.
-        # Thus we need to give it some time to negotiate the
-        # new screen resolutions.
-        time.sleep(2)
-
         return self.on_get_screen(name)
 
     # Certificate Endpoint related functions
@@ -190,6 +617,25 @@ class App:
         self.__cron.save_jobs(request.json)
         return self.on_get_schedule()
 
+    def __create_motion_sensor(self, policy: LinePolicy) -> MotionSensor:
+        """
+        Creates the motion sensors from the config, invalid settings
+        fall back to the default sensor.
+        """
+        delay = self.__config.get_motion_sensor_delay()
+
+        try:
+            return MotionSensor(
+                self.__display, delay, self.__gpio, policy,
+                [Sensor.from_dict(sensor) for sensor in self.__config.get_motion_sensors()],
+                self.__config.get_motion_sensor_aggregation(),
+                self.__config.get_motion_sensor_quorum(), self.__scheduler)
+        except (MotionSensorException, TypeError) as ex:
+            logging.getLogger('flask.app').warning("Invalid motion sensor settings: %s", ex)
+
+        return MotionSensor(
+            self.__display, delay, self.__gpio, policy, scheduler=self.__scheduler)
+
     def on_get_motion_sensor(self):
         """
         Gets the motion sensors settings.
@@ -197,23 +643,74 @@ class App:
 
         return jsonify({
             "enabled" : self.__motion_sensor.is_enabled(),
-            "delay" : self.__motion_sensor.get_delay()
+            "delay" : self.__motion_sensor.get_delay(),
+            "line" : self.__motion_sensor.get_policy().to_dict(),
+            "aggregation" : self.__motion_sensor.get_aggregation(),
+            "quorum" : self.__motion_sensor.get_quorum(),
+            "sensors" : [sensor.get_stats() for sensor in self.__motion_sensor.get_sensors()],
+            "wakeups" : self.__motion_sensor.get_wakeups(),
+            "dropped_events" : self.__motion_sensor.get_dropped_events()
         })
 
 
     def on_set_motion_sensor(self):
         """
-        Sets the motion sensor's delay.
+        Sets the motion sensor's delay and optionally its line settings,
+        the sensors and how they are combined.
         """
         data = request.json
+
+        try:
+            policy = LinePolicy.from_dict(data["line"]) if "line" in data else None
+            sensors = None
+            if "sensors" in data:
+                if not isinstance(data["sensors"], list):
+                    raise MotionSensorException("Sensors have to be a list")
+                sensors = [Sensor.from_dict(sensor) for sensor in data["sensors"]]
+        except (LinePolicyException, MotionSensorException, TypeError) as ex:
+            return jsonify({"error": str(ex)}), 400
+
+        if policy is not None:
+            try:
+                self.__motion_sensor.set_policy(policy)
+            except OSError as ex:
+                return jsonify({"error": str(ex)}), 400
+
+            self.__config.set_motion_sensor_line(policy.to_dict())
+
+        if sensors is not None or "aggregation" in data or "quorum" in data:
+            aggregation = data.get("aggregation", self.__motion_sensor.get_aggregation())
+
+            # The sensors, aggregation and quorum are validated together
+            # before anything is applied.
+            try:
+                if sensors is not None:
+                    self.__motion_sensor.set_sensors(sensors, aggregation, data.get("quorum"))
+                else:
+                    self.__motion_sensor.set_aggregation(
+                        aggregation, data.get("quorum", self.__motion_sensor.get_quorum()))
+            except MotionSensorException as ex:
+                return jsonify({"error": str(ex)}), 400
+
+            self.__config.set_motion_sensors(
+                [sensor.to_dict() for sensor in self.__motion_sensor.get_sensors()])
+            self.__config.set_motion_sensor_aggregation(
+                self.__motion_sensor.get_aggregation(), self.__motion_sensor.get_quorum())
+
         self.__config.set_motion_sensor_delay(data["delay"])
+        self.__motion_sensor.set_delay(data["delay"])
 
+        # The line is released immediately, no reboot needed.
         if data["enabled"] is True:
+            try:
+                self.__motion_sensor.enable()
+            except MotionSensorException as ex:
+                return jsonify({"error": str(ex)}), 500
+
             self.__config.enable_motion_sensor()
         else:
             self.__config.disable_motion_sensor()
-
-        self.__system.reboot()
+            self.__motion_sensor.disable()
 
         return self.on_get_motion_sensor()
 
@@ -432,11 +929,22 @@ class App:
             '/log/webservice', view_func=self.on_get_log_webservice, methods=["GET"])
 
         app.add_url_rule(
-            '/display/screenshot.png', view_func=self.on_get_screenshot, methods=['GET'])
+            '/display/screenshot.png', view_func=self.on_get_screenshot, methods=['GET'],
+            defaults={"picture_format": "png"})
+        app.add_url_rule(
+            '/display/screenshot', view_func=self.on_get_screenshot, methods=['GET'])
+        app.add_url_rule(
+            '/display/screenshot/delta', view_func=self.on_get_screenshot_delta, methods=['GET'])
+        app.add_url_rule(
+            '/display/stream', view_func=self.on_get_stream, methods=['GET'])
         app.add_url_rule(
             '/display/on',  view_func=self.on_set_display_on, methods=['GET'])
         app.add_url_rule(
             '/display/off',  view_func=self.on_set_display_off, methods=['GET'])
+        app.add_url_rule(
+            '/display/watchdog',  view_func=self.on_get_watchdog, methods=['GET'])
+        app.add_url_rule(
+            '/display/watchdog',  view_func=self.on_set_watchdog, methods=['POST'])
         app.add_url_rule(
             '/display/screens',  view_func=self.on_get_screens, methods=['GET'])
         app.add_url_rule(
@@ -448,6 +956,24 @@ class App:
             '/browser',  view_func=self.on_get_browser, methods=['GET'])
         app.add_url_rule(
             '/browser',  view_func=self.on_set_browser, methods=['POST'])
+        app.add_url_rule(
+            '/browser/playlist',  view_func=self.on_get_playlist, methods=['GET'])
+        app.add_url_rule(
+            '/browser/playlist',  view_func=self.on_set_playlist, methods=['POST'])
+        app.add_url_rule(
+            '/browser/metrics',  view_func=self.on_get_browser_metrics, methods=['GET'])
+        app.add_url_rule(
+            '/browser/memory',  view_func=self.on_get_memory, methods=['GET'])
+        app.add_url_rule(
+            '/browser/memory',  view_func=self.on_set_memory, methods=['POST'])
+        app.add_url_rule(
+            '/browser/snapshot',  view_func=self.on_get_snapshot, methods=['GET'])
+        app.add_url_rule(
+            '/browser/snapshot',  view_func=self.on_set_snapshot, methods=['POST'])
+        app.add_url_rule(
+            '/browser/proxy',  view_func=self.on_get_proxy, methods=['GET'])
+        app.add_url_rule(
+            '/browser/proxy',  view_func=self.on_set_proxy, methods=['POST'])
 
         app.add_url_rule(
             '/cert', view_func=self.on_get_cert, methods=["GET"])
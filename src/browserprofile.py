@@ -0,0 +1,186 @@
+"""
+Chromium's performance related command line options.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List
+
+MAX_RENDERER_PROCESSES = 16
+MAX_DISK_CACHE_SIZE = 1024
+
+# Features which are of no use on a kiosk but cost memory or bandwidth.
+FEATURES = (
+    "Translate", "MediaRouter", "OptimizationHints", "AutofillServerCommunication",
+    "CertificateTransparencyComponentUpdater", "InterestFeedContentSuggestions",
+    "HardwareMediaKeyHandling", "DialMediaRouteProvider")
+
+FLAG_GPU_RASTERIZATION = "--enable-gpu-rasterization"
+FLAG_ZERO_COPY = "--enable-zero-copy"
+FLAG_DISK_CACHE_DIR = "--disk-cache-dir="
+FLAG_DISK_CACHE_SIZE = "--disk-cache-size="
+FLAG_RENDERER_PROCESS_LIMIT = "--renderer-process-limit="
+FLAG_DISABLE_FEATURES = "--disable-features="
+FLAGS_NO_THROTTLING = (
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows")
+
+# The flags end up unquoted on chromium's command line.
+REGEX_PATH = re.compile(r"^/[A-Za-z0-9._/-]+$")
+
+
+class BrowserProfileException(Exception):
+    """
+    Thrown in case an option is invalid.
+    """
+
+
+class BrowserProfile:
+    """
+    A validated set of performance options which is translated into
+    chromium command line flags.
+    """
+
+    def __init__(self, gpu_rasterization: bool = False, zero_copy: bool = False,
+                 disk_cache_dir: str = None, disk_cache_size: int = None,
+                 renderer_process_limit: int = None, background_throttling: bool = True,
+                 disabled_features: List[str] = None):
+
+        if disk_cache_dir is not None and not REGEX_PATH.match(str(disk_cache_dir)):
+            raise BrowserProfileException(f"Invalid disk cache directory {disk_cache_dir}")
+
+        if disk_cache_size is not None:
+            disk_cache_size = BrowserProfile.__parse_int(
+                "Disk cache size", disk_cache_size, 1, MAX_DISK_CACHE_SIZE)
+
+        if renderer_process_limit is not None:
+            renderer_process_limit = BrowserProfile.__parse_int(
+                "Renderer process limit", renderer_process_limit, 1, MAX_RENDERER_PROCESSES)
+
+        BrowserProfile.__check_bool("Gpu rasterization", gpu_rasterization)
+        BrowserProfile.__check_bool("Zero copy", zero_copy)
+        BrowserProfile.__check_bool("Background throttling", background_throttling)
+
+        if disabled_features is not None and not isinstance(disabled_features, list):
+            raise BrowserProfileException("Disabled features have to be a list")
+
+        disabled_features = list(disabled_features or [])
+        for feature in disabled_features:
+            if feature not in FEATURES:
+                raise BrowserProfileException(
+                    f"Unknown feature {feature}, expected one of {', '.join(FEATURES)}")
+
+        self.__gpu_rasterization = gpu_rasterization
+        self.__zero_copy = zero_copy
+        self.__disk_cache_dir = disk_cache_dir
+        self.__disk_cache_size = disk_cache_size
+        self.__renderer_process_limit = renderer_process_limit
+        self.__background_throttling = background_throttling
+        self.__disabled_features = disabled_features
+
+    @staticmethod
+    def __check_bool(name: str, value):
+        # A string like "false" would otherwise enable the option.
+        if not isinstance(value, bool):
+            raise BrowserProfileException(f"{name} has to be true or false")
+
+    @staticmethod
+    def __parse_int(name: str, value, minimum: int, maximum: int) -> int:
+        try:
+            value = int(value)
+        except (TypeError, ValueError) as ex:
+            raise BrowserProfileException(f"{name} has to be a number") from ex
+
+        if not minimum <= value <= maximum:
+            raise BrowserProfileException(f"{name} has to be between {minimum} and {maximum}")
+
+        return value
+
+    def to_flags(self) -> List[str]:
+        """
+        Returns the chromium command line flags.
+        """
+        flags = []
+
+        if self.__gpu_rasterization:
+            flags.append(FLAG_GPU_RASTERIZATION)
+
+        if self.__zero_copy:
+            flags.append(FLAG_ZERO_COPY)
+
+        if self.__disk_cache_dir is not None:
+            flags.append(f"{FLAG_DISK_CACHE_DIR}{self.__disk_cache_dir}")
+
+        if self.__disk_cache_size is not None:
+            flags.append(f"{FLAG_DISK_CACHE_SIZE}{self.__disk_cache_size * 1024 * 1024}")
+
+        if self.__renderer_process_limit is not None:
+            flags.append(f"{FLAG_RENDERER_PROCESS_LIMIT}{self.__renderer_process_limit}")
+
+        if not self.__background_throttling:
+            flags.extend(FLAGS_NO_THROTTLING)
+
+        if self.__disabled_features:
+            flags.append(f"{FLAG_DISABLE_FEATURES}{','.join(self.__disabled_features)}")
+
+        return flags
+
+    @staticmethod
+    def from_flags(flags: List[str]) -> BrowserProfile:
+        """
+        Parses the command line flags, unknown ones are ignored. Invalid
+        values raise a BrowserProfileException.
+        """
+        options = {"background_throttling": True}
+
+        for flag in flags:
+            if flag == FLAG_GPU_RASTERIZATION:
+                options["gpu_rasterization"] = True
+            elif flag == FLAG_ZERO_COPY:
+                options["zero_copy"] = True
+            elif flag.startswith(FLAG_DISK_CACHE_DIR):
+                options["disk_cache_dir"] = flag[len(FLAG_DISK_CACHE_DIR):]
+            elif flag.startswith(FLAG_DISK_CACHE_SIZE):
+                try:
+                    size = int(flag[len(FLAG_DISK_CACHE_SIZE):])
+                except ValueError as ex:
+                    raise BrowserProfileException(f"Invalid flag {flag}") from ex
+                options["disk_cache_size"] = size // 1024 // 1024
+            elif flag.startswith(FLAG_RENDERER_PROCESS_LIMIT):
+                options["renderer_process_limit"] = flag[len(FLAG_RENDERER_PROCESS_LIMIT):]
+            elif flag in FLAGS_NO_THROTTLING:
+                options["background_throttling"] = False
+            elif flag.startswith(FLAG_DISABLE_FEATURES):
+                options["disabled_features"] = flag[len(FLAG_DISABLE_FEATURES):].split(",")
+
+        return BrowserProfile(**options)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the options.
+        """
+        return {
+            "gpu_rasterization": self.__gpu_rasterization,
+            "zero_copy": self.__zero_copy,
+            "disk_cache_dir": self.__disk_cache_dir,
+            "disk_cache_size": self.__disk_cache_size,
+            "renderer_process_limit": self.__renderer_process_limit,
+            "background_throttling": self.__background_throttling,
+            "disabled_features": self.__disabled_features
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> BrowserProfile:
+        """
+        Deserializes and validates the options.
+        """
+        if not isinstance(data, dict):
+            raise BrowserProfileException("Profile has to be an object")
+
+        unknown = set(data) - set(BrowserProfile().to_dict())
+        if unknown:
+            raise BrowserProfileException(f"Unknown options {', '.join(sorted(unknown))}")
+
+        return BrowserProfile(**data)
@@ -0,0 +1,422 @@
+"""
+A minimal Chrome DevTools Protocol client.
+
+It implements just enough of the websocket protocol to talk to the
+browser's local debugging endpoint, so no extra dependency is needed.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import urllib.parse
+import urllib.request
+
+CDP_HOST = "127.0.0.1"
+CDP_PORT = 9222
+CDP_TIMEOUT = 5.0
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class CdpException(Exception):
+    """
+    Thrown in case the browser can not be reached or a command failed.
+    """
+
+
+class CdpCommandException(CdpException):
+    """
+    Thrown in case the browser rejected a command, the connection stays usable.
+    """
+
+
+class WebSocket:
+    """
+    A blocking websocket client, it supports unfragmented sends and
+    reassembles fragmented messages.
+    """
+
+    def __init__(self, url: str, timeout: float = CDP_TIMEOUT):
+        parsed = urllib.parse.urlparse(url)
+
+        if parsed.scheme != "ws":
+            raise CdpException(f"Unsupported websocket url {url}")
+
+        self.__socket = socket.create_connection(
+            (parsed.hostname, parsed.port or 80), timeout)
+
+        try:
+            self.__reader = self.__socket.makefile("rb")
+            self.__handshake(parsed.netloc, parsed.path or "/")
+        except Exception:
+            self.__socket.close()
+            raise
+
+    def __handshake(self, host: str, path: str):
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+
+        self.__socket.sendall((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n").encode("ascii"))
+
+        status = self.__reader.readline().decode("latin-1")
+        if " 101 " not in status:
+            raise CdpException(f"Websocket handshake failed: {status.strip()}")
+
+        headers = {}
+        while True:
+            line = self.__reader.readline().decode("latin-1").strip()
+            if not line:
+                break
+
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+
+        if headers.get("sec-websocket-accept") != accept:
+            raise CdpException("Websocket handshake failed: invalid accept key")
+
+    def set_timeout(self, timeout: float):
+        """
+        Sets the timeout for all blocking operations.
+        """
+        self.__socket.settimeout(timeout)
+
+    def __send_frame(self, opcode: int, payload: bytes):
+        length = len(payload)
+
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 0x10000:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+
+        # Clients have to mask every frame, xor-ing it as one big
+        # integer is way faster than a per byte loop.
+        mask = os.urandom(4)
+        repeated = (mask * (length // 4 + 1))[:length]
+        masked = (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(
+            length, "big")
+
+        self.__socket.sendall(header + mask + masked)
+
+    def __read(self, size: int) -> bytes:
+        data = self.__reader.read(size)
+        if data is None or len(data) < size:
+            raise CdpException("Websocket closed by the browser")
+
+        return data
+
+    def send(self, message: str):
+        """
+        Sends a text message.
+        """
+        self.__send_frame(OPCODE_TEXT, message.encode("utf-8"))
+
+    def receive(self) -> str:
+        """
+        Blocks until the next text message arrived.
+        """
+        fragments = []
+
+        while True:
+            first, second = self.__read(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+
+            if length == 126:
+                length = struct.unpack("!H", self.__read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self.__read(8))[0]
+
+            mask = self.__read(4) if second & 0x80 else None
+            payload = self.__read(length)
+
+            if mask:
+                repeated = (mask * (length // 4 + 1))[:length]
+                payload = (int.from_bytes(payload, "big")
+                           ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+            if opcode == OPCODE_PING:
+                self.__send_frame(OPCODE_PONG, payload)
+                continue
+
+            if opcode == OPCODE_PONG:
+                continue
+
+            if opcode == OPCODE_CLOSE:
+                raise CdpException("Websocket closed by the browser")
+
+            fragments.append(payload)
+
+            if first & 0x80:
+                return b"".join(fragments).decode("utf-8")
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        try:
+            self.__send_frame(OPCODE_CLOSE, b"")
+        except OSError:
+            pass
+
+        self.__reader.close()
+        self.__socket.close()
+
+
+class CdpConnection:
+    """
+    A devtools session attached to a single target, e.g. a page.
+    """
+
+    def __init__(self, url: str, timeout: float = CDP_TIMEOUT):
+        self.__socket = WebSocket(url, timeout)
+        self.__timeout = timeout
+        self.__id = 0
+        self.__listeners = {}
+
+    def add_listener(self, method: str, callback):
+        """
+        Registers a callback for an event. Events are dispatched
+        while a command waits for its response.
+        """
+        self.__listeners.setdefault(method, []).append(callback)
+
+    def call(self, method: str, params: dict = None, timeout: float = None) -> dict:
+        """
+        Sends a command and waits for its result.
+        """
+        self.__id += 1
+        identifier = self.__id
+
+        self.__socket.set_timeout(self.__timeout if timeout is None else timeout)
+        self.__socket.send(json.dumps(
+            {"id": identifier, "method": method, "params": params or {}}))
+
+        while True:
+            message = json.loads(self.__socket.receive())
+
+            if message.get("id") != identifier:
+                for callback in self.__listeners.get(message.get("method"), []):
+                    callback(message.get("params", {}))
+                continue
+
+            if "error" in message:
+                raise CdpCommandException(
+                    f"{method} failed: {message['error'].get('message')}")
+
+            return message.get("result", {})
+
+    def close(self):
+        """
+        Closes the session.
+        """
+        self.__socket.close()
+
+
+class CdpClient:
+    """
+    Talks to the browser's remote debugging endpoint.
+
+    The connections are opened on demand and reopened in case the
+    browser was restarted. Page commands go to the kiosk's page,
+    which is the first page unless another one was swapped in.
+    """
+
+    def __init__(self, host: str = CDP_HOST, port: int = CDP_PORT,
+                 timeout: float = CDP_TIMEOUT):
+        self.__host = host
+        self.__port = port
+        self.__timeout = timeout
+        self.__lock = threading.RLock()
+        self.__connection = None
+        self.__browser = None
+        self.__page_id = None
+        self.__session_listeners = []
+
+    def get_lock(self) -> threading.RLock:
+        """
+        Every user of the page connection has to hold this lock.
+        """
+        return self.__lock
+
+    def add_session_listener(self, callback):
+        """
+        Registers a callback which is called with the connection each
+        time a new devtools session to a page was opened.
+        """
+        self.__session_listeners.append(callback)
+
+    def __request(self, path: str, method: str = "GET"):
+        url = f"http://{self.__host}:{self.__port}{path}"
+
+        try:
+            with urllib.request.urlopen(
+                    urllib.request.Request(url, method=method), timeout=self.__timeout) as f:
+                return json.loads(f.read().decode("utf-8"))
+        except (OSError, ValueError) as ex:
+            raise CdpException(f"Browser not reachable: {ex}") from ex
+
+    def get_version(self) -> dict:
+        """
+        Returns the browser's version information.
+        """
+        return self.__request("/json/version")
+
+    def get_targets(self) -> list:
+        """
+        Returns all targets, e.g. pages, workers and extensions.
+        """
+        return self.__request("/json/list")
+
+    def get_page(self) -> dict:
+        """
+        Returns the kiosk's page target.
+        """
+        pages = [target for target in self.get_targets() if target.get("type") == "page"]
+
+        for page in pages:
+            if page.get("id") == self.__page_id:
+                return page
+
+        if not pages:
+            raise CdpException("Browser has no page")
+
+        return pages[0]
+
+    def is_alive(self) -> bool:
+        """
+        Checks if the browser answers on its debugging port.
+        """
+        try:
+            self.get_version()
+        except CdpException:
+            return False
+
+        return True
+
+    def __run(self, method: str, func):
+        """
+        Runs the function and drops all connections in case the
+        browser did not answer properly.
+        """
+        with self.__lock:
+            try:
+                return func()
+
+            except CdpCommandException:
+                raise
+
+            except (OSError, ValueError, KeyError) as ex:
+                self.close()
+                raise CdpException(f"{method} failed: {ex}") from ex
+
+            except CdpException:
+                self.close()
+                raise
+
+    def open_page(self, target_id: str) -> CdpConnection:
+        """
+        Opens a new session to the given page target. The session
+        listeners are called before it is returned.
+        """
+        def open_session():
+            for target in self.get_targets():
+                if target.get("id") != target_id:
+                    continue
+
+                connection = CdpConnection(target["webSocketDebuggerUrl"], self.__timeout)
+                try:
+                    for callback in self.__session_listeners:
+                        callback(connection)
+                except Exception:
+                    connection.close()
+                    raise
+
+                return connection
+
+            raise CdpException(f"No target {target_id}")
+
+        return self.__run("open", open_session)
+
+    def get_page_id(self) -> str:
+        """
+        Returns the target id of the kiosk's page.
+        """
+        return self.__run("get_page_id", lambda: self.get_page()["id"])
+
+    def set_page(self, target_id: str, connection: CdpConnection = None):
+        """
+        Makes the given target the kiosk's page, e.g. after a preloaded
+        page was swapped in. The connection is reused if given.
+        """
+        with self.__lock:
+            if self.__connection is not None and self.__connection is not connection:
+                self.__connection.close()
+
+            self.__page_id = target_id
+            self.__connection = connection
+
+    def call(self, method: str, params: dict = None, timeout: float = None) -> dict:
+        """
+        Sends a command to the kiosk's page and returns the result.
+        """
+        def call_page():
+            if self.__connection is None:
+                page = self.get_page()
+                self.__connection = self.open_page(page["id"])
+                self.__page_id = page["id"]
+
+            return self.__connection.call(method, params, timeout)
+
+        return self.__run(method, call_page)
+
+    def call_browser(self, method: str, params: dict = None, timeout: float = None) -> dict:
+        """
+        Sends a command to the browser itself, e.g. to manage targets.
+        """
+        def call_browser():
+            if self.__browser is None:
+                self.__browser = CdpConnection(
+                    self.get_version()["webSocketDebuggerUrl"], self.__timeout)
+
+            return self.__browser.call(method, params, timeout)
+
+        return self.__run(method, call_browser)
+
+    def close(self):
+        """
+        Closes all connections.
+        """
+        with self.__lock:
+            for connection in (self.__connection, self.__browser):
+                if connection is None:
+                    continue
+
+                try:
+                    connection.close()
+                except OSError:
+                    pass
+
+            self.__connection = None
+            self.__browser = None
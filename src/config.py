@@ -9,6 +9,18 @@ import subprocess
 import uuid
 
 DEFAULT_SENSOR_DELAY = 30
+DEFAULT_SCREENSHOT_TTL = 2.0
+DEFAULT_STREAM_FPS = 2.0
+DEFAULT_STREAM_SCALE = 25
+DEFAULT_STREAM_QUALITY = 70
+DEFAULT_PROXY_PORT = 8081
+DEFAULT_PROXY_CACHE_SIZE = 256
+DEFAULT_SNAPSHOT_INTERVAL = 15 * 60
+DEFAULT_METRICS_INTERVAL = 10.0
+DEFAULT_MEMORY_PRESSURE = 10.0
+DEFAULT_MEMORY_QUIET_WAIT = 30 * 60
+# How long the content may stay unchanged before the watchdog reacts.
+DEFAULT_FREEZE_TIMEOUT = 10 * 60
 
 class ConfigException(Exception):
     """
@@ -112,6 +124,209 @@ class Config():
         """
         self.set_config_value("motionsensor.json", "delay", delay)
 
+    def get_motion_sensor_line(self) -> dict:
+        """
+        Gets the motion sensor's line settings like bias and debounce.
+        """
+        return self.get_config_value("motionsensor.json", "line", {})
+
+    def set_motion_sensor_line(self, line: dict):
+        """
+        Sets the motion sensor's line settings.
+        """
+        self.set_config_value("motionsensor.json", "line", line)
+
+    def get_motion_sensors(self) -> list:
+        """
+        Gets the motion sensors' settings, empty in case the default sensor is used.
+        """
+        return self.get_config_value("motionsensor.json", "sensors", [])
+
+    def set_motion_sensors(self, sensors: list):
+        """
+        Sets the motion sensors' settings.
+        """
+        self.set_config_value("motionsensor.json", "sensors", sensors)
+
+    def get_motion_sensor_aggregation(self) -> str:
+        """
+        Gets how the motion sensors are combined, either any or quorum.
+        """
+        return self.get_config_value("motionsensor.json", "aggregation", "any")
+
+    def get_motion_sensor_quorum(self) -> int:
+        """
+        Gets how many motion sensors need to be active in quorum mode.
+        """
+        return self.get_config_value("motionsensor.json", "quorum", 1)
+
+    def set_motion_sensor_aggregation(self, aggregation: str, quorum: int):
+        """
+        Sets how the motion sensors are combined.
+        """
+        self.set_config_value("motionsensor.json", "aggregation", aggregation)
+        self.set_config_value("motionsensor.json", "quorum", quorum)
+
+    def get_screenshot_ttl(self) -> float:
+        """
+        Gets the time in seconds a screenshot is cached.
+        """
+        return self.get_config_value("screenshot.json", "ttl", DEFAULT_SCREENSHOT_TTL)
+
+    def set_screenshot_ttl(self, ttl:float):
+        """
+        Sets the time in seconds a screenshot is cached.
+        """
+        self.set_config_value("screenshot.json", "ttl", ttl)
+
+    def get_stream_fps(self) -> float:
+        """
+        Gets the live view's frame rate.
+        """
+        return self.get_config_value("screenshot.json", "stream_fps", DEFAULT_STREAM_FPS)
+
+    def get_stream_scale(self) -> int:
+        """
+        Gets the live view's scale in percent.
+        """
+        return self.get_config_value("screenshot.json", "stream_scale", DEFAULT_STREAM_SCALE)
+
+    def get_stream_quality(self) -> int:
+        """
+        Gets the live view's jpeg quality.
+        """
+        return self.get_config_value("screenshot.json", "stream_quality", DEFAULT_STREAM_QUALITY)
+
+    def is_playlist_enabled(self) -> bool:
+        """
+        Checks if the browser rotates through the playlist instead of showing the homepage.
+        """
+        return self.get_config_value("playlist.json", "enabled", False)
+
+    def get_playlist(self) -> list:
+        """
+        Gets the playlist's items.
+        """
+        return self.get_config_value("playlist.json", "items", [])
+
+    def set_playlist(self, enabled: bool, items: list):
+        """
+        Sets the playlist's items and whether it is played.
+        """
+        self.write_config("playlist.json", {"enabled": enabled, "items": items})
+
+    def is_proxy_enabled(self) -> bool:
+        """
+        Checks if the browser loads its content through the caching proxy.
+        """
+        return self.get_config_value("proxy.json", "enabled", False)
+
+    def get_proxy_upstream(self) -> str:
+        """
+        Gets the proxied origin, None means the homepage's origin.
+        """
+        return self.get_config_value("proxy.json", "upstream", None)
+
+    def get_proxy_port(self) -> int:
+        """
+        Gets the local port the proxy listens on.
+        """
+        return self.get_config_value("proxy.json", "port", DEFAULT_PROXY_PORT)
+
+    def get_proxy_cache_size(self) -> int:
+        """
+        Gets the proxy's cache size in megabytes.
+        """
+        return self.get_config_value("proxy.json", "cache_size", DEFAULT_PROXY_CACHE_SIZE)
+
+    def set_proxy(self, enabled: bool, upstream: str, cache_size: int):
+        """
+        Sets the proxy configuration.
+        """
+        config = self.read_config("proxy.json", {})
+        config.update({"enabled": enabled, "upstream": upstream, "cache_size": cache_size})
+        self.write_config("proxy.json", config)
+
+    def is_snapshot_enabled(self) -> bool:
+        """
+        Checks if a snapshot of the homepage is shown while it is unreachable.
+        """
+        return self.get_config_value("snapshot.json", "enabled", False)
+
+    def get_snapshot_interval(self) -> float:
+        """
+        Gets the seconds between two snapshots.
+        """
+        return self.get_config_value("snapshot.json", "interval", DEFAULT_SNAPSHOT_INTERVAL)
+
+    def set_snapshot(self, enabled: bool, interval: float):
+        """
+        Sets the snapshot configuration.
+        """
+        self.write_config("snapshot.json", {"enabled": enabled, "interval": interval})
+
+    def is_browser_metrics_enabled(self) -> bool:
+        """
+        Checks if the browser's performance metrics are sampled.
+        """
+        return self.get_config_value("metrics.json", "enabled", False)
+
+    def get_browser_metrics_interval(self) -> float:
+        """
+        Gets the seconds between two performance samples.
+        """
+        return self.get_config_value("metrics.json", "interval", DEFAULT_METRICS_INTERVAL)
+
+    def is_memory_governor_enabled(self) -> bool:
+        """
+        Checks if the browser is recycled once it uses too much memory.
+        """
+        return self.get_config_value("memory.json", "enabled", False)
+
+    def get_memory_limit(self) -> int:
+        """
+        Gets the browser's memory limit in megabytes, None means half of the system's memory.
+        """
+        return self.get_config_value("memory.json", "limit", None)
+
+    def get_memory_pressure_limit(self) -> float:
+        """
+        Gets the memory pressure in percent which recycles a browser over
+        its limit right away.
+        """
+        return self.get_config_value("memory.json", "pressure", DEFAULT_MEMORY_PRESSURE)
+
+    def get_memory_quiet_wait(self) -> float:
+        """
+        Gets the seconds a recycle waits for the display to be switched off.
+        """
+        return self.get_config_value("memory.json", "quiet_wait", DEFAULT_MEMORY_QUIET_WAIT)
+
+    def set_memory_governor(self, enabled: bool, limit: int, pressure: float, quiet_wait: float):
+        """
+        Sets the memory governor's configuration.
+        """
+        self.write_config("memory.json", {
+            "enabled": enabled, "limit": limit, "pressure": pressure, "quiet_wait": quiet_wait})
+
+    def is_watchdog_enabled(self) -> bool:
+        """
+        Checks if a frozen screen is detected and recovered.
+        """
+        return self.get_config_value("watchdog.json", "enabled", False)
+
+    def get_watchdog_timeout(self) -> float:
+        """
+        Gets the seconds the screen may stay unchanged.
+        """
+        return self.get_config_value("watchdog.json", "timeout", DEFAULT_FREEZE_TIMEOUT)
+
+    def set_watchdog(self, enabled: bool, timeout: float):
+        """
+        Sets the frozen screen watchdog's configuration.
+        """
+        self.write_config("watchdog.json", {"enabled": enabled, "timeout": timeout})
+
     def hash_password(self, password:str) -> str:
         """
         Secures the salted password with a sha256 hash
@@ -0,0 +1,248 @@
+"""
+Detects which parts of the screen changed between two captures.
+
+Frames are split into square tiles, each tile is reduced to a 64 bit hash.
+Comparing the hashes of two frames yields the damaged tiles, so that only
+those need to be encoded and transferred.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_TILE_SIZE = 32
+DEFAULT_HISTORY = 32
+DEFAULT_KEYFRAME_RATIO = 0.5
+
+
+class DamageException(Exception):
+    """
+    Thrown in case the damage could not be tracked.
+    """
+
+
+class TileHasher:
+    """
+    Hashes all tiles of a RGB frame at once.
+
+    Each byte of a tile is multiplied with a fixed random odd 64 bit weight
+    and the products are summed up modulo 2^64. A change of a single byte
+    always alters the hash.
+    """
+
+    def __init__(self, tile_size: int = DEFAULT_TILE_SIZE):
+        if numpy is None:
+            raise DamageException("numpy is not installed")
+
+        self.__tile_size = tile_size
+
+        rng = numpy.random.default_rng(0x4b494f534b)
+        self.__weights = rng.integers(
+            0, 1 << 63, (tile_size, tile_size * 3), dtype=numpy.uint64) * 2 + 1
+
+    def get_tile_size(self) -> int:
+        """
+        Returns the tile's edge length in pixels.
+        """
+        return self.__tile_size
+
+    def get_grid(self, frame) -> tuple:
+        """
+        Returns the number of tile rows and columns for the frame.
+        Incomplete tiles at the border count as full tiles.
+        """
+        size = self.__tile_size
+        return (-(-frame.shape[0] // size), -(-frame.shape[1] // size))
+
+    def hash(self, frame):
+        """
+        Returns a matrix with one hash per tile.
+        """
+        size = self.__tile_size
+        rows, columns = self.get_grid(frame)
+
+        # Pad the frame so that the border tiles are complete.
+        padded = numpy.zeros((rows * size, columns * size, 3), dtype=numpy.uint8)
+        padded[:frame.shape[0], :frame.shape[1]] = frame
+
+        tiles = padded.reshape(rows, size, columns, size * 3).astype(numpy.uint64)
+        tiles *= self.__weights[None, :, None, :]
+
+        return tiles.sum(axis=(1, 3), dtype=numpy.uint64)
+
+
+class DamageRegion:
+    """
+    A rectangular area of a frame in pixels.
+    """
+
+    def __init__(self, x: int, y: int, width: int, height: int):
+        self.__x = x
+        self.__y = y
+        self.__width = width
+        self.__height = height
+
+    def get_x(self) -> int:
+        """
+        Gets the left edge.
+        """
+        return self.__x
+
+    def get_y(self) -> int:
+        """
+        Gets the top edge.
+        """
+        return self.__y
+
+    def get_width(self) -> int:
+        """
+        Gets the width.
+        """
+        return self.__width
+
+    def get_height(self) -> int:
+        """
+        Gets the height.
+        """
+        return self.__height
+
+    def crop(self, frame):
+        """
+        Returns the region's pixels.
+        """
+        return frame[self.__y:self.__y + self.__height, self.__x:self.__x + self.__width]
+
+
+class DamageTracker:
+    """
+    Remembers the tile hashes of the most recent frames and computes which
+    regions changed since a given frame.
+    """
+
+    def __init__(self, hasher: TileHasher = None, history: int = DEFAULT_HISTORY,
+                 keyframe_ratio: float = DEFAULT_KEYFRAME_RATIO):
+        if hasher is None:
+            hasher = TileHasher()
+
+        self.__hasher = hasher
+        self.__history = history
+        self.__keyframe_ratio = keyframe_ratio
+        self.__lock = threading.Lock()
+        self.__hashes = OrderedDict()
+
+        # Start with the current time, so that frame ids from a previous
+        # run are unlikely to be mistaken for ids of this run.
+        self.__frame_id = int(time.time() * 1000)
+
+    def track(self, frame, since: int = None) -> tuple:
+        """
+        Records the frame and returns its id, the frame itself and the
+        regions which changed since the given frame. An identical frame
+        keeps the previous id. The regions are None in case a keyframe
+        needs to be sent, because the frame is unknown or too much of the
+        screen changed.
+
+        Recording and looking up the damage happen under one lock, so a
+        concurrent call can not slip in between.
+        """
+        hashes = self.__hasher.hash(frame)
+
+        with self.__lock:
+            latest = self.__hashes.get(self.__frame_id)
+            if latest is None or latest.shape != hashes.shape or (latest != hashes).any():
+                self.__frame_id += 1
+                self.__hashes[self.__frame_id] = hashes
+
+                while len(self.__hashes) > self.__history:
+                    self.__hashes.popitem(last=False)
+
+            frame_id = self.__frame_id
+            current = self.__hashes[frame_id]
+            previous = self.__hashes.get(since)
+
+        return self.__get_regions(frame_id, frame, current, previous)
+
+    def __get_regions(self, frame_id: int, frame, current, previous) -> tuple:
+        if previous is None or previous.shape != current.shape:
+            return frame_id, frame, None
+
+        changed = previous != current
+
+        if changed.mean() > self.__keyframe_ratio:
+            return frame_id, frame, None
+
+        size = self.__hasher.get_tile_size()
+        height, width = frame.shape[:2]
+
+        regions = []
+        for row, column, length in self.__get_runs(changed):
+            x = column * size
+            y = row * size
+            regions.append(DamageRegion(
+                x, y, min(length * size, width - x), min(size, height - y)))
+
+        return frame_id, frame, regions
+
+    def __get_runs(self, changed):
+        """
+        Merges horizontally adjacent damaged tiles into runs,
+        it yields the row, the start column and the run's length.
+        """
+        for row in range(changed.shape[0]):
+            columns = numpy.flatnonzero(changed[row])
+            if not len(columns):
+                continue
+
+            # Split wherever the next damaged tile is not adjacent.
+            breaks = numpy.flatnonzero(numpy.diff(columns) != 1) + 1
+            for run in numpy.split(columns, breaks):
+                yield row, int(run[0]), len(run)
+
+
+class ScreenshotDelta:
+    """
+    The encoded tiles which changed since a previous frame.
+    """
+
+    def __init__(self, frame_id: int, keyframe: bool, width: int, height: int, tiles: list):
+        self.__frame_id = frame_id
+        self.__keyframe = keyframe
+        self.__width = width
+        self.__height = height
+        self.__tiles = tiles
+
+    def get_frame_id(self) -> int:
+        """
+        Gets the id which the client passes as since on its next request.
+        It is None in case damage tracking is not available.
+        """
+        return self.__frame_id
+
+    def is_keyframe(self) -> bool:
+        """
+        Checks if the delta contains the complete frame.
+        """
+        return self.__keyframe
+
+    def get_width(self) -> int:
+        """
+        Gets the frame's width.
+        """
+        return self.__width
+
+    def get_height(self) -> int:
+        """
+        Gets the frame's height.
+        """
+        return self.__height
+
+    def get_tiles(self) -> list:
+        """
+        Returns a list of region and encoded image tuples.
+        """
+        return self.__tiles
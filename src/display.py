@@ -5,30 +5,52 @@ in explicit the the X11 session as well as the browser.
 
 from __future__ import annotations
 
-import shutil
+from collections import OrderedDict
+import logging
 import subprocess
 import pathlib
 import re
+import threading
+import time
 from typing import List
 
+from src.browserprofile import BrowserProfile, BrowserProfileException
+from src.cdp import CdpClient, CdpException
+from src.damage import DamageException, DamageRegion, DamageTracker, ScreenshotDelta
+from src.screenshot import (
+    ScreenCapture, ScreenCaptureException, ScreenshotCache, ScreenshotOptions, encode)
+from src.dpms import DisplayPower
+from src.hotplug import HotplugListener
+from src.reload import (
+    RELOAD_BROWSER, RELOAD_TIMEOUT, RESTART_BROWSER, RESTART_DISPLAY, ReloadHandle,
+    ReloadScheduler)
+from src.xlib import XlibException
+from src.screenconfig import ScreenConfig, ScreenConfigStore
 from src.sed import SingleLineEditor
+from src.topology import DisplayTopology
+from src.worker.proxy import CachingProxyWorker
 
 CONFIG_BROWSER = pathlib.Path("/etc/kiosk/browser.conf")
-CONFIG_XINITRC_SCREENS = pathlib.Path("/etc/kiosk/screens.d")
 CONFIG_WM_SERVICE_FILE = "kiosk-windowmanager.service"
-
-CMD_SET_SCREEN = "xrandr --output"
+CONFIG_BROWSER_SERVICE_FILE = "kiosk-browser.service"
 
 CMD_GET_SCREENS = "xrandr --display :0 --query --verbose"
-REGEX_GET_SCREEN_PROPERTIES =  r"^(?P<name>\S+) (connected|disconnected) \S+( \S+)?( (\d+)x(\d+)\S+ \S+ (\S+))?"
+CMD_APPLY_SCREENS = ["xrandr", "--display", ":0"]
+
+# How long to wait for the X server to report a new screen configuration.
+SCREEN_APPLY_TIMEOUT = 5.0
+SCREEN_RESTART_TIMEOUT = 30.0
+SCREEN_POLL_INTERVAL = 0.1
+
+# How long a freshly started chromium may take until it answers on its
+# debugging port, before the homepage is routed through the proxy.
+BROWSER_START_TIMEOUT = 30.0
+BROWSER_POLL_INTERVAL = 1.0
+
+# Every screenshot variant has its own damage history, the least recently
+# used one is dropped beyond this count.
+MAX_DAMAGE_TRACKERS = 4
 
-CMD_DISPLAY = "DISPLAY=:0"
-CMD_DISPLAY_STATUS = "xset -q"
-CMD_DISPLAY_FORCE_ON = "xset dpms force on"
-CMD_DISPLAY_FORCE_OFF = "xset dpms force off"
-CMD_DISPLAY_SCREENSAVER_OFF = "xset s off"
-CMD_DISPLAY_SCREENSAVER_BLANK_OFF = "xset s noblank"
-CMD_DISPLAY_POWER_MANAGEMENT_OFF = "xset -dpms"
 
 class DisplayException(Exception):
     """
@@ -40,11 +62,15 @@ class Screen():
     Represents a physical screen or monitor which is associated to a display.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, store: ScreenConfigStore = None):
         if not re.match("^[A-Za-z0-9_-]*$", name):
             raise DisplayException(f"Invalid screen name {name}")
 
+        if store is None:
+            store = ScreenConfigStore()
+
         self.__name = name
+        self.__store = store
         self.__status = "unknown"
         self.__primary = False
         self.__x_resolution = 0
@@ -56,29 +82,28 @@ class Screen():
         Loads the current configuration.
         """
 
-        pattern =  (f"^{self.__name}"
-            " (?P<status>disconnected|connected)"
-            "( (?P<primary>primary))?"
-            "( (?P<x_resolution>\\d+)x(?P<y_resolution>\\d+)\\S+ \\S+ (?P<orientation>\\S+))?")
-
         if not xrandr_data:
             xrandr_data = subprocess.run(
                 CMD_GET_SCREENS, shell=True,
                 capture_output=True, text=True, check=True).stdout
 
-        match = re.search(pattern, xrandr_data.strip(), re.MULTILINE)
+        return self.load_topology(DisplayTopology.parse(xrandr_data))
 
-        if not match:
-            raise DisplayException(f"No screen {self.__name} found")
+    def load_topology(self, topology: DisplayTopology) -> Screen:
+        """
+        Loads the configuration from a topology snapshot.
+        """
 
-        self.__status = match.group('status')
-        self.__primary = match.group('primary')
-        self.__x_resolution = match.group('x_resolution')
-        self.__y_resolution = match.group('y_resolution')
-        self.__orientation = match.group("orientation")
+        output = topology.get_output(self.__name)
+
+        if not output:
+            raise DisplayException(f"No screen {self.__name} found")
 
-        if self.__orientation is None:
-            self.__orientation = "normal"
+        self.__status = output.get_status()
+        self.__primary = output.is_primary()
+        self.__x_resolution = output.get_width()
+        self.__y_resolution = output.get_height()
+        self.__orientation = output.get_rotation()
 
         return self
 
@@ -131,17 +156,11 @@ class Screen():
         xrandr.
         """
 
-        sed = SingleLineEditor(CONFIG_XINITRC_SCREENS / self.__name)
-
-        line = sed.get_line(f"{CMD_SET_SCREEN} {self.__name}")
-        if not line:
+        config = self.__store.get(self.__name)
+        if not config:
             return self.__primary
 
-        match = re.search(r"--primary", line)
-        if match:
-            return False
-
-        return True
+        return config.is_primary()
 
     def get_orientation(self) -> str:
         """
@@ -149,44 +168,29 @@ class Screen():
         in case this fails it falls back to the information from xrandr.
         """
 
-        sed = SingleLineEditor(CONFIG_XINITRC_SCREENS / self.__name)
-
-        line = sed.get_line(f"{CMD_SET_SCREEN} {self.__name}")
-        if not line:
+        config = self.__store.get(self.__name)
+        if not config or not config.get_rotation():
             return self.__orientation
 
-        match = re.search(r"--rotate\s+(?P<orientation>\S+)", line)
-        if not match:
-            return self.__orientation
-
-        return match.group("orientation")
+        return config.get_rotation()
 
     def is_enabled(self):
         """
         Checks if the screens output is enabled.
         """
-        sed = SingleLineEditor(CONFIG_XINITRC_SCREENS / self.__name)
 
-        line = sed.get_line(f"{CMD_SET_SCREEN} {self.__name}")
-        if not line:
+        config = self.__store.get(self.__name)
+        if not config:
             return self.__primary
 
-        match = re.search(r"--off", line)
-        if not match:
-            return True
-
-        return False
+        return not config.is_off()
 
     def disable(self):
         """
         Disables the screen.
         """
 
-        with (CONFIG_XINITRC_SCREENS / self.__name).open("w+") as f:
-            f.write("#!/bin/sh\n")
-            f.write(CMD_SET_SCREEN + f" {self.__name} --off\n")
-
-        (CONFIG_XINITRC_SCREENS / self.__name).chmod(0o775)
+        self.__store.set(ScreenConfig(self.__name, off=True))
 
     def enable(self, orientation:str  = None):
         """
@@ -196,19 +200,31 @@ class Screen():
         if orientation is None:
             orientation = self.get_orientation()
 
-        with (CONFIG_XINITRC_SCREENS / self.__name).open("w+") as f:
-            f.write("#!/bin/sh\n")
-            f.write(CMD_SET_SCREEN + f" {self.__name} --rotate {orientation} --primary\n")
-
-        (CONFIG_XINITRC_SCREENS / self.__name).chmod(0o775)
+        self.__store.set(ScreenConfig(self.__name, orientation, primary=True))
 
 class Browser:
     """
     Configures the Chromium browser.
+
+    The browser is controlled via the devtools protocol, so that url
+    changes are applied to the running instance. It is only restarted
+    in case it does not respond or its command line changed.
     """
 
-    def __init__(self):
+    def __init__(self, screenshots: ScreenshotCache = None, cdp: CdpClient = None,
+                 reloads: ReloadScheduler = None):
+        if cdp is None:
+            cdp = CdpClient()
+
+        if reloads is None:
+            reloads = ReloadScheduler()
+
         self.__browser_config = SingleLineEditor(CONFIG_BROWSER)
+        self.__screenshots = screenshots
+        self.__cdp = cdp
+        self.__reloads = reloads
+        self.__proxy = None
+        self.__restart_required = False
 
     def get_url(self) -> str:
         """
@@ -223,6 +239,52 @@ class Browser:
         self.__browser_config.update_line(
             "KIOSK_HOME=", f'KIOSK_HOME={url}')
 
+    def set_proxy(self, proxy: CachingProxyWorker) -> ReloadHandle:
+        """
+        Routes the homepage through the caching proxy, None loads it directly.
+
+        Chromium always starts with the homepage, the proxy is only used
+        by navigating the running browser. So a proxy which fails to come
+        up never leaves the kiosk blank.
+        """
+        self.__proxy = proxy
+
+        if proxy is None:
+            return None
+
+        return self.__reloads.request(RELOAD_BROWSER, self.__open_start_url)
+
+    def get_start_url(self) -> str:
+        """
+        Gets the url chromium actually loads, it points to the proxy in
+        case the homepage is served through it.
+        """
+        url = self.get_url()
+
+        if self.__proxy is not None:
+            return self.__proxy.rewrite(url)
+
+        return url
+
+    def __open_start_url(self):
+        """
+        Waits until chromium answers and navigates it to the start url.
+        A browser which does not come up is left alone.
+        """
+        deadline = time.monotonic() + BROWSER_START_TIMEOUT
+        while not self.__cdp.is_alive():
+            if time.monotonic() >= deadline:
+                logging.getLogger('flask.app').warning(
+                    "Browser did not start, not routing it through the proxy")
+                return
+
+            time.sleep(BROWSER_POLL_INTERVAL)
+
+        url = self.get_start_url()
+        with self.__cdp.get_lock():
+            if self.__cdp.get_page().get("url") != url:
+                self.navigate(url)
+
     def get_scale(self) -> float:
         """
         Gets the current scale factor.
@@ -231,16 +293,116 @@ class Browser:
 
     def set_scale_factor(self, scale :str):
         """
-        Sets the scale factor for high density displays.
+        Sets the scale factor for high density displays. It is passed
+        on the command line, so it is applied by restarting chromium on
+        the next reload.
         """
+        line = self.__browser_config.get_line("KIOSK_SCALE_FACTOR=")
+        if line is not None and line[19:].strip() == str(scale).strip():
+            return
+
         self.__browser_config.update_line(
             "KIOSK_SCALE_FACTOR=", f'KIOSK_SCALE_FACTOR={scale}')
+        self.__restart_required = True
+
+    def get_profile(self) -> BrowserProfile:
+        """
+        Gets the performance options chromium is started with.
+        """
+        line = self.__browser_config.get_line("KIOSK_FLAGS=")
+        if line is None:
+            return BrowserProfile()
+
+        try:
+            return BrowserProfile.from_flags(line[12:].split())
+        except BrowserProfileException as ex:
+            logging.getLogger('flask.app').warning(
+                "Ignoring invalid browser flags %s: %s", line[12:].strip(), ex)
+            return BrowserProfile()
+
+    def set_profile(self, profile: BrowserProfile):
+        """
+        Sets the performance options, they are applied by restarting
+        chromium on the next reload.
+        """
+        if profile.to_flags() == self.get_profile().to_flags():
+            return
+
+        self.__browser_config.set_line(
+            "KIOSK_FLAGS=", f'KIOSK_FLAGS={" ".join(profile.to_flags())}')
+        self.__restart_required = True
+
+    def get_cdp(self) -> CdpClient:
+        """
+        Returns the devtools client for the kiosk's page.
+        """
+        return self.__cdp
+
+    def navigate(self, url: str):
+        """
+        Loads the url in the running browser.
+        """
+        result = self.__cdp.call("Page.navigate", {"url": url})
+
+        if result.get("errorText"):
+            logging.getLogger('flask.app').warning(
+                "Failed to navigate to %s: %s", url, result["errorText"])
+
+    def __soft_reload(self):
+        """
+        Applies the url to the running browser and reloads the page.
+        """
+        with self.__cdp.get_lock():
+            url = self.get_start_url()
+            if self.__cdp.get_page().get("url") != url:
+                self.navigate(url)
+                return
 
-    def reload(self):
+            self.__cdp.call("Page.reload", {"ignoreCache": False})
+
+    def reload(self) -> ReloadHandle:
+        """
+        Reloads the page in the running browser, in case the browser
+        does not respond it is restarted. The reload is scheduled, the
+        returned handle tells when it is done.
+        """
+        return self.__reloads.request(RELOAD_BROWSER, self.__reload)
+
+    def __reload(self):
+        if self.__screenshots:
+            self.__screenshots.invalidate()
+
+        # Command line flags only apply to a new chromium process.
+        if self.__restart_required:
+            self.__restart()
+            return
+
+        try:
+            self.__soft_reload()
+            return
+        except CdpException as ex:
+            logging.getLogger('flask.app').warning(
+                "Browser not responding, restarting it: %s", ex)
+
+        self.__restart()
+
+    def restart(self) -> ReloadHandle:
         """
-        Restarts the browser.
+        Schedules a restart of the browser.
         """
-        subprocess.run("systemctl restart kiosk-browser.service", shell=True, check=True)
+        return self.__reloads.request(RESTART_BROWSER, self.__restart)
+
+    def __restart(self):
+        if self.__screenshots:
+            self.__screenshots.invalidate()
+
+        self.__cdp.close()
+        subprocess.run(f"systemctl restart {CONFIG_BROWSER_SERVICE_FILE}", shell=True, check=True)
+        self.__restart_required = False
+
+        # The restarted chromium loads the homepage directly.
+        if self.__proxy is not None:
+            self.__open_start_url()
 
 class Display:
     """
@@ -249,118 +411,342 @@ class Display:
     A display is associated with zero or more screens.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, capture: ScreenCapture = None, screenshots: ScreenshotCache = None,
+                 power: DisplayPower = None, screen_configs: ScreenConfigStore = None,
+                 reloads: ReloadScheduler = None):
+        if capture is None:
+            capture = ScreenCapture()
+
+        if reloads is None:
+            reloads = ReloadScheduler()
+
+        if power is None:
+            power = DisplayPower()
+
+        if screen_configs is None:
+            screen_configs = ScreenConfigStore()
+
+        if screenshots is None:
+            screenshots = ScreenshotCache()
+
+        self.__capture = capture
+        self.__screenshots = screenshots
+        self.__power = power
+        self.__screen_configs = screen_configs
+        self.__reloads = reloads
+        self.__damage = OrderedDict()
+        self.__damage_lock = threading.Lock()
+        self.__topology = None
+        self.__topology_data = None
+        self.__topology_lock = threading.Lock()
+        self.__topology_listeners = []
+        self.__hotplug = None
+
+    def get_screenshot(self, scale: int = None, picture_format: str = None,
+                       quality: int = None, max_width: int = None,
+                       max_height: int = None, max_age: float = None) -> bytes:
+        """
+        Takes a screenshot from the current screen and returns it encoded
+        in the given format. Recent screenshots are served from the cache,
+        the max age overrides the cache's ttl.
+        """
+
+        options = ScreenshotOptions(scale, picture_format, quality, max_width, max_height)
 
-    def get_screenshot(self, scale: int = None, picture_format: str = None) -> bytes:
+        return self.__screenshots.get(
+            options.get_key(), lambda: self.__capture.capture(options), max_age)
+
+    def __get_damage_tracker(self, options: ScreenshotOptions) -> DamageTracker:
         """
-        Takes a screenshot from the current screen and returns it as png.
+        Returns the damage tracker for the screenshot variant, frame ids
+        of one variant mean nothing to another.
         """
+        with self.__damage_lock:
+            tracker = self.__damage.pop(options.get_key(), None)
+            if tracker is None:
+                tracker = DamageTracker()
+
+            self.__damage[options.get_key()] = tracker
+
+            while len(self.__damage) > MAX_DAMAGE_TRACKERS:
+                self.__damage.popitem(last=False)
 
-        if not picture_format:
-            picture_format = "png"
+            return tracker
+
+    def get_screenshot_delta(self, since: int = None, scale: int = None,
+                             picture_format: str = None, quality: int = None) -> ScreenshotDelta:
+        """
+        Takes a screenshot and returns only the tiles which changed since
+        the given frame. In case damage tracking is not available every
+        delta is a keyframe.
+        """
 
-        if not scale:
-            scale = 10
+        options = ScreenshotOptions(scale, picture_format, quality)
 
-        xwd_command = ["xwd", "-silent", "-root", "-display",":0"]
-        convert_command = ["convert", "xwd:-", "-resize", f"{scale}%", f"{picture_format}:-"]
+        try:
+            frame = self.__screenshots.get(
+                ("frame",) + options.get_key(), lambda: self.__capture.grab(options))
 
-        # Run xwd command and capture its output
-        xwd_process = subprocess.run(
-            xwd_command, stdout=subprocess.PIPE, check=True)
+            frame_id, frame, regions = self.__get_damage_tracker(options).track(frame, since)
+        except (ScreenCaptureException, XlibException, DamageException):
+            return ScreenshotDelta(None, True, None, None, [(
+                None, self.get_screenshot(
+                    options.get_scale(), options.get_format(), options.get_quality()))])
 
-        # Run convert command with xwd output as input
-        convert_process = subprocess.run(
-            convert_command, input=xwd_process.stdout, stdout=subprocess.PIPE, check=True)
+        height, width = frame.shape[:2]
 
-        return convert_process.stdout
+        keyframe = regions is None
+        if keyframe:
+            regions = [DamageRegion(0, 0, width, height)]
+
+        return ScreenshotDelta(
+            frame_id, keyframe, width, height,
+            [(region, encode(region.crop(frame), options)) for region in regions])
 
     def on(self):
         """
         Turns the display on and ensures the screensaver is disabled.
         """
-
-        subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_FORCE_ON}"], check=True)
-        subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_SCREENSAVER_OFF}"], check=True)
-        subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_POWER_MANAGEMENT_OFF}"], check=True)
-        subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_SCREENSAVER_BLANK_OFF}"], check=True)
+        self.__screenshots.invalidate()
+        self.__power.on()
 
     def off(self):
         """
         Turns the display off.
         """
-
-        subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_FORCE_OFF}"], check=True)
+        self.__screenshots.invalidate()
+        self.__power.off()
 
     def is_off(self):
         """
         Checks if the display is off.
         """
+        return self.__power.is_off()
+
+    def __query_topology(self) -> DisplayTopology:
+        """
+        Runs xrandr and caches the result, the topology lock has to be held.
+        Returns the topology and a flag telling if the output changed.
+        """
 
         result = subprocess.run(
-            ["/bin/bash", "-c", f"{CMD_DISPLAY} {CMD_DISPLAY_STATUS}"],
-            stdout=subprocess.PIPE, text=True, check=True)
+            CMD_GET_SCREENS, shell=True,
+            capture_output=True, text=True, check=False)
 
-        for line in result.stdout.splitlines():
-            if line.strip() == "Monitor is Off":
-                return True
+        data = result.stdout.strip()
+        topology = DisplayTopology.parse(data)
 
-        return False
+        # Failures are not cached, the X server may just be starting.
+        if result.returncode != 0:
+            return topology, False
 
-    def get_screens(self) -> List[Screen]:
+        changed = self.__topology_data is not None and data != self.__topology_data
+
+        self.__topology = topology
+        self.__topology_data = data
+
+        return topology, changed
+
+    def get_topology(self) -> DisplayTopology:
         """
-        Returns a list of all screens attached to the system.
+        Returns the cached topology snapshot. It is queried from xrandr
+        in case it was invalidated.
         """
 
-        xrandr_data = subprocess.run(
-            CMD_GET_SCREENS, shell=True,
-            capture_output=True, text=True, check=False).stdout.strip()
+        with self.__topology_lock:
+            if self.__topology:
+                return self.__topology
 
-        matches = re.finditer(REGEX_GET_SCREEN_PROPERTIES, xrandr_data, re.MULTILINE)
+            topology, changed = self.__query_topology()
 
-        result = []
+        if changed:
+            self.__notify_topology(topology)
 
-        for _, match in enumerate(matches, start=1):
-            result.append(Screen(match.group('name')).load(xrandr_data))
+        return topology
 
-        return result
+    def refresh_topology(self) -> DisplayTopology:
+        """
+        Queries xrandr and replaces the cached topology. The topology
+        listeners are notified in case the outputs changed.
+        """
+
+        with self.__topology_lock:
+            topology, changed = self.__query_topology()
+
+        if changed:
+            self.__notify_topology(topology)
+
+        return topology
+
+    def invalidate_topology(self):
+        """
+        Drops the cached topology, it is reloaded on the next request.
+        """
+
+        with self.__topology_lock:
+            self.__topology = None
+
+    def add_topology_listener(self, callback):
+        """
+        Registers a callback which is called with the new topology
+        whenever outputs are added, removed or reconfigured.
+        """
+
+        self.__topology_listeners.append(callback)
+
+    def __notify_topology(self, topology: DisplayTopology):
+        # A new monitor invalidates all screenshots taken from the old layout.
+        self.__screenshots.invalidate()
+
+        for callback in list(self.__topology_listeners):
+            try:
+                callback(topology)
+            except Exception as ex:
+                logging.getLogger('flask.app').warning("Topology listener failed: %s", ex)
+
+    def watch_topology(self) -> bool:
+        """
+        Starts listening for XRandR hot-plug events. The topology is kept
+        up to date in the background, so that requests are served from
+        memory. Returns false in case events are not available, the
+        topology is then queried on demand.
+        """
+
+        if self.__hotplug is None:
+            self.__hotplug = HotplugListener(self.refresh_topology)
+
+        try:
+            self.__hotplug.start()
+        except XlibException as ex:
+            logging.getLogger('flask.app').warning("Hot-plug events not available: %s", ex)
+            return False
+
+        return True
+
+    def get_screens(self) -> List[Screen]:
+        """
+        Returns a list of all screens attached to the system.
+        """
+
+        topology = self.get_topology()
+
+        return [
+            Screen(output.get_name(), self.__screen_configs).load_topology(topology)
+            for output in topology.get_outputs()]
 
     def get_screen(self, name) -> Screen:
         """
         Gets a screen by his unique name.
         """
 
-        return Screen(name).load()
+        return Screen(name, self.__screen_configs).load_topology(self.get_topology())
 
     def set_screen(self, name:str, orientation:str):
         """
         Enables the given display and sets the orientation.
-        """
 
-        # Clear all existing configs
-        shutil.rmtree(CONFIG_XINITRC_SCREENS)
-        CONFIG_XINITRC_SCREENS.mkdir(exist_ok=True)
+        The configuration is applied live via xrandr and persisted for
+        the next boot. In case the X server does not accept it, the
+        window manager is restarted instead. It returns as soon as the
+        X server reports the new configuration.
+        """
+        self.__screenshots.invalidate()
 
-        # And create new ones.
+        configs = []
+        connected = False
         for screen in self.get_screens():
 
             if screen.get_name() != name:
-                screen.disable()
+                configs.append(ScreenConfig(screen.get_name(), off=True))
+                continue
+
+            configs.append(ScreenConfig(name, orientation, primary=True))
+            connected = screen.is_connected()
+
+        self.__screen_configs.replace(configs)
+
+        if self.apply_screens(configs):
+            # Without a monitor there is nothing the X server could confirm.
+            if not connected:
+                self.refresh_topology()
+                return
+
+            if self.__wait_for_screen(name, orientation, SCREEN_APPLY_TIMEOUT):
+                return
+
+        logging.getLogger('flask.app').warning(
+            "Live screen configuration failed, restarting the window manager")
+
+        handle = self.reload()
+        if not handle.wait(RELOAD_TIMEOUT):
+            logging.getLogger('flask.app').warning("Window manager restart timed out")
+            return
+
+        if handle.get_error() is not None:
+            return
+
+        if connected:
+            self.__wait_for_screen(name, orientation, SCREEN_RESTART_TIMEOUT)
+
+    def apply_screens(self, configs: List[ScreenConfig]) -> bool:
+        """
+        Applies the configurations to the running X server in a single
+        xrandr call. Returns false in case xrandr failed.
+        """
+
+        command = list(CMD_APPLY_SCREENS)
+        for config in configs:
+            command += ["--output", config.get_output()]
+
+            if config.is_off():
+                command.append("--off")
                 continue
 
-            screen.enable(orientation)
+            # Re-enables the output in case it was switched off.
+            command.append("--auto")
+            if config.get_rotation():
+                command += ["--rotate", config.get_rotation()]
+            if config.is_primary():
+                command.append("--primary")
+
+        result = subprocess.run(command, capture_output=True, text=True, check=False)
+
+        if result.returncode != 0:
+            logging.getLogger('flask.app').warning(
+                "Failed to apply screen configuration: %s", result.stderr.strip())
+            return False
+
+        return True
+
+    def __wait_for_screen(self, name: str, orientation: str, timeout: float) -> bool:
+        """
+        Polls the topology until the screen reports the orientation and is primary.
+        """
+
+        deadline = time.monotonic() + timeout
 
-        self.reload()
+        while True:
+            output = self.refresh_topology().get_output(name)
 
-    def reload(self):
+            if output and output.is_primary() and output.get_rotation() == orientation:
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
+
+            time.sleep(SCREEN_POLL_INTERVAL)
+
+    def reload(self) -> ReloadHandle:
         """
-        Restarts the window manager.
+        Schedules a restart of the window manager, which restarts the browser as well.
         """
+        return self.__reloads.request(RESTART_DISPLAY, self.__reload)
+
+    def __reload(self):
+        # The X server is restarted along with the window manager.
+        self.__capture.reset()
+        self.__power.reset()
+        self.__screenshots.invalidate()
+        self.invalidate_topology()
 
         subprocess.run(f"systemctl restart {CONFIG_WM_SERVICE_FILE}", shell=True, check=True)
@@ -0,0 +1,220 @@
+"""
+Turns the monitor on and off via DPMS.
+"""
+
+from abc import ABC, abstractmethod
+import ctypes
+import logging
+import subprocess
+import threading
+
+from src.xlib import (
+    DEFAULT_EXPOSURES, DONT_PREFER_BLANKING, DPMS_MODE_OFF, DPMS_MODE_ON,
+    XConnection, XLIB, XlibException)
+
+CMD_DISPLAY = "DISPLAY=:0"
+CMD_DISPLAY_STATUS = "xset -q"
+CMD_DISPLAY_FORCE_ON = "xset dpms force on"
+CMD_DISPLAY_FORCE_OFF = "xset dpms force off"
+CMD_DISPLAY_SCREENSAVER_OFF = "xset s off"
+CMD_DISPLAY_SCREENSAVER_BLANK_OFF = "xset s noblank"
+CMD_DISPLAY_POWER_MANAGEMENT_OFF = "xset -dpms"
+
+
+class DisplayPowerBackend(ABC):
+    """
+    An abstract backend to control the monitor's power state.
+    """
+
+    @abstractmethod
+    def on(self):
+        """
+        Turns the monitor on and disables the screensaver as well as
+        the automatic power management.
+        """
+
+    @abstractmethod
+    def off(self):
+        """
+        Turns the monitor off.
+        """
+
+    @abstractmethod
+    def is_off(self) -> bool:
+        """
+        Checks if the monitor is off.
+        """
+
+    def close(self):
+        """
+        Releases all resources held by the backend.
+        """
+
+
+class XsetDisplayPower(DisplayPowerBackend):
+    """
+    Controls the monitor by running xset.
+    """
+
+    def __xset(self, command: str, **kwargs):
+        return subprocess.run(
+            ["/bin/bash", "-c", f"{CMD_DISPLAY} {command}"], check=True, **kwargs)
+
+    def on(self):
+        self.__xset(CMD_DISPLAY_FORCE_ON)
+        self.__xset(CMD_DISPLAY_SCREENSAVER_OFF)
+        self.__xset(CMD_DISPLAY_POWER_MANAGEMENT_OFF)
+        self.__xset(CMD_DISPLAY_SCREENSAVER_BLANK_OFF)
+
+    def off(self):
+        self.__xset(CMD_DISPLAY_FORCE_OFF)
+
+    def is_off(self) -> bool:
+        result = self.__xset(CMD_DISPLAY_STATUS, stdout=subprocess.PIPE, text=True)
+
+        for line in result.stdout.splitlines():
+            if line.strip() == "Monitor is Off":
+                return True
+
+        return False
+
+
+class NativeDisplayPower(DisplayPowerBackend):
+    """
+    Controls the monitor with the DPMS and screensaver extensions
+    over a persistent X connection. It is equivalent to the xset
+    commands but does not spawn any process.
+    """
+
+    def __init__(self, connection: XConnection = None):
+        if connection is None:
+            connection = XConnection()
+
+        self.__connection = connection
+        self.__checked = None
+
+    def __open(self):
+        display = self.__connection.open()
+
+        # The connection may have been reopened after the X server restarted.
+        if self.__checked == display:
+            return display
+
+        xext = XLIB.xext()
+
+        event_base = ctypes.c_int()
+        error_base = ctypes.c_int()
+        if not xext.DPMSQueryExtension(
+                display, ctypes.byref(event_base), ctypes.byref(error_base)):
+            raise XlibException("X server does not support the DPMS extension")
+
+        if not xext.DPMSCapable(display):
+            raise XlibException("X server is not DPMS capable")
+
+        self.__checked = display
+        return display
+
+    def on(self):
+        with self.__connection.get_lock():
+            display = self.__open()
+            xext = XLIB.xext()
+
+            # Forcing a level only works while DPMS is enabled, a disabled
+            # DPMS means the monitor is already on.
+            level, enabled = self.__get_info(display)
+            if enabled and level != DPMS_MODE_ON:
+                xext.DPMSForceLevel(display, DPMS_MODE_ON)
+
+            xext.DPMSDisable(display)
+            XLIB.x11().XSetScreenSaver(
+                display, 0, 0, DONT_PREFER_BLANKING, DEFAULT_EXPOSURES)
+
+            self.__connection.sync()
+
+    def off(self):
+        with self.__connection.get_lock():
+            display = self.__open()
+            xext = XLIB.xext()
+
+            # Same as xset, which enables DPMS before forcing the level.
+            xext.DPMSEnable(display)
+            xext.DPMSForceLevel(display, DPMS_MODE_OFF)
+
+            self.__connection.sync()
+
+    def __get_info(self, display):
+        level = ctypes.c_ushort()
+        enabled = ctypes.c_ubyte()
+        XLIB.xext().DPMSInfo(display, ctypes.byref(level), ctypes.byref(enabled))
+
+        if self.__connection.is_broken():
+            raise XlibException("Lost connection to the X server")
+
+        return level.value, bool(enabled.value)
+
+    def is_off(self) -> bool:
+        with self.__connection.get_lock():
+            level, enabled = self.__get_info(self.__open())
+
+        return enabled and level == DPMS_MODE_OFF
+
+    def close(self):
+        with self.__connection.get_lock():
+            self.__checked = None
+            self.__connection.close()
+
+
+class DisplayPower:
+    """
+    Controls the monitor with the native backend and falls back
+    to xset in case it fails.
+    """
+
+    def __init__(self, native: DisplayPowerBackend = None,
+                 fallback: DisplayPowerBackend = None):
+        if native is None:
+            native = NativeDisplayPower()
+
+        if fallback is None:
+            fallback = XsetDisplayPower()
+
+        self.__native = native
+        self.__fallback = fallback
+        self.__lock = threading.Lock()
+        self.__native_failed = False
+
+    def __call(self, name: str):
+        try:
+            return getattr(self.__native, name)()
+        except XlibException as ex:
+            with self.__lock:
+                if not self.__native_failed:
+                    logging.getLogger('flask.app').warning(
+                        "Native DPMS control failed, using xset: %s", ex)
+                self.__native_failed = True
+
+        return getattr(self.__fallback, name)()
+
+    def on(self):
+        """
+        Turns the monitor on and ensures the screensaver is disabled.
+        """
+        self.__call("on")
+
+    def off(self):
+        """
+        Turns the monitor off.
+        """
+        self.__call("off")
+
+    def is_off(self) -> bool:
+        """
+        Checks if the monitor is off.
+        """
+        return self.__call("is_off")
+
+    def reset(self):
+        """
+        Drops the X connection, e.g. before the X server is restarted.
+        """
+        self.__native.close()
@@ -1,14 +1,16 @@
 """
 To figure out the line use gpioinfo on the command line.
 and to test a pin use gpiomon gpiochip0 18
+
+The kernel's gpio v2 uapi structs are mirrored as ctypes structures.
+They are passed to ioctl in place and can be reused across calls.
 """
 
-from abc import ABC
-import array
 import ctypes
+import logging
 import os
 import fcntl
-import struct
+from typing import List, NamedTuple
 
 GPIO_ATTRIBUTE_FLAG = 1
 GPIO_ATTRIBUTE_VALUE = 2
@@ -25,146 +27,107 @@ GPIO_V2_LINE_FLAG_OPEN_SOURCE = 1 << 7
 GPIO_V2_LINE_FLAG_BIAS_PULL_UP = 1 << 8
 GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN = 1 << 9
 GPIO_V2_LINE_FLAG_BIAS_DISABLED = 1 << 10
+GPIO_V2_LINE_FLAG_EVENT_CLOCK_REALTIME = 1 << 11
+GPIO_V2_LINE_FLAG_EVENT_CLOCK_HTE = 1 << 12
 
 GPIO_V2_LINES_MAX = 64
 GPIO_MAX_NAME_SIZE = 32
+GPIO_V2_LINE_NUM_ATTRS_MAX = 10
 
-GPIO_FLAG_ATTRIBUTE_SIZE = 16
-GPIO_VALUE_ATTRIBUTE_SIZE = 16
-GPIO_DEBOUNCE_ATTRIBUTE_SIZE = 16
+# The sizes of the structs as defined by the kernel's abi.
+GPIO_V2_LINE_ATTRIBUTE_SIZE = 16
 GPIO_V2_LINE_CONFIG_ATTRIBUTE_SIZE = 24
-GPIO_V2_LINE_CONFIG_ATTRIBUTES_SIZE = 240
 GPIO_V2_LINE_CONFIG_SIZE = 272
+GPIO_V2_LINE_REQUEST_SIZE = 592
+GPIO_V2_LINE_VALUES_SIZE = 16
+GPIO_V2_LINE_EVENT_SIZE = 48
+
+GPIO_IOCTL_TYPE = 0xB4
 
+GPIO_V2_LINE_EVENT_RISING_EDGE = 1
+GPIO_V2_LINE_EVENT_FALLING_EDGE = 2
+
+# How many events are read with a single syscall.
+DEFAULT_EVENT_BATCH = 16
 
-GPIO_V2_LINE_NUM_ATTRS_MAX = 8
 
 class GpioException(Exception):
     """
     Thrown in case something goes wrong with gpio.
     """
 
-class GpioV2Attribute(ABC):
+
+class GpioV2LineAttributeValue(ctypes.Union):
     """
-    An abstract gpioV2 struct abstraction.
+    The attribute's payload, which member is used depends on the attribute's id.
     """
+    _fields_ = [
+        ("flags", ctypes.c_uint64),
+        ("values", ctypes.c_uint64),
+        ("debounce_period_us", ctypes.c_uint32)
+    ]
 
-    def __init__(self, identifier):
-        self.__id = identifier
-
-    def pack(self) -> bytes:
-        """
-        Packs the gpio attributes struct.
-        """
-        data = bytes()
-        data += struct.pack("<I", self.__id)
-        data += struct.pack("<I", 0)
-
-        return data
 
-class GpioV2FlagAttribute(GpioV2Attribute):
+class GpioV2LineAttribute(ctypes.Structure):
     """
-    Configures gpio flags.
+    Mirrors struct gpio_v2_line_attribute.
     """
+    _anonymous_ = ("value",)
+    _fields_ = [
+        ("id", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32),
+        ("value", GpioV2LineAttributeValue)
+    ]
 
-    def __init__(self, flags):
-        super().__init__(GPIO_ATTRIBUTE_FLAG)
-        self.__flags = flags
 
-    def pack(self) -> bytes:
-        """
-        Packs the flags attribute struct.
-        """
-        data = super().pack()
-        data += struct.pack("<Q", self.__flags)
-
-        if len(data) != GPIO_FLAG_ATTRIBUTE_SIZE:
-            raise GpioException(f"Expected 16 bytes but got {len(data)}")
-
-        return data
-
-class GpioV2ValueAttribute(GpioV2Attribute):
+class GpioV2LineConfigAttribute(ctypes.Structure):
     """
-    Specifies the Gpio values to set.
+    Mirrors struct gpio_v2_line_config_attribute, the mask selects
+    the lines the attribute applies to.
     """
-    def __init__(self, values):
-        super().__init__(GPIO_ATTRIBUTE_VALUE)
-        self.__values = values
-
-    def pack(self) -> bytes:
-        """
-        Packs the value attribute struct.
-        """
-        data = super().pack()
-        data += struct.pack("<Q", self.__values)
+    _fields_ = [
+        ("attr", GpioV2LineAttribute),
+        ("mask", ctypes.c_uint64)
+    ]
 
-        if len(data) != GPIO_VALUE_ATTRIBUTE_SIZE:
-            raise GpioException(f"Expected 16 bytes but got {len(data)}")
 
-        return data
-
-class GpioV2DebounceAttribute(GpioV2Attribute):
+class GpioV2LineConfig(ctypes.Structure):
     """
-    Configures the debounce logic.
+    Mirrors struct gpio_v2_line_config.
     """
+    _fields_ = [
+        ("flags", ctypes.c_uint64),
+        ("num_attrs", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32 * 5),
+        ("attrs", GpioV2LineConfigAttribute * GPIO_V2_LINE_NUM_ATTRS_MAX)
+    ]
 
-    def __init__(self, period):
-        super().__init__(GPIO_ATTRIBUTE_DEBOUNCE)
-        self.__period = period
-
-    def pack(self) -> bytes:
+    def set_flag(self, flag):
         """
-        Packs the debounce attribute struct.
+        Sets an gpio flag.
         """
-        data = super().pack()
-        data += struct.pack("<I", self.__period)
-        data += struct.pack("<I", 0)
-
-        if len(data) != GPIO_DEBOUNCE_ATTRIBUTE_SIZE:
-            raise GpioException(f"Expected 16 bytes but got {len(data)}")
-
-        return data
-
-
-class GpioV2LineConfigAttribute():
+        self.flags |= flag
 
-    def __init__(self, mask, attribute):
-        self.__mask = mask
-        self.__attribute = attribute
-
-    def pack(self) -> bytes:
+    def add_attribute(self, mask: int, identifier: int) -> GpioV2LineAttribute:
         """
-        Packs the config attribute struct.
+        Adds an attribute for the lines in the mask and returns it, so
+        that the caller can fill in the value.
         """
-        data = bytes()
-        data += self.__attribute.pack()
-        data += struct.pack("<Q", self.__mask)
-
-        if len(data) != GPIO_V2_LINE_CONFIG_ATTRIBUTE_SIZE:
-            raise GpioException(f"Expected 24 bytes but got {len(data)}")
-
-        return data
-
+        if self.num_attrs >= GPIO_V2_LINE_NUM_ATTRS_MAX:
+            raise GpioException(f"At most {GPIO_V2_LINE_NUM_ATTRS_MAX} attributes are supported")
 
-class GpioV2LineConfig():
+        attribute = self.attrs[self.num_attrs]
+        attribute.mask = mask
+        attribute.attr.id = identifier
+        self.num_attrs += 1
 
-    def __init__(self):
-        self.__flags = 0
-        self.__attributes = []
+        return attribute.attr
 
-    def set_flag(self, flag):
+    def add_debounce(self, mask, period):
         """
-        Sets an gpio flag.
+        Debounces the lines in the mask, the period is in microseconds.
         """
-        self.__flags |= flag
-
-    def add_attribute(self, attribute: GpioV2Attribute):
-        self.__attributes.append(attribute)
-
-    def add_debounce(self, mask, period):
-        self.add_attribute(
-            GpioV2LineConfigAttribute(
-                mask, GpioV2DebounceAttribute(period)))
+        self.add_attribute(mask, GPIO_ATTRIBUTE_DEBOUNCE).debounce_period_us = period
 
     def enable_input(self):
         """
@@ -184,6 +147,17 @@ class GpioV2LineConfig():
         """
         self.set_flag(GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN)
 
+    def disable_bias(self):
+        """
+        Disables the internal pull up and pull down
+        """
+        self.set_flag(GPIO_V2_LINE_FLAG_BIAS_DISABLED)
+
+    def enable_active_low(self):
+        """
+        Inverts the line, a low level is reported as active
+        """
+        self.set_flag(GPIO_V2_LINE_FLAG_ACTIVE_LOW)
 
     def enable_rising_edge(self):
         """
@@ -197,177 +171,142 @@ class GpioV2LineConfig():
         """
         self.set_flag(GPIO_V2_LINE_FLAG_EDGE_FALLING)
 
-    def pack_attributes(self) -> bytes:
-        """
-        Packs the attributes into a binary struct. It is zero padded.
-        """
-        data = bytes()
-
-        for attribute in self.__attributes:
-            data += attribute.pack()
-
-        while len(data) != GPIO_V2_LINE_CONFIG_ATTRIBUTES_SIZE:
-            data += b"\0"
 
-        if len(data) != GPIO_V2_LINE_CONFIG_ATTRIBUTES_SIZE:
-            raise GpioException(f"Expected 240 bytes but got {len(data)}")
-
-        return data
-
-    def pack(self) -> bytes:
-        """
-        Packs the line config into a binary struct.
-        """
-        data = bytes()
-        data += struct.pack("<Q", self.__flags)
-        data += struct.pack("<I", len(self.__attributes))
-        data += bytearray([0] * 5 * 4)
-        data += self.pack_attributes()
-
-        if len(data) != GPIO_V2_LINE_CONFIG_SIZE:
-            raise GpioException(f"Expected 272 bytes but got {len(data)}")
-
-        return data
-
-
-class GpioV2LineRequest():
-
-    def __init__(self):
-        self.__lines = []
-        self.__consumer:str = ""
-        self.__config = None
-        self.__fd: int = 0
-        self.__event_buffer_size = 0
+class GpioV2LineRequest(ctypes.Structure):
+    """
+    Mirrors struct gpio_v2_line_request, the kernel returns the
+    line's file descriptor in the fd field.
+    """
+    _fields_ = [
+        ("offsets", ctypes.c_uint32 * GPIO_V2_LINES_MAX),
+        ("consumer", ctypes.c_char * GPIO_MAX_NAME_SIZE),
+        ("config", GpioV2LineConfig),
+        ("num_lines", ctypes.c_uint32),
+        ("event_buffer_size", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32 * 5),
+        ("fd", ctypes.c_int32)
+    ]
 
     def add_line(self, line):
         """
         Adds a line to be monitored.
         """
-        self.__lines.append(line)
+        if self.num_lines >= GPIO_V2_LINES_MAX:
+            raise GpioException(f"At most {GPIO_V2_LINES_MAX} lines are supported")
+
+        self.offsets[self.num_lines] = line
+        self.num_lines += 1
 
     def set_consumer(self, consumer:str):
         """
-        Sets the consumer name.
+        Sets the consumer name, it is truncated to the kernel's limit.
         """
-        self.__consumer = consumer
+        self.consumer = consumer.encode("utf-8")[:GPIO_MAX_NAME_SIZE - 1]
 
-    def set_config(self, config):
-        self.__config = config
-
-    def get_fd(self) -> int:
+    def set_config(self, config: GpioV2LineConfig):
         """
-        Returns the file descriptor.
+        Copies the line config into the request.
         """
-        return self.__fd
+        self.config = config
 
-    def pack_lines(self) -> bytes:
+    def get_fd(self) -> int:
         """
-        Packs the lines config struct used by the line request.
+        Returns the file descriptor.
         """
-        data = bytes()
-
-        for line in self.__lines:
-            data += struct.pack("<I", line)
+        return self.fd
 
-        while len(data) != GPIO_V2_LINES_MAX*4:
-            data += b"\0"
 
-        if len(data) != 256:
-            raise GpioException(f"Expected 272 bytes but got {len(data)}")
-
-        return data
+class GpioV2LineValues(ctypes.Structure):
+    """
+    Mirrors struct gpio_v2_line_values.
+    """
+    _fields_ = [
+        ("bits", ctypes.c_uint64),
+        ("mask", ctypes.c_uint64)
+    ]
 
-    def pack_consumer(self) -> bytes:
+    def set_mask(self, mask):
         """
-        Packs the consumer name into a struct used by the line request.
+        Sets the mask which specifies which values should be monitored.
         """
+        self.mask = mask
 
-        data = bytes()
-        data += self.__consumer.encode("utf-8")
-
-        while len(data) != GPIO_MAX_NAME_SIZE:
-            data += b"\0"
-
-        return data
-
-    def pack_config(self) -> bytes:
+    def is_high(self, bit:int) -> bool:
         """
-        Packs the line config structs used by the line request.
+        Checks if the given bit is active.
         """
+        return (self.bits & (1 << bit)) != 0
 
-        if self.__config:
-            return self.__config.pack()
-
-        data = bytes()
-        for i in range(272):
-            data += i
-
-        return data
 
-    def pack(self) -> bytes:
-        """
-        Packs the line request struct.
-        """
-        data = bytes()
-        data += self.pack_lines()
-        data += self.pack_consumer()
-        data += self.pack_config()
-        data += struct.pack("<I", len(self.__lines))
-        data += struct.pack("<I", self.__event_buffer_size)
-        data += bytearray([0] * 5 * 4)
-        data += struct.pack("<i", self.__fd)
+class GpioV2LineEvent(ctypes.Structure):
+    """
+    Mirrors struct gpio_v2_line_event, which is read from the line's file descriptor.
+    """
+    _fields_ = [
+        ("timestamp_ns", ctypes.c_uint64),
+        ("id", ctypes.c_uint32),
+        ("offset", ctypes.c_uint32),
+        ("seqno", ctypes.c_uint32),
+        ("line_seqno", ctypes.c_uint32),
+        ("padding", ctypes.c_uint32 * 6)
+    ]
 
-        if len(data) != 592:
-            raise GpioException(f"Expected 592 bytes but got {len(data)}")
 
-        return data
+class GpioEdgeEvent(NamedTuple):
+    """
+    A decoded edge event, the timestamp is in nanoseconds and the ids
+    are the kernel's GPIO_V2_LINE_EVENT_* values.
+    """
+    timestamp_ns: int
+    id: int
+    offset: int
+    seqno: int
+    line_seqno: int
 
-    def unpack(self, data):
+    def is_rising(self) -> bool:
         """
-        Unpacks the response the the line request, which is typically a file handle.
+        Checks if the line went active.
         """
-        if len(data) != 592:
-            raise GpioException(f"Expected 592 bytes but got {len(data)}")
+        return self.id == GPIO_V2_LINE_EVENT_RISING_EDGE
 
-        # Convert the bytes to an integer using struct.unpack
-        self.__fd = struct.unpack('<I', data[-4:])[0]
 
+def check_layout(structure, size: int):
+    """
+    Ensures the structure matches the kernel's abi, a mismatch would corrupt
+    the ioctl's memory.
+    """
+    if ctypes.sizeof(structure) != size:
+        raise GpioException(
+            f"Expected {size} bytes for {structure.__name__} but got {ctypes.sizeof(structure)}")
 
-class GpioV2LineValues():
 
-    def __init__(self):
-        self.__bits = 0
-        self.__mask = 0
+for _structure, _size in (
+        (GpioV2LineAttribute, GPIO_V2_LINE_ATTRIBUTE_SIZE),
+        (GpioV2LineConfigAttribute, GPIO_V2_LINE_CONFIG_ATTRIBUTE_SIZE),
+        (GpioV2LineConfig, GPIO_V2_LINE_CONFIG_SIZE),
+        (GpioV2LineRequest, GPIO_V2_LINE_REQUEST_SIZE),
+        (GpioV2LineValues, GPIO_V2_LINE_VALUES_SIZE),
+        (GpioV2LineEvent, GPIO_V2_LINE_EVENT_SIZE)):
+    check_layout(_structure, _size)
 
-    def set_mask(self, mask):
-        """
-        Sets the mask which specifies which values should be monitored.
-        """
-        self.__mask = mask
 
-    def is_high(self, bit:int) -> bool:
-        """
-        Checks if the given bit is active.
-        """
-        return (self.__bits & (1 << bit)) != 0
-
-    def pack(self) -> bytearray:
-        """
-        Packs the line value structs.
-        """
-        data = bytearray()
-        data += struct.pack("<Q", self.__bits)
-        data += struct.pack("<Q", self.__mask)
-        return data
+def iowr(number: int, structure) -> int:
+    """
+    Calculates the request code of a read write ioctl, like the kernel's _IOWR macro.
+    """
+    return (3 << 30) | (ctypes.sizeof(structure) << 16) | (GPIO_IOCTL_TYPE << 8) | number
 
-    def unpack(self, data):
-        if len(data) != 16:
-            raise GpioException(f"Expected 16 bytes but got {len(data)}")
 
-        self.__bits = struct.unpack('<Q', data[:8])[0]
+GPIO_V2_GET_LINE_IOCTL = iowr(0x07, GpioV2LineRequest)
+GPIO_V2_LINE_SET_CONFIG_IOCTL = iowr(0x0D, GpioV2LineConfig)
+GPIO_V2_LINE_GET_VALUES_IOCTL = iowr(0x0E, GpioV2LineValues)
 
 
 class GpioDevice:
+    """
+    A gpio chip, e.g. /dev/gpiochip0
+    """
+
     def __init__(self, device):
         self.__device = device
         self.__fd = -1
@@ -398,7 +337,7 @@ class GpioDevice:
 
         self.__fd = -1
 
-    def get_lines(self, name:str, lines, config):
+    def get_lines(self, name:str, lines, config: GpioV2LineConfig):
         """
         Gets the lines from the gpio device.
         """
@@ -411,10 +350,7 @@ class GpioDevice:
         req.set_config(config)
         req.set_consumer(name)
 
-        data = array.array("B",req.pack())
-        # GPIO_GET_LIN_CTL
-        fcntl.ioctl(self.__fd, 3260068871, data, 1)
-        req.unpack(data)
+        fcntl.ioctl(self.__fd, GPIO_V2_GET_LINE_IOCTL, req, True)
 
         return GpioLine(req.get_fd(), lines)
 
@@ -422,42 +358,85 @@ class GpioLine():
     """
     Abstracts a gpio line configuration.
     """
-    def __init__(self, fd, lines):
+    def __init__(self, fd, lines, batch: int = DEFAULT_EVENT_BATCH):
         self.__fd = fd
         self.__lines = lines
 
+        # Reused for every read, the mask selects all requested lines.
+        self.__values = GpioV2LineValues()
+        self.__values.set_mask((1 << len(lines)) - 1)
+
+        self.__events = (GpioV2LineEvent * batch)()
+        self.__buffer = memoryview(self.__events).cast("B")
+        self.__seqno = None
+        self.__dropped = 0
+
     def get_fd(self):
         """
         Returns the file descriptor needed to read this gpio line.
         """
         return self.__fd
 
-    def get_active(self):
+    def get_lines(self) -> List[int]:
         """
-        Checks if the gpio line is active.
+        Returns the offsets of the requested lines.
         """
-        lv = GpioV2LineValues()
+        return list(self.__lines)
 
-        mask = 0
-        for i in range(len(self.__lines)):
-            mask |= (1 << i)
+    def close(self):
+        """
+        Releases the gpio lines.
+        """
+        if self.__fd != -1:
+            os.close(self.__fd)
 
-        lv.set_mask(mask)
+        self.__fd = -1
 
-        data = array.array("B",lv.pack())
-        # GPIO_V2_LINE_GET_VALUES_IOCTL
-        fcntl.ioctl(self.__fd, 3222320142, data, 1)
-        lv.unpack(data)
+    def get_dropped(self) -> int:
+        """
+        Returns how many events were lost, e.g. because the kernel's
+        event buffer overflowed.
+        """
+        return self.__dropped
 
-        res = {}
+    def read_events(self) -> List[GpioEdgeEvent]:
+        """
+        Reads all pending edge events up to the batch size with a single
+        syscall. It blocks in case no event is pending.
+        """
+        size = os.readv(self.__fd, [self.__buffer])
+        if size % GPIO_V2_LINE_EVENT_SIZE:
+            raise GpioException(f"Read a partial event of {size} bytes")
 
-        #logging.getLogger('flask.app').error(str(active))
+        result = []
+        for event in self.__events[:size // GPIO_V2_LINE_EVENT_SIZE]:
+            # The sequence number is counted across all lines of the request.
+            if self.__seqno is not None and event.seqno != self.__seqno + 1:
+                missing = event.seqno - self.__seqno - 1
+                self.__dropped += missing
+                logging.getLogger('flask.app').warning(
+                    "Lost %d gpio events before event %d", missing, event.seqno)
 
-        for line in range(len(self.__lines)):
-            # we need to invert we have pull ups
-            if  lv.is_high(line):
-                res[self.__lines[line]] = True
-            else:
-                res[self.__lines[line]] = False
+            self.__seqno = event.seqno
+            result.append(GpioEdgeEvent(
+                event.timestamp_ns, event.id, event.offset, event.seqno, event.line_seqno))
+
+        return result
+
+    def set_config(self, config: GpioV2LineConfig):
+        """
+        Reconfigures the requested lines without releasing them.
+        """
+        fcntl.ioctl(self.__fd, GPIO_V2_LINE_SET_CONFIG_IOCTL, config, True)
+
+    def get_active(self):
+        """
+        Checks if the gpio line is active.
+        """
+        fcntl.ioctl(self.__fd, GPIO_V2_LINE_GET_VALUES_IOCTL, self.__values, True)
+
+        res = {}
+        for index, line in enumerate(self.__lines):
+            res[line] = self.__values.is_high(index)
 
         return res
@@ -0,0 +1,212 @@
+"""
+Serves the edge events of any number of gpio lines from a single thread.
+"""
+
+import logging
+import os
+import selectors
+import threading
+
+from src.gpio import GpioException, GpioLine
+
+# How long a removal waits for the loop to release the line.
+DEFAULT_REMOVE_TIMEOUT = 5.0
+
+
+class GpioEventLoop:
+    """
+    Multiplexes the line request file descriptors with epoll.
+
+    An eventfd wakes the loop whenever lines are added or removed and
+    on shutdown, so that changes take effect immediately instead of
+    after the next edge.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__selector = None
+        self.__wakeup = None
+        self.__worker = None
+        self.__running = False
+        self.__pending = []
+        self.__handlers = {}
+
+    def is_running(self) -> bool:
+        """
+        Checks if the loop's thread is running.
+        """
+        return self.__running
+
+    def get_line_count(self) -> int:
+        """
+        Returns how many lines are served.
+        """
+        with self.__lock:
+            return len(self.__handlers) + sum(
+                1 if add else -1 for add, _, _, _ in self.__pending)
+
+    def __wake(self):
+        os.eventfd_write(self.__wakeup, 1)
+
+    def add_line(self, line: GpioLine, callback):
+        """
+        Serves the line's events, the callback is called with the line and
+        a batch of events from the loop's thread. Starts the loop if needed.
+        """
+        os.set_blocking(line.get_fd(), False)
+
+        self.start()
+
+        with self.__lock:
+            self.__pending.append((True, line, callback, None))
+
+        self.__wake()
+
+    def remove_line(self, line: GpioLine, close: bool = True, wait: bool = False,
+                    timeout: float = DEFAULT_REMOVE_TIMEOUT) -> bool:
+        """
+        Stops serving the line, by default the line is released as well.
+        The callback is not called anymore once the loop processed the removal.
+
+        Without wait it returns immediately. Otherwise it returns once the
+        loop released the line, so that the lines can be requested again
+        right away. Returns false in case the wait timed out.
+        """
+        done = threading.Event() if wait else None
+
+        with self.__lock:
+            if not self.__running:
+                if close:
+                    line.close()
+                return True
+
+            self.__pending.append((False, line, close, done))
+
+        # A handler removing a line must not wait for its own thread.
+        if threading.current_thread() is self.__worker:
+            self.__apply_pending()
+            return True
+
+        self.__wake()
+
+        if done is None:
+            return True
+
+        return done.wait(timeout)
+
+    def start(self):
+        """
+        Starts the loop's thread, it does nothing in case it is running.
+        """
+        with self.__lock:
+            if self.__running:
+                return
+            worker = self.__worker
+
+        # A previous loop releases its lines before a new one takes over.
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+
+        with self.__lock:
+            if self.__running:
+                return
+
+            self.__selector = selectors.DefaultSelector()
+            self.__wakeup = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self.__selector.register(self.__wakeup, selectors.EVENT_READ)
+
+            self.__running = True
+            self.__worker = threading.Thread(target=self.__run, name="gpio", daemon=True)
+            self.__worker.start()
+
+    def stop(self):
+        """
+        Stops the loop and releases all lines. It returns once the thread exited.
+        """
+        with self.__lock:
+            if not self.__running:
+                return
+
+            self.__running = False
+            worker = self.__worker
+
+        self.__wake()
+
+        if worker is not threading.current_thread():
+            worker.join()
+
+    def __apply_pending(self):
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+
+        for add, line, argument, done in pending:
+            if add:
+                self.__selector.register(line.get_fd(), selectors.EVENT_READ, (line, argument))
+                self.__handlers[line.get_fd()] = line
+                continue
+
+            if self.__handlers.pop(line.get_fd(), None) is not None:
+                self.__selector.unregister(line.get_fd())
+
+            if argument:
+                line.close()
+
+            if done is not None:
+                done.set()
+
+    def __drop(self, line: GpioLine):
+        self.__handlers.pop(line.get_fd(), None)
+        self.__selector.unregister(line.get_fd())
+        line.close()
+
+    def __dispatch(self, line: GpioLine, callback):
+        try:
+            events = line.read_events()
+        except BlockingIOError:
+            return
+        except (OSError, GpioException) as ex:
+            # Only the failing line is released, the others keep being served.
+            logging.getLogger('flask.app').error(
+                "Failed to read gpio lines %s, releasing them: %s", line.get_lines(), ex)
+            self.__drop(line)
+            return
+
+        if not events:
+            return
+
+        try:
+            callback(line, events)
+        except Exception as ex:  # pylint: disable=broad-except
+            logging.getLogger('flask.app').error("Gpio event handler failed: %s", ex)
+
+    def __shutdown(self):
+        self.__apply_pending()
+
+        for line in list(self.__handlers.values()):
+            self.__drop(line)
+        self.__selector.close()
+        os.close(self.__wakeup)
+
+    def __run(self):
+        try:
+            while self.__running:
+                for key, _ in self.__selector.select():
+                    if key.fd == self.__wakeup:
+                        try:
+                            os.eventfd_read(self.__wakeup)
+                        except BlockingIOError:
+                            pass
+                        continue
+
+                    # The line may have been removed by an earlier handler.
+                    if key.fd in self.__handlers:
+                        self.__dispatch(*key.data)
+
+                self.__apply_pending()
+        finally:
+            # A later add_line starts a new loop, even if this one failed.
+            with self.__lock:
+                self.__running = False
+
+            self.__shutdown()
@@ -0,0 +1,182 @@
+"""
+Listens for XRandR events to learn about monitors being plugged or unplugged.
+"""
+
+import ctypes
+import logging
+import select
+import threading
+
+from src.xlib import (
+    RR_CRTC_CHANGE_NOTIFY_MASK, RR_NOTIFY, RR_OUTPUT_CHANGE_NOTIFY_MASK,
+    RR_SCREEN_CHANGE_NOTIFY, RR_SCREEN_CHANGE_NOTIFY_MASK,
+    XConnection, XEvent, XLIB, XlibException)
+
+# Plugging a cable fires a burst of events, they are coalesced into one change.
+DEFAULT_SETTLE_DELAY = 0.25
+# How long to wait before reconnecting after the X server went away.
+DEFAULT_RETRY_DELAY = 2.0
+# The listener wakes up at least once per poll interval to check if it was stopped.
+POLL_INTERVAL = 1.0
+
+
+class HotplugListener:
+    """
+    Watches the X server for RRScreenChangeNotify and RROutputChangeNotify
+    events and calls the change callback for each burst of events.
+
+    The callback is also called whenever the listener (re)connects, the
+    topology may have changed while the X server was restarted.
+    The listener runs on its own connection in a background thread.
+    """
+
+    def __init__(self, on_change, connection: XConnection = None,
+                 settle: float = DEFAULT_SETTLE_DELAY,
+                 retry: float = DEFAULT_RETRY_DELAY):
+        if connection is None:
+            connection = XConnection()
+
+        self.__on_change = on_change
+        self.__connection = connection
+        self.__settle = settle
+        self.__retry = retry
+
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__events = 0
+
+    def get_events(self) -> int:
+        """
+        Returns the number of randr events received so far.
+        """
+        return self.__events
+
+    def is_running(self) -> bool:
+        """
+        Checks if the listener thread is alive.
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self):
+        """
+        Starts the listener thread. Raises an XlibException in case
+        the X11 or XRandR library is not installed.
+        """
+        if self.is_running():
+            return
+
+        # Fail early, a missing library will not show up by retrying.
+        XLIB.x11()
+        XLIB.xrandr()
+
+        self.__stopped.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="hotplug-listener", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the listener, it returns after the thread terminated.
+        """
+        self.__stopped.set()
+
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __subscribe(self) -> int:
+        """
+        Opens the connection and selects the randr events on the root window.
+        Returns the randr event base.
+        """
+        display = self.__connection.open()
+
+        x11 = XLIB.x11()
+        xrandr = XLIB.xrandr()
+
+        event_base = ctypes.c_int()
+        error_base = ctypes.c_int()
+        if not xrandr.XRRQueryExtension(
+                display, ctypes.byref(event_base), ctypes.byref(error_base)):
+            raise XlibException("X server does not support the RandR extension")
+
+        xrandr.XRRSelectInput(
+            display, x11.XDefaultRootWindow(display),
+            RR_SCREEN_CHANGE_NOTIFY_MASK | RR_CRTC_CHANGE_NOTIFY_MASK
+            | RR_OUTPUT_CHANGE_NOTIFY_MASK)
+
+        self.__connection.sync()
+        return event_base.value
+
+    def __drain(self, event_base: int) -> int:
+        """
+        Reads all queued events and returns the number of randr events.
+        """
+        display = self.__connection.get_display()
+        x11 = XLIB.x11()
+
+        event = XEvent()
+        count = 0
+
+        while x11.XPending(display) > 0:
+            x11.XNextEvent(display, ctypes.byref(event))
+
+            if event.type in (event_base + RR_SCREEN_CHANGE_NOTIFY, event_base + RR_NOTIFY):
+                count += 1
+
+        if self.__connection.is_broken():
+            raise XlibException("Lost connection to the X server")
+
+        return count
+
+    def __changed(self):
+        try:
+            self.__on_change()
+        except Exception as ex:
+            logging.getLogger('flask.app').warning("Hotplug callback failed: %s", ex)
+
+    def __listen(self):
+        """
+        Dispatches events until the listener is stopped or the connection is lost.
+        """
+        with self.__connection.get_lock():
+            event_base = self.__subscribe()
+            descriptor = XLIB.x11().XConnectionNumber(self.__connection.get_display())
+
+        # Catch up with changes which happened while we were not listening.
+        self.__changed()
+
+        while not self.__stopped.is_set():
+
+            readable, _, _ = select.select([descriptor], [], [], POLL_INTERVAL)
+            if not readable:
+                continue
+
+            with self.__connection.get_lock():
+                count = self.__drain(event_base)
+
+            if not count:
+                continue
+
+            # Wait for the burst to settle and swallow the rest of it.
+            if self.__stopped.wait(self.__settle):
+                return
+
+            with self.__connection.get_lock():
+                count += self.__drain(event_base)
+
+            self.__events += count
+            self.__changed()
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                self.__listen()
+            except (XlibException, OSError) as ex:
+                logging.getLogger('flask.app').warning(
+                    "Hotplug listener failed, retrying in %.0fs: %s", self.__retry, ex)
+
+                self.__connection.close()
+                self.__stopped.wait(self.__retry)
+
+        self.__connection.close()
@@ -0,0 +1,453 @@
+"""
+A bounded on-disk http cache which follows the upstream cache headers.
+"""
+
+from __future__ import annotations
+
+import collections
+import email.utils
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, List, Tuple
+
+DEFAULT_CACHE_DIRECTORY = pathlib.Path("/var/cache/kiosk/proxy")
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+MAX_OBJECT_SIZE = 32 * 1024 * 1024
+
+# Kiosks should keep showing content while the uplink is down, this
+# applies in case the upstream does not send stale-if-error itself and
+# did not mark the response no-cache.
+DEFAULT_STALE_IF_ERROR = 24 * 60 * 60
+
+# Heuristic freshness for responses with a Last-Modified header only.
+HEURISTIC_FRACTION = 0.1
+MAX_HEURISTIC_FRESHNESS = 24 * 60 * 60
+
+CACHEABLE_STATUS = (200, 203, 204, 300, 301, 404, 405, 410, 414, 501)
+
+# Requests carrying these belong to a single user. The cache is shared,
+# so their responses are only stored if upstream allows it explicitly.
+CREDENTIAL_HEADERS = ("authorization", "cookie")
+SHARED_DIRECTIVES = ("public", "s-maxage", "must-revalidate")
+
+# Headers which are updated by a 304 response.
+EXCLUDED_UPDATE_HEADERS = ("content-length", "content-encoding", "transfer-encoding")
+
+
+class CacheControl:
+    """
+    The parsed Cache-Control header.
+    """
+
+    def __init__(self, header: str = None):
+        self.__directives = {}
+
+        for directive in (header or "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name:
+                self.__directives[name.lower()] = value.strip().strip('"')
+
+    def has(self, name: str) -> bool:
+        """
+        Checks if the directive is present.
+        """
+        return name in self.__directives
+
+    def get_seconds(self, name: str) -> int:
+        """
+        Returns a delta seconds directive or None in case it is missing or invalid.
+        """
+        try:
+            return max(0, int(self.__directives[name]))
+        except (KeyError, ValueError):
+            return None
+
+
+class CacheEntry:
+    """
+    A stored response along with its freshness information.
+    """
+
+    def __init__(self, url: str, status: int, headers: List[Tuple[str, str]],
+                 stored: float, size: int = 0):
+        self.__url = url
+        self.__status = status
+        self.__headers = headers
+        self.__stored = stored
+        self.__size = size
+
+    def get_url(self) -> str:
+        """
+        Gets the upstream url.
+        """
+        return self.__url
+
+    def get_status(self) -> int:
+        """
+        Gets the http status code.
+        """
+        return self.__status
+
+    def get_headers(self) -> List[Tuple[str, str]]:
+        """
+        Gets the response headers.
+        """
+        return self.__headers
+
+    def get_header(self, name: str) -> str:
+        """
+        Returns the first header with the given name or None.
+        """
+        name = name.lower()
+        for key, value in self.__headers:
+            if key.lower() == name:
+                return value
+
+        return None
+
+    def get_size(self) -> int:
+        """
+        Gets the body's size in bytes.
+        """
+        return self.__size
+
+    def get_stored(self) -> float:
+        """
+        Gets the time the response was received or last validated.
+        """
+        return self.__stored
+
+    def get_cache_control(self) -> CacheControl:
+        """
+        Returns the parsed Cache-Control header.
+        """
+        return CacheControl(self.get_header("Cache-Control"))
+
+    def get_freshness(self) -> float:
+        """
+        Returns for how many seconds the response is fresh.
+        """
+        control = self.get_cache_control()
+
+        if control.has("no-cache"):
+            return 0
+
+        max_age = control.get_seconds("max-age")
+        if max_age is not None:
+            return max_age
+
+        date = self.__parse_date("Date") or self.__stored
+
+        expires = self.get_header("Expires")
+        if expires is not None:
+            expires = self.__parse_date("Expires")
+            return max(0, expires - date) if expires else 0
+
+        last_modified = self.__parse_date("Last-Modified")
+        if last_modified:
+            return min(max(0, date - last_modified) * HEURISTIC_FRACTION,
+                       MAX_HEURISTIC_FRESHNESS)
+
+        return 0
+
+    def __parse_date(self, name: str) -> float:
+        value = self.get_header(name)
+        if not value:
+            return None
+
+        try:
+            return email.utils.parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    def get_age(self, now: float = None) -> float:
+        """
+        Returns the seconds since the response was received.
+        """
+        return max(0.0, (now or time.time()) - self.__stored)
+
+    def is_fresh(self, now: float = None) -> bool:
+        """
+        Checks if the response can be served without asking upstream.
+        """
+        return self.get_age(now) < self.get_freshness()
+
+    def __get_stale_window(self, directive: str, default: int) -> int:
+        control = self.get_cache_control()
+
+        if control.has("must-revalidate") or control.has("proxy-revalidate"):
+            return 0
+
+        window = control.get_seconds(directive)
+        if window is not None:
+            return window
+
+        # The upstream asked for every use to be validated.
+        if control.has("no-cache"):
+            return 0
+
+        return default
+
+    def can_serve_while_revalidate(self, now: float = None) -> bool:
+        """
+        Checks if the stale response may be served while it is revalidated.
+        """
+        stale = self.get_age(now) - self.get_freshness()
+        return stale < self.__get_stale_window("stale-while-revalidate", 0)
+
+    def can_serve_on_error(self, now: float = None) -> bool:
+        """
+        Checks if the stale response may be served because upstream failed.
+        """
+        stale = self.get_age(now) - self.get_freshness()
+        return stale < self.__get_stale_window("stale-if-error", DEFAULT_STALE_IF_ERROR)
+
+    def get_validators(self) -> Dict[str, str]:
+        """
+        Returns the conditional request headers to revalidate the response.
+        """
+        validators = {}
+
+        if self.get_header("ETag"):
+            validators["If-None-Match"] = self.get_header("ETag")
+
+        if self.get_header("Last-Modified"):
+            validators["If-Modified-Since"] = self.get_header("Last-Modified")
+
+        return validators
+
+    def update(self, headers: List[Tuple[str, str]], stored: float) -> CacheEntry:
+        """
+        Returns a copy with the headers of a 304 response merged in.
+        """
+        updated = {key.lower() for key, _ in headers
+                   if key.lower() not in EXCLUDED_UPDATE_HEADERS}
+
+        merged = [(key, value) for key, value in self.__headers if key.lower() not in updated]
+        merged += [(key, value) for key, value in headers if key.lower() in updated]
+
+        return CacheEntry(self.__url, self.__status, merged, stored, self.__size)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the entry's metadata.
+        """
+        return {
+            "url": self.__url,
+            "status": self.__status,
+            "headers": self.__headers,
+            "stored": self.__stored,
+            "size": self.__size
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> CacheEntry:
+        """
+        Deserializes the entry's metadata.
+        """
+        return CacheEntry(
+            data["url"], data["status"], [tuple(header) for header in data["headers"]],
+            data["stored"], data["size"])
+
+    @staticmethod
+    def is_storable(status: int, headers: List[Tuple[str, str]], size: int,
+                    request_headers: Dict[str, str] = None) -> bool:
+        """
+        Checks if a response may be stored in a shared cache at all.
+        """
+        if status not in CACHEABLE_STATUS or size > MAX_OBJECT_SIZE:
+            return False
+
+        entry = CacheEntry("", status, headers, time.time())
+        control = entry.get_cache_control()
+
+        if control.has("no-store") or control.has("private"):
+            return False
+
+        # RFC 9111 section 3.5, only explicitly shared responses are stored.
+        if any(key.lower() in CREDENTIAL_HEADERS for key in (request_headers or {})):
+            if not any(control.has(directive) for directive in SHARED_DIRECTIVES):
+                return False
+
+        # Everything varying on more than the encoding can not be keyed reliably.
+        vary = entry.get_header("Vary")
+        if vary and any(
+                field.strip().lower() not in ("accept-encoding", "")
+                for field in vary.split(",")):
+            return False
+
+        return True
+
+
+class HttpCache:
+    """
+    Stores responses on disk and evicts the least recently used ones
+    once the size limit is exceeded.
+
+    The metadata of each entry is kept in memory, the bodies are read
+    from disk when served. The access time of the files is used to
+    restore the LRU order after a restart.
+    """
+
+    def __init__(self, directory: pathlib.Path = None, max_size: int = DEFAULT_CACHE_SIZE):
+        if directory is None:
+            directory = DEFAULT_CACHE_DIRECTORY
+
+        self.__directory = pathlib.Path(directory)
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()
+        self.__size = 0
+        self.__evictions = 0
+
+        self.__load()
+
+    def __load(self):
+        self.__directory.mkdir(parents=True, exist_ok=True)
+
+        entries = []
+        for meta in self.__directory.glob("*.json"):
+            body = meta.with_suffix(".body")
+
+            try:
+                entry = CacheEntry.from_dict(json.loads(meta.read_text(encoding="utf-8")))
+                used = body.stat().st_mtime
+            except (OSError, ValueError, KeyError, TypeError):
+                meta.unlink(missing_ok=True)
+                body.unlink(missing_ok=True)
+                continue
+
+            entries.append((used, meta.stem, entry))
+
+        for _, key, entry in sorted(entries, key=lambda item: item[0]):
+            self.__entries[key] = entry
+            self.__size += entry.get_size()
+
+        with self.__lock:
+            self.__evict()
+
+    @staticmethod
+    def get_key(url: str) -> str:
+        """
+        Returns the file name for the url.
+        """
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get_size(self) -> int:
+        """
+        Returns the size of all stored bodies in bytes.
+        """
+        return self.__size
+
+    def get_max_size(self) -> int:
+        """
+        Returns the size limit in bytes.
+        """
+        return self.__max_size
+
+    def get_count(self) -> int:
+        """
+        Returns the number of stored responses.
+        """
+        return len(self.__entries)
+
+    def get_evictions(self) -> int:
+        """
+        Returns how many responses were evicted to stay within the limit.
+        """
+        return self.__evictions
+
+    def get(self, url: str) -> CacheEntry:
+        """
+        Returns the entry for the url or None and marks it as recently used.
+        """
+        key = HttpCache.get_key(url)
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+
+            self.__entries.move_to_end(key)
+
+        try:
+            os.utime(self.__directory / f"{key}.body")
+        except OSError:
+            pass
+
+        return entry
+
+    def read(self, entry: CacheEntry) -> bytes:
+        """
+        Reads the entry's body, None in case it vanished.
+        """
+        try:
+            return (self.__directory / f"{HttpCache.get_key(entry.get_url())}.body").read_bytes()
+        except OSError:
+            self.remove(entry.get_url())
+            return None
+
+    def __write(self, path: pathlib.Path, data: bytes):
+        staged = path.with_name(f".{path.name}.tmp")
+        staged.write_bytes(data)
+        os.replace(staged, path)
+
+    def put(self, entry: CacheEntry, body: bytes = None):
+        """
+        Stores the entry. Without body only the metadata is updated.
+        """
+        key = HttpCache.get_key(entry.get_url())
+        meta = json.dumps(entry.to_dict()).encode("utf-8")
+
+        with self.__lock:
+            if body is not None:
+                self.__write(self.__directory / f"{key}.body", body)
+            self.__write(self.__directory / f"{key}.json", meta)
+
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__size -= previous.get_size()
+
+            self.__entries[key] = entry
+            self.__size += entry.get_size()
+
+            self.__evict()
+
+    def remove(self, url: str):
+        """
+        Drops the entry for the url.
+        """
+        key = HttpCache.get_key(url)
+
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__size -= entry.get_size()
+
+            self.__delete(key)
+
+    def __delete(self, key: str):
+        (self.__directory / f"{key}.json").unlink(missing_ok=True)
+        (self.__directory / f"{key}.body").unlink(missing_ok=True)
+
+    def __evict(self):
+        while self.__size > self.__max_size and self.__entries:
+            key, entry = self.__entries.popitem(last=False)
+            self.__size -= entry.get_size()
+            self.__evictions += 1
+            self.__delete(key)
+
+    def clear(self):
+        """
+        Drops all entries.
+        """
+        with self.__lock:
+            for key in list(self.__entries):
+                self.__delete(key)
+
+            self.__entries.clear()
+            self.__size = 0
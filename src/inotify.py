@@ -0,0 +1,153 @@
+"""
+Minimal ctypes bindings for the linux inotify api.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import struct
+import threading
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# Any change to a file in a directory or the directory itself.
+IN_DIRECTORY_CHANGED = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+# How often a lost watch is re-added, e.g. after the directory was recreated.
+RETRY_INTERVAL = 5.0
+
+
+class InotifyException(Exception):
+    """
+    Thrown in case inotify is not available.
+    """
+
+
+class DirectoryWatch:
+    """
+    Calls the callback whenever something in the directory changes.
+
+    The directory may be deleted and recreated, the watch is re-added
+    as soon as it exists again.
+    """
+
+    def __init__(self, directory: pathlib.Path, on_change):
+        self.__directory = pathlib.Path(directory)
+        self.__on_change = on_change
+        self.__libc = None
+        self.__fd = None
+        self.__wd = None
+        self.__thread = None
+
+    def __get_libc(self):
+        if self.__libc:
+            return self.__libc
+
+        path = ctypes.util.find_library("c")
+        if not path:
+            raise InotifyException("Library c not found")
+
+        libc = ctypes.CDLL(path, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise InotifyException("inotify is not supported")
+
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.__libc = libc
+        return libc
+
+    def __add_watch(self) -> bool:
+        wd = self.__get_libc().inotify_add_watch(
+            self.__fd, bytes(self.__directory), IN_DIRECTORY_CHANGED | IN_ONLYDIR)
+
+        if wd < 0:
+            self.__wd = None
+            return False
+
+        self.__wd = wd
+        return True
+
+    def is_running(self) -> bool:
+        """
+        Checks if the watch is active.
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self):
+        """
+        Starts watching the directory in a background thread.
+        """
+        if self.is_running():
+            return
+
+        fd = self.__get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise InotifyException(
+                f"inotify_init1 failed with errno {ctypes.get_errno()}")
+
+        self.__fd = fd
+        self.__add_watch()
+
+        self.__thread = threading.Thread(
+            target=self.__run, name=f"inotify-{self.__directory.name}", daemon=True)
+        self.__thread.start()
+
+    def __read(self) -> bool:
+        """
+        Reads all pending events, returns true in case the watch was lost.
+        """
+        lost = False
+
+        try:
+            data = os.read(self.__fd, 4096)
+        except BlockingIOError:
+            return False
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_IGNORED:
+                lost = True
+
+        return lost
+
+    def __run(self):
+        while True:
+            timeout = None if self.__wd is not None else RETRY_INTERVAL
+            readable, _, _ = select.select([self.__fd], [], [], timeout)
+
+            if readable and self.__read():
+                self.__wd = None
+
+            if self.__wd is None:
+                # Changes happened while the directory was gone.
+                if not self.__add_watch():
+                    continue
+
+            try:
+                self.__on_change()
+            except Exception as ex:
+                logging.getLogger('flask.app').warning(
+                    "Failed to process changes in %s: %s", self.__directory, ex)
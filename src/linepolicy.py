@@ -0,0 +1,148 @@
+"""
+The electrical and event settings of the motion sensor's gpio line.
+"""
+
+from __future__ import annotations
+
+from src.gpio import (
+    GPIO_V2_LINE_FLAG_EVENT_CLOCK_HTE, GPIO_V2_LINE_FLAG_EVENT_CLOCK_REALTIME,
+    GpioV2LineConfig)
+
+BIAS_PULL_DOWN = "pull-down"
+BIAS_PULL_UP = "pull-up"
+BIAS_DISABLED = "disabled"
+# Keeps whatever the firmware or device tree configured.
+BIAS_AS_IS = "as-is"
+BIASES = (BIAS_PULL_DOWN, BIAS_PULL_UP, BIAS_DISABLED, BIAS_AS_IS)
+
+EDGES_BOTH = "both"
+# Only detections are reported, each one keeps the screen on for the delay.
+EDGES_RISING = "rising"
+EDGES = (EDGES_BOTH, EDGES_RISING)
+
+CLOCK_MONOTONIC = "monotonic"
+CLOCK_REALTIME = "realtime"
+CLOCK_HTE = "hte"
+CLOCKS = (CLOCK_MONOTONIC, CLOCK_REALTIME, CLOCK_HTE)
+
+# The kernel stores the period in microseconds as 32 bit value.
+MAX_DEBOUNCE = 60 * 1000
+
+
+class LinePolicyException(Exception):
+    """
+    Thrown in case a setting is invalid.
+    """
+
+
+class LinePolicy:
+    """
+    A validated line configuration which is translated into the
+    kernel's gpio line config.
+
+    The debounce period in milliseconds is applied by the kernel. A level
+    has to be stable for the period before an edge is reported, so a period
+    longer than the sensor's low phase between two detections hides it
+    from userspace at the cost of a delayed turn on.
+    """
+
+    def __init__(self, bias: str = BIAS_PULL_DOWN, edges: str = EDGES_BOTH,
+                 active_low: bool = False, debounce: int = 0,
+                 clock: str = CLOCK_MONOTONIC):
+
+        LinePolicy.__check_choice("Bias", bias, BIASES)
+        LinePolicy.__check_choice("Edges", edges, EDGES)
+        LinePolicy.__check_choice("Clock", clock, CLOCKS)
+
+        # A string like "false" would otherwise invert the sensor.
+        if not isinstance(active_low, bool):
+            raise LinePolicyException("Active low has to be true or false")
+
+        try:
+            debounce = int(debounce)
+        except (TypeError, ValueError) as ex:
+            raise LinePolicyException("Debounce has to be a number") from ex
+
+        if not 0 <= debounce <= MAX_DEBOUNCE:
+            raise LinePolicyException(f"Debounce has to be between 0 and {MAX_DEBOUNCE}")
+
+        self.__bias = bias
+        self.__edges = edges
+        self.__active_low = active_low
+        self.__debounce = debounce
+        self.__clock = clock
+
+    @staticmethod
+    def __check_choice(name: str, value: str, choices):
+        if value not in choices:
+            raise LinePolicyException(
+                f"Unknown {name.lower()} {value}, expected one of {', '.join(choices)}")
+
+    def get_edges(self) -> str:
+        """
+        Gets the edges which are reported.
+        """
+        return self.__edges
+
+    def get_debounce(self) -> int:
+        """
+        Gets the debounce period in milliseconds, zero if disabled.
+        """
+        return self.__debounce
+
+    def to_config(self, mask: int = 1) -> GpioV2LineConfig:
+        """
+        Returns the line config, the debounce applies to the lines in the mask.
+        """
+        config = GpioV2LineConfig()
+        config.enable_input()
+
+        if self.__bias == BIAS_PULL_DOWN:
+            config.enable_pull_down()
+        elif self.__bias == BIAS_PULL_UP:
+            config.enable_pull_up()
+        elif self.__bias == BIAS_DISABLED:
+            config.disable_bias()
+
+        config.enable_rising_edge()
+        if self.__edges == EDGES_BOTH:
+            config.enable_falling_edge()
+
+        if self.__active_low:
+            config.enable_active_low()
+
+        if self.__clock == CLOCK_REALTIME:
+            config.set_flag(GPIO_V2_LINE_FLAG_EVENT_CLOCK_REALTIME)
+        elif self.__clock == CLOCK_HTE:
+            config.set_flag(GPIO_V2_LINE_FLAG_EVENT_CLOCK_HTE)
+
+        if self.__debounce:
+            config.add_debounce(mask, self.__debounce * 1000)
+
+        return config
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the settings.
+        """
+        return {
+            "bias": self.__bias,
+            "edges": self.__edges,
+            "active_low": self.__active_low,
+            "debounce": self.__debounce,
+            "clock": self.__clock
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> LinePolicy:
+        """
+        Deserializes and validates the settings.
+        """
+        if not isinstance(data, dict):
+            raise LinePolicyException("Line settings have to be an object")
+
+        unknown = set(data) - set(LinePolicy().to_dict())
+        if unknown:
+            raise LinePolicyException(f"Unknown settings {', '.join(sorted(unknown))}")
+
+        return LinePolicy(**data)
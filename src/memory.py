@@ -0,0 +1,321 @@
+"""
+Watches chromium's memory usage and recycles the browser before the
+system starts to swap.
+"""
+
+import collections
+import logging
+import pathlib
+import subprocess
+import time
+from typing import Dict, List
+
+from src.reload import RELOAD_TIMEOUT
+from src.worker.background import PeriodicWorker
+
+PROC = pathlib.Path("/proc")
+PSI_MEMORY = PROC / "pressure" / "memory"
+
+CHROMIUM_NAMES = ("chromium", "chromium-browse", "chrome")
+
+DEFAULT_CHECK_INTERVAL = 30.0
+# Without an explicit limit chromium may use this fraction of the memory.
+DEFAULT_LIMIT_FRACTION = 0.5
+# Percentage of time tasks stalled on memory during the last minute.
+DEFAULT_PRESSURE_LIMIT = 10.0
+# How long a recycle waits for the display to be switched off.
+DEFAULT_QUIET_WAIT = 30 * 60
+# Beyond this factor of the limit the browser is recycled right away.
+HARD_LIMIT_FACTOR = 1.25
+# A recycled browser needs some time to settle, this prevents restart loops.
+RECYCLE_COOLDOWN = 10 * 60
+
+MAX_EVENTS = 50
+
+
+class MemoryException(Exception):
+    """
+    Thrown in case the memory usage can not be read.
+    """
+
+
+def get_total_memory(proc: pathlib.Path = PROC) -> int:
+    """
+    Returns the system's memory in bytes.
+    """
+    for line in (proc / "meminfo").read_text(encoding="utf-8").splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) * 1024
+
+    raise MemoryException("MemTotal missing in meminfo")
+
+
+def find_process_tree(names=CHROMIUM_NAMES, proc: pathlib.Path = PROC) -> List[int]:
+    """
+    Returns the processes with the given names along with all their
+    descendants, e.g. chromium's renderer and gpu processes.
+    """
+    parents = {}
+    roots = set()
+
+    for stat in proc.glob("[0-9]*/stat"):
+        try:
+            data = stat.read_text(encoding="utf-8")
+        except OSError:
+            continue
+
+        # The command is in braces and may contain spaces.
+        name = data[data.index("(") + 1:data.rindex(")")]
+        pid = int(stat.parent.name)
+        parents[pid] = int(data[data.rindex(")") + 2:].split()[1])
+
+        if name in names:
+            roots.add(pid)
+
+    tree = set(roots)
+    changed = True
+    while changed:
+        children = {pid for pid, ppid in parents.items() if ppid in tree} - tree
+        tree |= children
+        changed = bool(children)
+
+    return sorted(tree)
+
+
+def read_usage(pid: int, proc: pathlib.Path = PROC) -> Dict[str, int]:
+    """
+    Returns the process's resident and proportional set size in bytes.
+    The pss is None on kernels without smaps_rollup.
+    """
+    usage = {"rss": None, "pss": None}
+
+    try:
+        lines = (proc / str(pid) / "smaps_rollup").read_text(encoding="utf-8").splitlines()
+        keys = {"Rss:": "rss", "Pss:": "pss"}
+    except FileNotFoundError:
+        lines = (proc / str(pid) / "status").read_text(encoding="utf-8").splitlines()
+        keys = {"VmRSS:": "rss"}
+
+    for line in lines:
+        fields = line.split()
+        if fields and fields[0] in keys:
+            usage[keys[fields[0]]] = int(fields[1]) * 1024
+
+    return usage
+
+
+def read_pressure(path: pathlib.Path = PSI_MEMORY) -> Dict[str, Dict[str, float]]:
+    """
+    Parses the pressure stall information, None in case the kernel lacks psi.
+    """
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return None
+
+    pressure = {}
+    for line in lines:
+        kind, *values = line.split()
+        pressure[kind] = {
+            key: float(value) for key, value in (item.split("=") for item in values)}
+
+    return pressure
+
+
+class MemoryGovernor:
+    """
+    Periodically sums up the memory of chromium's process tree and
+    reads the system's memory pressure.
+
+    Once the limit is crossed the browser is recycled. The restart is
+    deferred until the display is off, unless the usage crosses the
+    hard limit or the quiet wait is over. The pressure is system wide,
+    so it only matters while chromium itself is over its limit, it then
+    recycles right away.
+    """
+
+    def __init__(self, browser, display, limit: int = None,
+                 pressure_limit: float = DEFAULT_PRESSURE_LIMIT,
+                 quiet_wait: float = DEFAULT_QUIET_WAIT,
+                 interval: float = DEFAULT_CHECK_INTERVAL,
+                 proc: pathlib.Path = PROC, pressure_file: pathlib.Path = PSI_MEMORY):
+
+        self.__browser = browser
+        self.__display = display
+        self.__proc = proc
+        self.__pressure_file = pressure_file
+        self.__limit = limit
+        self.__pressure_limit = pressure_limit
+        self.__quiet_wait = quiet_wait
+
+        self.__worker = PeriodicWorker("memory", self.__tick, interval)
+
+        self.__sample = None
+        self.__pending_since = None
+        self.__last_recycle = None
+        self.__events = collections.deque(maxlen=MAX_EVENTS)
+        self.__counters = {
+            "checks": 0, "over_limit": 0, "deferred": 0,
+            "recycles": 0, "forced_recycles": 0, "failures": 0}
+
+    def get_limit(self) -> int:
+        """
+        Gets the memory limit in bytes, by default a fraction of the system's memory.
+        """
+        if self.__limit is None:
+            self.__limit = int(get_total_memory(self.__proc) * DEFAULT_LIMIT_FRACTION)
+
+        return self.__limit
+
+    def get_status(self) -> dict:
+        """
+        Returns the latest sample, the limits, counters and recent events.
+        """
+        return {
+            "limit": self.get_limit(),
+            "pressure_limit": self.__pressure_limit,
+            "quiet_wait": self.__quiet_wait,
+            "sample": self.__sample,
+            "pending": self.__pending_since is not None,
+            "counters": dict(self.__counters),
+            "events": list(self.__events)
+        }
+
+    def __event(self, name: str, **details):
+        event = {"timestamp": time.time(), "event": name}
+        event.update(details)
+        self.__events.append(event)
+
+        logging.getLogger('flask.app').info("Memory governor: %s %s", name, details)
+
+    def sample(self) -> dict:
+        """
+        Reads the memory usage of the browser's process tree and the pressure.
+        """
+        rss = 0
+        pss = 0
+        processes = find_process_tree(proc=self.__proc)
+
+        for pid in processes:
+            try:
+                usage = read_usage(pid, self.__proc)
+            except (OSError, ValueError):
+                # The process exited in the meantime.
+                continue
+
+            rss += usage["rss"] or 0
+            if pss is not None and usage["pss"] is not None:
+                pss += usage["pss"]
+            else:
+                pss = None
+
+        pressure = read_pressure(self.__pressure_file)
+
+        self.__sample = {
+            "timestamp": time.time(),
+            "processes": len(processes),
+            "rss": rss,
+            "pss": pss,
+            "pressure": pressure["some"]["avg60"] if pressure else None
+        }
+        return self.__sample
+
+    def __is_quiet(self) -> bool:
+        try:
+            return self.__display.is_off()
+        except (OSError, subprocess.CalledProcessError):
+            return False
+
+    def check(self):
+        """
+        Samples once and recycles the browser in case it is over its limits.
+        """
+        sample = self.sample()
+        self.__counters["checks"] += 1
+
+        now = time.monotonic()
+        if self.__last_recycle is not None and now - self.__last_recycle < RECYCLE_COOLDOWN:
+            return
+
+        # The pss splits shared pages fairly between the processes.
+        usage = sample["pss"] if sample["pss"] is not None else sample["rss"]
+        limit = self.get_limit()
+        pressure = sample["pressure"] is not None and sample["pressure"] > self.__pressure_limit
+
+        if not sample["processes"] or usage <= limit:
+            if self.__pending_since is not None:
+                self.__event("recovered", usage=usage)
+            self.__pending_since = None
+            return
+
+        if self.__pending_since is None:
+            self.__pending_since = now
+            self.__counters["over_limit"] += 1
+            self.__event("over_limit", usage=usage, limit=limit, pressure=sample["pressure"])
+
+        if self.__is_quiet():
+            self.recycle("display_off")
+            return
+
+        if usage > limit * HARD_LIMIT_FACTOR:
+            self.recycle("hard_limit", forced=True)
+            return
+
+        if pressure:
+            self.recycle("pressure", forced=True)
+            return
+
+        if now - self.__pending_since >= self.__quiet_wait:
+            self.recycle("quiet_wait_expired", forced=True)
+            return
+
+        self.__counters["deferred"] += 1
+
+    def recycle(self, reason: str, forced: bool = False):
+        """
+        Restarts the browser to release its memory.
+        """
+        self.__event("recycle", reason=reason)
+
+        self.__pending_since = None
+        self.__last_recycle = time.monotonic()
+
+        handle = self.__browser.restart()
+
+        if not handle.wait(RELOAD_TIMEOUT):
+            self.__counters["failures"] += 1
+            self.__event("recycle_failed", error="Browser restart timed out")
+            return
+
+        if handle.get_error() is not None:
+            self.__counters["failures"] += 1
+            self.__event("recycle_failed", error=str(handle.get_error()))
+            return
+
+        self.__counters["recycles"] += 1
+        if forced:
+            self.__counters["forced_recycles"] += 1
+
+    def is_running(self) -> bool:
+        """
+        Checks if the governor is watching the browser.
+        """
+        return self.__worker.is_running()
+
+    def start(self):
+        """
+        Starts watching in a background thread.
+        """
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops watching.
+        """
+        self.__worker.stop()
+
+    def __tick(self):
+        try:
+            self.check()
+        except (OSError, ValueError, MemoryException) as ex:
+            logging.getLogger('flask.app').warning("Memory check failed: %s", ex)
@@ -1,53 +1,250 @@
 """
 Implements a logic for a motion sensor.
 """
+
+from __future__ import annotations
+
 from enum import Enum
+import functools
 import logging
-import os
+import re
 import threading
-from src.gpio import GpioDevice, GpioV2LineConfig
+import time
+from typing import Dict, List
+
+from src.gpio import GPIO_V2_LINES_MAX, GpioDevice, GpioLine
+from src.gpioloop import GpioEventLoop
+from src.linepolicy import EDGES_RISING, LinePolicy
+from src.scheduler import DeadlineScheduler
 from src.display import Display
 
+DEFAULT_CHIP = "/dev/gpiochip0"
+DEFAULT_LINE = 18
+DEFAULT_ZONE = "default"
+DEFAULT_SENSOR_NAME = "default"
+
+# The screen is on while any sensor is active.
+AGGREGATION_ANY = "any"
+# The screen is on while at least the quorum of sensors is active.
+AGGREGATION_QUORUM = "quorum"
+AGGREGATIONS = (AGGREGATION_ANY, AGGREGATION_QUORUM)
+
+REGEX_CHIP = re.compile(r"^/dev/gpiochip[0-9]+$")
+
+
+class MotionSensorException(Exception):
+    """
+    Thrown in case a sensor's settings are invalid.
+    """
+
+
 class MotionSensorState(Enum):
     """
     Small state machine to track the gpio monitors states.
     """
     IDLE = 1
     RUNNING = 2
-    STOPPING = 3
+
+
+class Sensor:
+    """
+    A motion sensor wired to a gpio line. Without an own delay the
+    motion sensor's delay is used.
+    """
+
+    def __init__(self, name: str = DEFAULT_SENSOR_NAME, chip: str = DEFAULT_CHIP,
+                 line: int = DEFAULT_LINE, delay: float = None, zone: str = DEFAULT_ZONE):
+
+        if not isinstance(name, str) or not name:
+            raise MotionSensorException("Sensor name has to be a non empty string")
+
+        if not isinstance(chip, str) or not REGEX_CHIP.match(chip):
+            raise MotionSensorException(f"Invalid gpio chip {chip}")
+
+        if not isinstance(zone, str):
+            raise MotionSensorException("Zone has to be a string")
+
+        try:
+            line = int(line)
+            delay = None if delay is None else float(delay)
+        except (TypeError, ValueError) as ex:
+            raise MotionSensorException("Line and delay have to be numbers") from ex
+
+        if line < 0:
+            raise MotionSensorException(f"Invalid gpio line {line}")
+
+        if delay is not None and delay < 0:
+            raise MotionSensorException("Delay can not be negative")
+
+        self.__name = name
+        self.__chip = chip
+        self.__line = line
+        self.__delay = delay
+        self.__zone = zone
+
+        self.__active = False
+        self.__last_event = None
+        self.__counters = {"events": 0, "activations": 0}
+
+    def get_name(self) -> str:
+        """
+        Gets the sensor's unique name.
+        """
+        return self.__name
+
+    def get_chip(self) -> str:
+        """
+        Gets the gpio chip, e.g. /dev/gpiochip0
+        """
+        return self.__chip
+
+    def get_line(self) -> int:
+        """
+        Gets the line offset on the chip.
+        """
+        return self.__line
+
+    def get_delay(self) -> float:
+        """
+        Gets the sensor's delay, None in case the default is used.
+        """
+        return self.__delay
+
+    def get_zone(self) -> str:
+        """
+        Gets the zone the sensor watches.
+        """
+        return self.__zone
+
+    def is_active(self) -> bool:
+        """
+        Checks if the sensor detected motion within its delay.
+        """
+        return self.__active
+
+    def set_active(self, active: bool):
+        """
+        Marks the sensor as active or idle.
+        """
+        if active and not self.__active:
+            self.__counters["activations"] += 1
+
+        self.__active = active
+
+    def count_event(self):
+        """
+        Counts an edge reported by the sensor.
+        """
+        self.__counters["events"] += 1
+        self.__last_event = time.time()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the sensor's settings along with its counters.
+        """
+        stats = self.to_dict()
+        stats.update(self.__counters)
+        stats["active"] = self.__active
+        stats["last_event"] = self.__last_event
+        return stats
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the settings.
+        """
+        return {
+            "name": self.__name,
+            "chip": self.__chip,
+            "line": self.__line,
+            "delay": self.__delay,
+            "zone": self.__zone
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> Sensor:
+        """
+        Deserializes and validates the settings.
+        """
+        if not isinstance(data, dict):
+            raise MotionSensorException("Sensor has to be an object")
+
+        unknown = set(data) - set(Sensor().to_dict())
+        if unknown:
+            raise MotionSensorException(f"Unknown sensor settings {', '.join(sorted(unknown))}")
+
+        return Sensor(**data)
+
 
 class MotionSensor:
     """
-    Controls a screen with a motion sensor.
+    Controls a screen with one or more motion sensors.
+
+    The sensors' lines are requested per chip with a single line request
+    and served by the gpio event loop. A sensor stays active until its
+    delay passed after the motion ended. The screen is on while enough
+    sensors are active.
     """
 
-    def __init__(self, display: Display, delay:int):
-        self.__device = "/dev/gpiochip0"
-        self.__line = 18
+    def __init__(self, display: Display, delay:int, loop: GpioEventLoop = None,
+                 policy: LinePolicy = None, sensors: List[Sensor] = None,
+                 aggregation: str = AGGREGATION_ANY, quorum: int = 1,
+                 scheduler: DeadlineScheduler = None):
+
+        if loop is None:
+            loop = GpioEventLoop()
+
+        if scheduler is None:
+            scheduler = DeadlineScheduler()
+
+        if policy is None:
+            policy = LinePolicy()
+
         self.__state = MotionSensorState.IDLE
+        self.__lock = threading.RLock()
 
         self.__display = display
-        self.__timer = None
-        self.__worker = None
+        self.__loop = loop
+        self.__scheduler = scheduler
+        self.__policy = policy
         self.__delay = delay
 
-    def _start_timeout(self, delay:float, callback):
+        self.__lines = {}
+        self.__timers = {}
+        # Keyed by line request like the lines, released ones are summed up.
+        self.__dropped = {}
+        self.__dropped_released = 0
+        self.__wakeups = 0
+        # Unknown until the first change, which switches the screen.
+        self.__screen_on = None
+
+        self.__sensors = []
+        self.__aggregation = AGGREGATION_ANY
+        self.__quorum = 1
+        self.set_sensors(sensors or [Sensor()], aggregation, quorum)
+
+    def _start_timeout(self, sensor: Sensor):
         """
-        Starts a deferred function call.
-        The delay as float.
+        Marks the sensor idle once its delay passed, a pending timeout
+        of the sensor is replaced.
         """
-        self.__timer = threading.Timer(float(delay), callback)
-        self.__timer.start()
+        delay = sensor.get_delay()
+        if delay is None:
+            delay = self.__delay
 
-    def _cancel_timeout(self):
+        self._cancel_timeout(sensor)
+        self.__timers[sensor.get_name()] = self.__scheduler.call_later(
+            delay, self.__expire, sensor)
+
+    def _cancel_timeout(self, sensor: Sensor = None):
         """
-        Cancels a deferred function call in case it is active.
+        Cancels the sensor's pending timeout, without a sensor all of them.
         """
-        if not self.__timer:
-            return
+        names = [sensor.get_name()] if sensor else list(self.__timers)
 
-        self.__timer.cancel()
-        self.__timer = None
+        for name in names:
+            deadline = self.__timers.pop(name, None)
+            if deadline:
+                deadline.cancel()
 
     def get_delay(self) -> int:
         """
@@ -61,88 +258,322 @@ class MotionSensor:
         """
         self.__delay = delay
 
+    def get_sensors(self) -> List[Sensor]:
+        """
+        Gets the registered sensors.
+        """
+        return list(self.__sensors)
+
+    @staticmethod
+    def __check_sensors(sensors: List[Sensor]):
+        names = [sensor.get_name() for sensor in sensors]
+        if not names or len(set(names)) != len(names):
+            raise MotionSensorException("At least one sensor with a unique name is needed")
+
+        lines = [(sensor.get_chip(), sensor.get_line()) for sensor in sensors]
+        if len(set(lines)) != len(lines):
+            raise MotionSensorException("Sensors can not share a gpio line")
+
+    @staticmethod
+    def __check_aggregation(aggregation: str, quorum, count: int) -> int:
+        if aggregation not in AGGREGATIONS:
+            raise MotionSensorException(
+                f"Unknown aggregation {aggregation}, expected one of {', '.join(AGGREGATIONS)}")
+
+        try:
+            quorum = int(quorum)
+        except (TypeError, ValueError) as ex:
+            raise MotionSensorException("Quorum has to be a number") from ex
+
+        if not 1 <= quorum <= count:
+            raise MotionSensorException(f"Quorum has to be between 1 and {count}")
+
+        return quorum
+
+    def set_sensors(self, sensors: List[Sensor], aggregation: str = None, quorum: int = None):
+        """
+        Replaces the registered sensors and optionally how they are combined.
+        Everything is validated before anything changes. The lines are
+        requested again, in case this fails the previous sensors are kept.
+        """
+        if aggregation is None:
+            aggregation = self.__aggregation
+
+        if quorum is None:
+            quorum = min(self.__quorum, len(sensors))
+
+        MotionSensor.__check_sensors(sensors)
+        quorum = MotionSensor.__check_aggregation(aggregation, quorum, len(sensors))
+
+        enabled = self.is_enabled()
+        if enabled:
+            self.disable()
+
+        with self.__lock:
+            previous = (self.__sensors, self.__aggregation, self.__quorum)
+            self.__sensors = list(sensors)
+            self.__aggregation = aggregation
+            self.__quorum = quorum
+
+        if not enabled:
+            return
+
+        try:
+            self.enable()
+        except MotionSensorException:
+            # Keep monitoring the previous sensors.
+            with self.__lock:
+                self.__sensors, self.__aggregation, self.__quorum = previous
+            self.enable()
+            raise
+
+    def get_aggregation(self) -> str:
+        """
+        Gets how the sensors are combined, either any or quorum.
+        """
+        return self.__aggregation
+
+    def get_quorum(self) -> int:
+        """
+        Gets how many sensors need to be active in quorum mode.
+        """
+        return self.__quorum
+
+    def set_aggregation(self, aggregation: str, quorum: int = 1):
+        """
+        Sets how the sensors are combined.
+        """
+        quorum = MotionSensor.__check_aggregation(aggregation, quorum, len(self.__sensors))
+
+        with self.__lock:
+            self.__aggregation = aggregation
+            self.__quorum = quorum
+            self.__update()
+
+    def get_dropped_events(self) -> int:
+        """
+        Returns how many gpio events were lost, e.g. because they were not read in time.
+        """
+        with self.__lock:
+            return self.__dropped_released + sum(self.__dropped.values())
+
+    def get_wakeups(self) -> int:
+        """
+        Returns how often the sensors' events woke up the gpio thread.
+        """
+        return self.__wakeups
+
+    def get_policy(self) -> LinePolicy:
+        """
+        Gets the line configuration.
+        """
+        return self.__policy
+
+    def set_policy(self, policy: LinePolicy):
+        """
+        Sets the line configuration, requested lines are reconfigured in place.
+        The policy is only taken over in case every line accepted it.
+        """
+        with self.__lock:
+            applied = []
+            try:
+                for lines in self.__lines.values():
+                    lines.set_config(policy.to_config(self.__get_mask(lines)))
+                    applied.append(lines)
+            except OSError:
+                # Lines which were reconfigured already go back to the old policy.
+                for lines in applied:
+                    lines.set_config(self.__policy.to_config(self.__get_mask(lines)))
+                raise
+
+            self.__policy = policy
+
     def is_enabled(self) -> bool:
         """
         Checks if the motion sensor is enabled.
         """
         return self.__state != MotionSensorState.IDLE
 
-    def run(self):
+    @staticmethod
+    def __get_mask(lines: GpioLine) -> int:
+        # The debounce applies to all lines of a request.
+        return (1 << len(lines.get_lines())) - 1
+
+    def __is_present(self) -> bool:
+        active = sum(1 for sensor in self.__sensors if sensor.is_active())
+
+        if self.__aggregation == AGGREGATION_QUORUM:
+            return active >= self.__quorum
+
+        return active > 0
+
+    def __update(self, motion: bool = False):
+        if self.__state is MotionSensorState.IDLE:
+            return
+
+        # A new motion turns the screen on even if it was switched off meanwhile.
+        present = self.__is_present()
+        if present == self.__screen_on and not (present and motion):
+            return
+
+        self.__screen_on = present
+        if present:
+            self.turn_on()
+        else:
+            self.turn_off()
+
+    def __expire(self, sensor: Sensor):
+        with self.__lock:
+            # The timeout was cancelled or replaced while it waited for the lock.
+            deadline = self.__timers.get(sensor.get_name())
+            if deadline is None or not deadline.is_fired():
+                return
+
+            del self.__timers[sensor.get_name()]
+            sensor.set_active(False)
+            self.__update()
+
+    def on_events(self, chip: str, lines: GpioLine, events):
         """
-        Used by the thread to run the blocking call to the gpio monitor.
+        Called by the event loop with a batch of edge events of a chip's lines.
         """
-        if self.__state is not MotionSensorState.IDLE:
-            self.__state = MotionSensorState.RUNNING
-            return
+        with self.__lock:
+            # A chip may have several line requests, each counts on its own.
+            if self.__lines.get(lines.get_fd()) is lines:
+                self.__dropped[lines.get_fd()] = lines.get_dropped()
+            self.__wakeups += 1
+
+            if self.__state is MotionSensorState.IDLE:
+                return
+
+            sensors = {sensor.get_line(): sensor
+                       for sensor in self.__sensors if sensor.get_chip() == chip}
+
+            # Only the latest edge of a batch matters for each sensor.
+            latest = {}
+            motion = False
+            for event in events:
+                if event.offset in sensors:
+                    sensors[event.offset].count_event()
+                    latest[event.offset] = event
+
+            for offset, event in latest.items():
+                sensor = sensors[offset]
+                self._cancel_timeout(sensor)
 
-        self.__state = MotionSensorState.RUNNING
+                if event.is_rising():
+                    sensor.set_active(True)
+                    motion = True
 
+                # The sensor goes low for three seconds between
+                # consultive samples. Means any off signal need to be low
+                # for way more than three seconds.
+                # Otherwise we'll resonate between the on and off state.
+                # Without falling edges every detection restarts the timeout.
+                if not event.is_rising() or self.__policy.get_edges() == EDGES_RISING:
+                    self._start_timeout(sensor)
+
+            self.__update(motion)
+
+    def __request(self, chip: str, offsets: List[int]) -> List[GpioLine]:
+        requests = []
+
+        # The line request stays valid after the chip is closed.
+        with GpioDevice(chip) as dev:
+            for index in range(0, len(offsets), GPIO_V2_LINES_MAX):
+                chunk = offsets[index:index + GPIO_V2_LINES_MAX]
+                requests.append(dev.get_lines(
+                    "kiosk", chunk, self.__policy.to_config((1 << len(chunk)) - 1)))
+
+        return requests
+
+    def __read_levels(self, chip: str, lines: GpioLine):
+        # Sensors seeing motion right now count as active, they report no
+        # rising edge until the motion ended.
         try:
-            with GpioDevice(self.__device) as dev:
-                config = GpioV2LineConfig()
-                config.enable_input()
-                config.enable_pull_down()
-                config.enable_rising_edge()
-                config.enable_falling_edge()
-
-                lines = dev.get_lines("kiosk", [self.__line], config)
-
-                while self.__state is MotionSensorState.RUNNING:
-                    os.read(lines.get_fd(), 48)
-                    active = lines.get_active()
-
-                    if active[self.__line] is True:
-                        self.turn_on()
-                        continue
-
-                    # The sensor goes low for three seconds between
-                    # consultive samples. Means any off signal need to be low
-                    # for way more than three seconds.
-                    # Otherwise we'll resonate between the on and off state.
-                    self._start_timeout(self.__delay, self.turn_off)
-        finally:
-            self.__state = MotionSensorState.IDLE
+            levels = lines.get_active()
+        except OSError as ex:
+            logging.getLogger('flask.app').warning("Failed to read gpio levels: %s", ex)
+            return
+
+        for sensor in self.__sensors:
+            if sensor.get_chip() == chip and levels.get(sensor.get_line()):
+                sensor.set_active(True)
 
     def enable(self):
         """
-        Starts monitoring the motion sensor.
+        Starts monitoring the motion sensors. Lines on the same chip share
+        a single line request. Raises a MotionSensorException in case the
+        lines can not be requested, e.g. because they are busy.
         """
 
         if self.__state is MotionSensorState.RUNNING:
             return
 
-        # In case it is stopping the just cancel the stop request.
-        if self.__state is MotionSensorState.STOPPING:
+        chips: Dict[str, List[int]] = {}
+        for sensor in self.__sensors:
+            chips.setdefault(sensor.get_chip(), []).append(sensor.get_line())
+
+        requested = []
+        try:
+            for chip, offsets in chips.items():
+                requested.extend((chip, lines) for lines in self.__request(chip, offsets))
+        except OSError as ex:
+            for _, lines in requested:
+                lines.close()
+            raise MotionSensorException(f"Failed to request gpio lines: {ex}") from ex
+
+        with self.__lock:
             self.__state = MotionSensorState.RUNNING
-            return
+            self.__screen_on = None
 
-        self.__worker = threading.Thread(target=self.run)
-        self.__worker.start()
+            for chip, lines in requested:
+                self.__read_levels(chip, lines)
+                self.__lines[lines.get_fd()] = lines
+                self.__loop.add_line(lines, functools.partial(self.on_events, chip))
 
     def disable(self):
         """
-        Stops monitoring the motion sensor.
+        Stops monitoring the motion sensors. It returns once the lines
+        are released, so that they can be requested again right away.
         """
 
-        self._cancel_timeout()
-        self.__state = MotionSensorState.STOPPING
+        with self.__lock:
+            self._cancel_timeout()
+
+            for sensor in self.__sensors:
+                sensor.set_active(False)
+
+            if self.__state is MotionSensorState.IDLE:
+                return
+
+            self.__state = MotionSensorState.IDLE
+            requested = self.__lines
+            self.__lines = {}
+
+            for fd in requested:
+                self.__dropped_released += self.__dropped.pop(fd, 0)
+
+        # The loop's thread may wait for the lock in a handler.
+        for lines in requested.values():
+            if not self.__loop.remove_line(lines, wait=True):
+                logging.getLogger('flask.app').warning(
+                    "Gpio lines %s were not released in time", lines.get_lines())
 
     def turn_on(self):
         """
-        Cancels any turn off timers and turns the screen on.
+        Turns the screen on.
         """
         logging.getLogger('flask.app').debug("Turning Screen On")
-        self._cancel_timeout()
 
         if self.__display.is_off():
             self.__display.on()
 
     def turn_off(self):
         """
-        Turns off the screen.        
+        Turns off the screen.
         """
 
-        logging.getLogger('flask.app').debug("Turning Screen On")
+        logging.getLogger('flask.app').debug("Turning Screen Off")
 
-        self._cancel_timeout()
         self.__display.off()
@@ -0,0 +1,430 @@
+"""
+Rotates the browser through a list of pages.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import re
+import time
+from typing import List
+
+from src.cdp import CdpClient, CdpException
+from src.worker.background import BackgroundWorker
+
+DEFAULT_DWELL = 60
+MIN_DWELL = 5
+
+# The next page is loaded this many seconds before it is shown.
+PRELOAD_LEAD = 10.0
+# How long to wait beyond the dwell time for a slow page to finish loading.
+PRELOAD_GRACE = 5.0
+PRELOAD_POLL_INTERVAL = 0.25
+
+# How often the schedule is checked while no item is active.
+IDLE_INTERVAL = 30.0
+
+REGEX_TIME = re.compile(r"^(?P<hour>[01]?\d|2[0-3]):(?P<minute>[0-5]\d)$")
+
+
+class PlaylistException(Exception):
+    """
+    Thrown in case a playlist is invalid.
+    """
+
+
+class ScheduleWindow:
+    """
+    A daily time window in which an item may be shown. Windows which
+    end before they start span midnight.
+    """
+
+    def __init__(self, start: str, end: str, days: List[int] = None):
+        self.__start = ScheduleWindow.parse_time(start)
+        self.__end = ScheduleWindow.parse_time(end)
+
+        if days is not None and any(day not in range(7) for day in days):
+            raise PlaylistException(f"Invalid weekdays {days}, expected 0 (monday) to 6")
+
+        self.__days = days
+
+    @staticmethod
+    def parse_time(value: str) -> datetime.time:
+        """
+        Parses a time in the format HH:MM.
+        """
+        match = REGEX_TIME.match(str(value))
+        if not match:
+            raise PlaylistException(f"Invalid time {value}, expected HH:MM")
+
+        return datetime.time(int(match.group("hour")), int(match.group("minute")))
+
+    def contains(self, now: datetime.datetime) -> bool:
+        """
+        Checks if the point in time is within the window.
+        """
+        current = now.time()
+
+        if self.__start <= self.__end:
+            return (self.__is_day(now.weekday())
+                    and self.__start <= current < self.__end)
+
+        # Past midnight the window belongs to the previous day.
+        if current >= self.__start:
+            return self.__is_day(now.weekday())
+
+        return current < self.__end and self.__is_day((now.weekday() - 1) % 7)
+
+    def __is_day(self, weekday: int) -> bool:
+        return self.__days is None or weekday in self.__days
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the window.
+        """
+        return {
+            "start": self.__start.strftime("%H:%M"),
+            "end": self.__end.strftime("%H:%M"),
+            "days": self.__days
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> ScheduleWindow:
+        """
+        Deserializes a window.
+        """
+        return ScheduleWindow(data.get("start"), data.get("end"), data.get("days"))
+
+
+class PlaylistItem:
+    """
+    A page which is shown for the dwell time, optionally limited to schedule windows.
+    """
+
+    def __init__(self, url: str, dwell: float = DEFAULT_DWELL,
+                 schedule: List[ScheduleWindow] = None):
+        if not url:
+            raise PlaylistException("Playlist item without url")
+
+        if float(dwell) < MIN_DWELL:
+            raise PlaylistException(f"Dwell time must be at least {MIN_DWELL} seconds")
+
+        self.__url = url
+        self.__dwell = float(dwell)
+        self.__schedule = schedule or []
+
+    def get_url(self) -> str:
+        """
+        Gets the page's url.
+        """
+        return self.__url
+
+    def get_dwell(self) -> float:
+        """
+        Gets the time in seconds the page is shown.
+        """
+        return self.__dwell
+
+    def get_schedule(self) -> List[ScheduleWindow]:
+        """
+        Gets the windows in which the page may be shown, empty means always.
+        """
+        return self.__schedule
+
+    def is_active(self, now: datetime.datetime) -> bool:
+        """
+        Checks if the item may be shown at the given point in time.
+        """
+        if not self.__schedule:
+            return True
+
+        return any(window.contains(now) for window in self.__schedule)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the item.
+        """
+        return {
+            "url": self.__url,
+            "dwell": self.__dwell,
+            "schedule": [window.to_dict() for window in self.__schedule]
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> PlaylistItem:
+        """
+        Deserializes an item.
+        """
+        return PlaylistItem(
+            data.get("url"), data.get("dwell", DEFAULT_DWELL),
+            [ScheduleWindow.from_dict(window) for window in data.get("schedule") or []])
+
+
+class Playlist:
+    """
+    An ordered list of items.
+    """
+
+    def __init__(self, items: List[PlaylistItem] = None):
+        self.__items = items or []
+
+    def get_items(self) -> List[PlaylistItem]:
+        """
+        Returns all items.
+        """
+        return self.__items
+
+    def get_next(self, index: int, now: datetime.datetime) -> int:
+        """
+        Returns the index of the first active item after the given
+        index, it wraps around. None means no item is active.
+        """
+        count = len(self.__items)
+
+        for offset in range(1, count + 1):
+            candidate = (index + offset) % count
+            if self.__items[candidate].is_active(now):
+                return candidate
+
+        return None
+
+    def to_list(self) -> list:
+        """
+        Serializes the playlist.
+        """
+        return [item.to_dict() for item in self.__items]
+
+    @staticmethod
+    def from_list(data: list) -> Playlist:
+        """
+        Deserializes the playlist.
+        """
+        if not isinstance(data, list):
+            raise PlaylistException("Playlist has to be a list of items")
+
+        return Playlist([PlaylistItem.from_dict(item) for item in data])
+
+
+class PreloadedPage:
+    """
+    A hidden tab which loads the next item in the background.
+    """
+
+    def __init__(self, cdp: CdpClient, url: str):
+        self.__cdp = cdp
+        self.__url = url
+
+        # Create it blank first, so that the session listeners can apply
+        # the emulation before the page starts to layout.
+        self.__target_id = cdp.call_browser(
+            "Target.createTarget", {"url": "about:blank", "background": True})["targetId"]
+
+        self.__connection = None
+
+        try:
+            self.__connection = cdp.open_page(self.__target_id)
+            self.__call("Page.navigate", {"url": url})
+        except CdpException:
+            self.discard()
+            raise
+
+    def __call(self, method: str, params: dict) -> dict:
+        try:
+            return self.__connection.call(method, params)
+        except (OSError, ValueError) as ex:
+            raise CdpException(f"{method} failed: {ex}") from ex
+
+    def get_url(self) -> str:
+        """
+        Gets the url being loaded.
+        """
+        return self.__url
+
+    def is_ready(self) -> bool:
+        """
+        Checks if the page finished loading.
+        """
+        result = self.__call(
+            "Runtime.evaluate", {"expression": "document.readyState", "returnByValue": True})
+
+        return result.get("result", {}).get("value") == "complete"
+
+    def show(self):
+        """
+        Brings the tab to the front and closes the previous page.
+        """
+        with self.__cdp.get_lock():
+            previous = self.__cdp.get_page_id()
+
+            self.__cdp.call_browser("Target.activateTarget", {"targetId": self.__target_id})
+            self.__cdp.set_page(self.__target_id, self.__connection)
+
+            if previous != self.__target_id:
+                self.__cdp.call_browser("Target.closeTarget", {"targetId": previous})
+
+    def discard(self):
+        """
+        Closes the hidden tab.
+        """
+        if self.__connection is not None:
+            try:
+                self.__connection.close()
+            except OSError:
+                pass
+
+        try:
+            self.__cdp.call_browser("Target.closeTarget", {"targetId": self.__target_id})
+        except CdpException:
+            pass
+
+
+class PlaylistPlayer:
+    """
+    Shows the playlist's items one after another.
+
+    The next item is preloaded in a hidden tab while the current one
+    is shown. At the end of the dwell time the tabs are swapped, so
+    that a loading page is never visible.
+    """
+
+    def __init__(self, cdp: CdpClient, playlist: Playlist = None):
+        self.__cdp = cdp
+        self.__playlist = playlist or Playlist()
+        self.__worker = BackgroundWorker("playlist", self.__run)
+        # Guards the playlist as well, so that a new one wakes the player.
+        self.__condition = self.__worker.get_condition()
+        self.__index = -1
+        self.__swaps = 0
+
+    def get_playlist(self) -> Playlist:
+        """
+        Gets the playlist being played.
+        """
+        return self.__playlist
+
+    def set_playlist(self, playlist: Playlist):
+        """
+        Replaces the playlist, it starts over with the first item.
+        """
+        with self.__condition:
+            self.__playlist = playlist
+            self.__index = -1
+            self.__condition.notify_all()
+
+    def get_current(self) -> PlaylistItem:
+        """
+        Returns the item currently shown or None.
+        """
+        items = self.__playlist.get_items()
+
+        if 0 <= self.__index < len(items):
+            return items[self.__index]
+
+        return None
+
+    def get_swaps(self) -> int:
+        """
+        Returns how often a preloaded page was swapped in.
+        """
+        return self.__swaps
+
+    def is_running(self) -> bool:
+        """
+        Checks if the player is running.
+        """
+        return self.__worker.is_running()
+
+    def start(self):
+        """
+        Starts playing in a background thread.
+        """
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops playing, the current page stays visible.
+        """
+        with self.__condition:
+            self.__index = -1
+            self.__worker.stop()
+
+    def __wait_until(self, deadline: float, playlist: Playlist) -> bool:
+        """
+        Sleeps until the deadline, returns false in case the player
+        was stopped or the playlist replaced in the meantime.
+        """
+        with self.__condition:
+            while self.__worker.is_running() and self.__playlist is playlist:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+
+                self.__condition.wait(remaining)
+
+            return False
+
+    def __play_next(self, playlist: Playlist, shown_at: float, dwell: float):
+        """
+        Preloads the next item and swaps it in once the current one's
+        dwell time is over. Returns the new show time and dwell time.
+        """
+        preload_at = shown_at + max(dwell - PRELOAD_LEAD, dwell / 2)
+        if not self.__wait_until(preload_at, playlist):
+            return None
+
+        index = playlist.get_next(self.__index, datetime.datetime.now())
+
+        # Nothing else to show, keep the current page.
+        if index is None or index == self.__index:
+            if not self.__wait_until(shown_at + (dwell or IDLE_INTERVAL), playlist):
+                return None
+
+            if index is None:
+                return time.monotonic(), IDLE_INTERVAL
+
+            return time.monotonic(), playlist.get_items()[index].get_dwell()
+
+        item = playlist.get_items()[index]
+        page = PreloadedPage(self.__cdp, item.get_url())
+
+        try:
+            if not self.__wait_until(shown_at + dwell, playlist):
+                page.discard()
+                return None
+
+            # Give slow pages some extra time, but never wait forever.
+            deadline = time.monotonic() + PRELOAD_GRACE
+            while not page.is_ready() and time.monotonic() < deadline:
+                if not self.__wait_until(time.monotonic() + PRELOAD_POLL_INTERVAL, playlist):
+                    page.discard()
+                    return None
+
+            page.show()
+        except CdpException:
+            page.discard()
+            raise
+
+        self.__index = index
+        self.__swaps += 1
+
+        return time.monotonic(), item.get_dwell()
+
+    def __run(self):
+        while self.__worker.is_running():
+            with self.__condition:
+                playlist = self.__playlist
+
+            shown_at, dwell = time.monotonic(), 0.0
+
+            while True:
+                try:
+                    result = self.__play_next(playlist, shown_at, dwell)
+                except CdpException as ex:
+                    logging.getLogger('flask.app').warning("Playlist failed to swap page: %s", ex)
+                    result = (time.monotonic(), IDLE_INTERVAL)
+
+                if result is None:
+                    break
+
+                shown_at, dwell = result
@@ -0,0 +1,166 @@
+"""
+Coalesces browser reloads and window manager restarts.
+"""
+
+import logging
+import threading
+import time
+
+# Requests within this window are merged into a single restart.
+DEFAULT_COALESCE_DELAY = 0.5
+
+# How long callers wait for a reload, a browser restart includes waiting
+# for chromium to answer again.
+RELOAD_TIMEOUT = 60.0
+
+# The kinds are ordered, a stronger one includes the weaker ones. Restarting
+# the window manager restarts the browser, as the browser service requires it.
+RELOAD_BROWSER = 1
+RESTART_BROWSER = 2
+RESTART_DISPLAY = 3
+
+KIND_NAMES = {
+    RELOAD_BROWSER: "reload_browser",
+    RESTART_BROWSER: "restart_browser",
+    RESTART_DISPLAY: "restart_display"
+}
+
+
+class ReloadHandle:
+    """
+    Tracks a requested reload until it was executed.
+    """
+
+    def __init__(self, kind: int):
+        self.__kind = kind
+        self.__executed = None
+        self.__error = None
+        self.__done = threading.Event()
+
+    def get_kind(self) -> int:
+        """
+        Gets the requested kind of reload.
+        """
+        return self.__kind
+
+    def get_executed(self) -> int:
+        """
+        Gets the kind which was actually executed, it may be a stronger
+        one in case requests were merged. None while pending.
+        """
+        return self.__executed
+
+    def get_error(self) -> Exception:
+        """
+        Returns the error raised by the reload or None.
+        """
+        return self.__error
+
+    def is_done(self) -> bool:
+        """
+        Checks if the reload finished.
+        """
+        return self.__done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits until the reload finished, returns false on timeout.
+        """
+        return self.__done.wait(timeout)
+
+    def resolve(self, executed: int, error: Exception = None):
+        """
+        Marks the reload as finished.
+        """
+        self.__executed = executed
+        self.__error = error
+        self.__done.set()
+
+
+class ReloadScheduler:
+    """
+    Every reload and restart goes through the scheduler.
+
+    Requests arriving within a short window are merged into the
+    strongest one, so that e.g. a browser reload followed by a window
+    manager restart ends in a single restart. Only one reload runs at a
+    time, requests arriving meanwhile are merged into the next one.
+    """
+
+    def __init__(self, delay: float = DEFAULT_COALESCE_DELAY):
+        self.__delay = delay
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__handles = []
+        self.__deadline = None
+        self.__worker = None
+        self.__counters = dict.fromkeys(["requests", "coalesced"] + list(KIND_NAMES.values()), 0)
+
+    def get_counters(self) -> dict:
+        """
+        Returns how many reloads were requested, merged and executed.
+        """
+        with self.__condition:
+            return dict(self.__counters)
+
+    def request(self, kind: int, action) -> ReloadHandle:
+        """
+        Schedules the action, it is dropped in case a stronger reload
+        is pending already.
+        """
+        handle = ReloadHandle(kind)
+
+        with self.__condition:
+            self.__counters["requests"] += 1
+
+            if self.__pending is None:
+                self.__pending = (kind, action)
+                self.__deadline = time.monotonic() + self.__delay
+            else:
+                self.__counters["coalesced"] += 1
+                if kind >= self.__pending[0]:
+                    self.__pending = (kind, action)
+
+            self.__handles.append(handle)
+
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="reload", daemon=True)
+                self.__worker.start()
+
+            self.__condition.notify_all()
+
+        return handle
+
+    def __next(self):
+        with self.__condition:
+            while self.__pending is None:
+                self.__condition.wait()
+
+            while True:
+                remaining = self.__deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+
+            kind, action = self.__pending
+            handles = self.__handles
+
+            self.__pending = None
+            self.__handles = []
+            self.__counters[KIND_NAMES[kind]] += 1
+
+        return kind, action, handles
+
+    def __run(self):
+        while True:
+            kind, action, handles = self.__next()
+
+            error = None
+            try:
+                action()
+            except Exception as ex:  # pylint: disable=broad-except
+                logging.getLogger('flask.app').warning("%s failed: %s", KIND_NAMES[kind], ex)
+                error = ex
+
+            for handle in handles:
+                handle.resolve(kind, error)
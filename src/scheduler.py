@@ -0,0 +1,159 @@
+"""
+Runs deferred calls from a single thread.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+STATE_PENDING = 0
+STATE_CANCELLED = 1
+STATE_FIRED = 2
+
+
+class Deadline:
+    """
+    A deferred call which can be cancelled until it fired.
+    """
+
+    def __init__(self, scheduler, when: float, callback, args):
+        self.__scheduler = scheduler
+        self.__when = when
+        self.__callback = callback
+        self.__args = args
+        self.__state = STATE_PENDING
+
+    def get_when(self) -> float:
+        """
+        Gets the monotonic time at which the call is due.
+        """
+        return self.__when
+
+    def is_pending(self) -> bool:
+        """
+        Checks if the call still waits for its deadline.
+        """
+        return self.__state == STATE_PENDING
+
+    def is_cancelled(self) -> bool:
+        """
+        Checks if the call was cancelled.
+        """
+        return self.__state == STATE_CANCELLED
+
+    def is_fired(self) -> bool:
+        """
+        Checks if the call was executed or is being executed right now.
+        """
+        return self.__state == STATE_FIRED
+
+    def cancel(self) -> bool:
+        """
+        Cancels the call, returns false in case it fired already.
+        """
+        return self.__scheduler.cancel(self)
+
+    def set_state(self, state: int):
+        """
+        Changes the state, only the scheduler does this while holding its lock.
+        """
+        self.__state = state
+
+    def run(self):
+        """
+        Executes the call.
+        """
+        self.__callback(*self.__args)
+
+
+class DeadlineScheduler:
+    """
+    Keeps all deadlines in a heap which is served by one worker thread,
+    so the thread count is constant no matter how many calls are pending.
+
+    Cancelled deadlines stay in the heap until they are due or until
+    they make up the larger part of it, which keeps cancelling cheap.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__cancelled = 0
+        self.__worker = None
+
+    def get_pending(self) -> int:
+        """
+        Returns how many calls wait for their deadline.
+        """
+        with self.__condition:
+            return len(self.__heap) - self.__cancelled
+
+    def call_later(self, delay: float, callback, *args) -> Deadline:
+        """
+        Calls the callback with the arguments after the delay in seconds.
+        The callback runs on the scheduler's thread and should not block.
+        """
+        deadline = Deadline(self, time.monotonic() + max(float(delay), 0), callback, args)
+
+        with self.__condition:
+            # The sequence keeps the order of equal deadlines.
+            heapq.heappush(self.__heap, (deadline.get_when(), next(self.__sequence), deadline))
+
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="scheduler", daemon=True)
+                self.__worker.start()
+
+            # Only an earlier deadline changes how long the worker sleeps.
+            if self.__heap[0][2] is deadline:
+                self.__condition.notify_all()
+
+        return deadline
+
+    def cancel(self, deadline: Deadline) -> bool:
+        """
+        Cancels the deadline, returns false in case it fired already.
+        """
+        with self.__condition:
+            if not deadline.is_pending():
+                return deadline.is_cancelled()
+
+            deadline.set_state(STATE_CANCELLED)
+            self.__cancelled += 1
+
+            if self.__cancelled > len(self.__heap) // 2:
+                self.__heap = [item for item in self.__heap if item[2].is_pending()]
+                heapq.heapify(self.__heap)
+                self.__cancelled = 0
+
+        return True
+
+    def __next(self) -> Deadline:
+        with self.__condition:
+            while True:
+                while self.__heap and not self.__heap[0][2].is_pending():
+                    heapq.heappop(self.__heap)
+                    self.__cancelled -= 1
+
+                if not self.__heap:
+                    self.__condition.wait()
+                    continue
+
+                remaining = self.__heap[0][0] - time.monotonic()
+                if remaining <= 0:
+                    deadline = heapq.heappop(self.__heap)[2]
+                    deadline.set_state(STATE_FIRED)
+                    return deadline
+
+                self.__condition.wait(remaining)
+
+    def __run(self):
+        while True:
+            deadline = self.__next()
+
+            try:
+                deadline.run()
+            except Exception as ex:  # pylint: disable=broad-except
+                logging.getLogger('flask.app').warning("Deferred call failed: %s", ex)
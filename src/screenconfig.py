@@ -0,0 +1,248 @@
+"""
+Keeps the screen configuration scripts from screens.d in memory.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import threading
+from typing import Dict, List
+
+from src.inotify import DirectoryWatch, InotifyException
+
+CONFIG_XINITRC_SCREENS = pathlib.Path("/etc/kiosk/screens.d")
+
+CMD_SET_SCREEN = "xrandr --output"
+
+
+class ScreenConfig:
+    """
+    The configuration of a single output as stored in its screens.d script.
+    """
+
+    def __init__(self, output: str, rotation: str = None,
+                 primary: bool = False, off: bool = False):
+        self.__output = output
+        self.__rotation = rotation
+        self.__primary = primary
+        self.__off = off
+
+    def get_output(self) -> str:
+        """
+        Gets the output's name, e.g. HDMI-1
+        """
+        return self.__output
+
+    def get_rotation(self) -> str:
+        """
+        Gets the rotation or None in case the script does not set one.
+        """
+        return self.__rotation
+
+    def is_primary(self) -> bool:
+        """
+        Checks if the output is configured as primary output.
+        """
+        return self.__primary
+
+    def is_off(self) -> bool:
+        """
+        Checks if the output is disabled.
+        """
+        return self.__off
+
+    def get_command(self) -> str:
+        """
+        Returns the xrandr command which applies this configuration.
+        """
+        if self.__off:
+            return f"{CMD_SET_SCREEN} {self.__output} --off"
+
+        command = f"{CMD_SET_SCREEN} {self.__output}"
+        if self.__rotation:
+            command += f" --rotate {self.__rotation}"
+        if self.__primary:
+            command += " --primary"
+
+        return command
+
+    def get_script(self) -> str:
+        """
+        Returns the script's content.
+        """
+        return f"#!/bin/sh\n{self.get_command()}\n"
+
+    @staticmethod
+    def parse(output: str, script: str) -> ScreenConfig:
+        """
+        Parses the xrandr command for the given output from a script.
+        Returns None in case the script does not configure the output.
+        """
+        for line in script.splitlines():
+            if not line.startswith(f"{CMD_SET_SCREEN} {output}"):
+                continue
+
+            args = line.split()[3:]
+
+            rotation = None
+            if "--rotate" in args and args.index("--rotate") + 1 < len(args):
+                rotation = args[args.index("--rotate") + 1]
+
+            return ScreenConfig(output, rotation, "--primary" in args, "--off" in args)
+
+        return None
+
+
+class ScreenConfigStore:
+    """
+    Parses all screens.d scripts once and serves them from memory.
+
+    Changes made outside the service are picked up via inotify. In case
+    inotify is not available the scripts are reparsed on every access.
+    """
+
+    def __init__(self, directory: pathlib.Path = None):
+        if directory is None:
+            directory = CONFIG_XINITRC_SCREENS
+
+        self.__directory = pathlib.Path(directory)
+        self.__lock = threading.Lock()
+        self.__configs = None
+        self.__watch = None
+
+    def get_directory(self) -> pathlib.Path:
+        """
+        Gets the directory containing the scripts.
+        """
+        return self.__directory
+
+    def watch(self) -> bool:
+        """
+        Starts watching the directory for changes. Returns false in
+        case inotify is not available.
+        """
+        if self.__watch is None:
+            self.__watch = DirectoryWatch(self.__directory, self.invalidate)
+
+        try:
+            self.__watch.start()
+        except InotifyException as ex:
+            logging.getLogger('flask.app').warning(
+                "Can not watch %s, reparsing on every access: %s", self.__directory, ex)
+            return False
+
+        return True
+
+    def invalidate(self):
+        """
+        Drops the parsed scripts, they are reparsed on the next access.
+        """
+        with self.__lock:
+            self.__configs = None
+
+    def __load(self) -> Dict[str, ScreenConfig]:
+        configs = {}
+
+        if not self.__directory.is_dir():
+            return configs
+
+        for script in sorted(self.__directory.iterdir()):
+            if not script.is_file():
+                continue
+
+            config = ScreenConfig.parse(script.name, script.read_text(encoding="utf-8"))
+            if config:
+                configs[script.name] = config
+
+        return configs
+
+    def __get_configs(self) -> Dict[str, ScreenConfig]:
+        with self.__lock:
+            if self.__configs is not None:
+                return self.__configs
+
+            configs = self.__load()
+
+            if self.__watch is not None and self.__watch.is_running():
+                self.__configs = configs
+
+            return configs
+
+    def get(self, output: str) -> ScreenConfig:
+        """
+        Returns the configuration for the given output or None.
+        """
+        return self.__get_configs().get(output)
+
+    def get_all(self) -> List[ScreenConfig]:
+        """
+        Returns the configuration of all outputs.
+        """
+        return list(self.__get_configs().values())
+
+    def __write(self, config: ScreenConfig):
+        """
+        Stages the script next to its final location and renames it, so that
+        run-parts never sees a partially written script. The dot prefix
+        keeps run-parts from running the staged file.
+        """
+        script = self.__directory / config.get_output()
+        staged = self.__directory / f".{config.get_output()}.tmp"
+
+        with staged.open("w", encoding="utf-8") as f:
+            f.write(config.get_script())
+            f.flush()
+            os.fsync(f.fileno())
+
+        staged.chmod(0o775)
+        os.replace(staged, script)
+
+    def __sync_directory(self):
+        fd = os.open(self.__directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def set(self, config: ScreenConfig):
+        """
+        Writes the configuration to the output's script.
+        """
+        with self.__lock:
+            self.__directory.mkdir(parents=True, exist_ok=True)
+
+            self.__write(config)
+            self.__sync_directory()
+
+            if self.__configs is not None:
+                self.__configs[config.get_output()] = config
+
+    def replace(self, configs: List[ScreenConfig]):
+        """
+        Replaces all scripts with the given configurations. Each script
+        is replaced atomically, scripts for other outputs are removed.
+        """
+        with self.__lock:
+            self.__directory.mkdir(parents=True, exist_ok=True)
+
+            names = set()
+            for config in configs:
+                self.__write(config)
+                names.add(config.get_output())
+
+            for script in self.__directory.iterdir():
+                if script.is_file() and script.name not in names:
+                    script.unlink()
+
+            self.__sync_directory()
+
+            if self.__configs is not None:
+                self.__configs = {config.get_output(): config for config in configs}
+
+    def clear(self):
+        """
+        Removes all scripts.
+        """
+        self.replace([])
@@ -0,0 +1,720 @@
+"""
+Captures the screen's content.
+
+The native backend grabs the root window over a persistent X connection
+and downsamples it in process. In case this is not possible it falls back
+to the xwd and ImageMagick pipeline.
+"""
+
+from abc import ABC, abstractmethod
+import ctypes
+import io
+import logging
+import math
+import struct
+import subprocess
+import threading
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from src.xlib import (
+    XLIB, XConnection, XImage, XShmSegmentInfo, XlibException,
+    ALL_PLANES, IPC_CREAT, IPC_PRIVATE, IPC_RMID, Z_PIXMAP, destroy_image)
+
+DEFAULT_SCALE = 10
+DEFAULT_FORMAT = "png"
+DEFAULT_QUALITY = 80
+DEFAULT_CACHE_TTL = 2.0
+
+MIN_SCALE = 1
+MAX_SCALE = 100
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+MIN_DIMENSION = 16
+MAX_DIMENSION = 7680
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp"
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPE_RGB = 2
+PNG_COMPRESSION_LEVEL = 6
+
+
+class ScreenCaptureException(Exception):
+    """
+    Thrown in case the screen could not be captured.
+    """
+
+
+class ScreenshotOptionException(Exception):
+    """
+    Thrown in case a screenshot option is invalid or out of range.
+    """
+
+
+def parse_limited_int(name: str, value, minimum: int, maximum: int) -> int:
+    """
+    Converts the value to an integer and ensures it is within the limits.
+    """
+    try:
+        value = int(value)
+    except (TypeError, ValueError) as ex:
+        raise ScreenshotOptionException(f"Invalid {name} {value}") from ex
+
+    if value < minimum or value > maximum:
+        raise ScreenshotOptionException(
+            f"The {name} needs to be between {minimum} and {maximum}")
+
+    return value
+
+
+class ScreenshotOptions:
+    """
+    Describes how a screenshot should be scaled and encoded.
+    """
+
+    def __init__(self, scale: int = None, picture_format: str = None,
+                 quality: int = None, max_width: int = None, max_height: int = None):
+
+        if scale is None:
+            scale = DEFAULT_SCALE
+
+        if picture_format is None:
+            picture_format = DEFAULT_FORMAT
+
+        if picture_format not in MIME_TYPES:
+            raise ScreenshotOptionException(f"Unsupported format {picture_format}")
+
+        # Png is lossless, the quality does not matter.
+        if picture_format == "png":
+            quality = None
+        elif quality is None:
+            quality = DEFAULT_QUALITY
+
+        self.__scale = parse_limited_int("scale", scale, MIN_SCALE, MAX_SCALE)
+        self.__format = picture_format
+
+        self.__quality = None
+        if quality is not None:
+            self.__quality = parse_limited_int(
+                "quality", quality, MIN_QUALITY, MAX_QUALITY)
+
+        self.__max_width = None
+        if max_width is not None:
+            self.__max_width = parse_limited_int(
+                "max width", max_width, MIN_DIMENSION, MAX_DIMENSION)
+
+        self.__max_height = None
+        if max_height is not None:
+            self.__max_height = parse_limited_int(
+                "max height", max_height, MIN_DIMENSION, MAX_DIMENSION)
+
+    def get_scale(self) -> int:
+        """
+        Gets the scale in percent.
+        """
+        return self.__scale
+
+    def get_format(self) -> str:
+        """
+        Gets the picture format, e.g. png or jpeg.
+        """
+        return self.__format
+
+    def get_mime_type(self) -> str:
+        """
+        Gets the mime type matching the picture format.
+        """
+        return MIME_TYPES[self.__format]
+
+    def get_quality(self) -> int:
+        """
+        Gets the quality for lossy formats, it is None for png.
+        """
+        return self.__quality
+
+    def get_max_width(self) -> int:
+        """
+        Gets the maximal width in pixels, None means unlimited.
+        """
+        return self.__max_width
+
+    def get_max_height(self) -> int:
+        """
+        Gets the maximal height in pixels, None means unlimited.
+        """
+        return self.__max_height
+
+    def get_key(self) -> tuple:
+        """
+        Returns a key which identifies this variant in the cache.
+        """
+        return (self.__scale, self.__format, self.__quality,
+                self.__max_width, self.__max_height)
+
+    def get_size(self, width: int, height: int) -> tuple:
+        """
+        Returns the exact size a frame of the given size is scaled to. Like
+        convert it scales by the percentage first, then shrinks the result
+        to fit into the maximal dimensions keeping the aspect ratio.
+        """
+        width, height = (max(1, math.floor(width * self.__scale / 100 + 0.5)),
+                         max(1, math.floor(height * self.__scale / 100 + 0.5)))
+
+        ratio = 1.0
+        if self.__max_width and width > self.__max_width:
+            ratio = min(ratio, self.__max_width / width)
+
+        if self.__max_height and height > self.__max_height:
+            ratio = min(ratio, self.__max_height / height)
+
+        if ratio < 1.0:
+            width = max(1, math.floor(width * ratio + 0.5))
+            height = max(1, math.floor(height * ratio + 0.5))
+
+        return width, height
+
+    def get_factor(self, width: int, height: int) -> int:
+        """
+        Returns the largest integer box filter factor for a frame of the
+        given size which does not shrink it below the exact target size.
+        The remainder is scaled by resize.
+        """
+        target_width, target_height = self.get_size(width, height)
+        return max(1, min(width // target_width, height // target_height))
+
+
+def downsample(frame, factor: int):
+    """
+    Shrinks the frame by the given factor with a box filter.
+
+    The filter averages blocks of factor x factor pixels. Border
+    pixels which do not fill a complete block are dropped.
+    """
+    if factor == 1:
+        return frame
+
+    channels = frame.shape[2]
+    height = frame.shape[0] // factor
+    width = frame.shape[1] // factor
+
+    if not height or not width:
+        raise ScreenCaptureException(f"Frame too small for a factor of {factor}")
+
+    frame = frame[:height * factor, :width * factor]
+
+    # Summing complete rows first keeps the memory access sequential,
+    # it is an order of magnitude faster than reducing both axes at once.
+    accumulator = numpy.uint16 if factor * 255 <= 0xFFFF else numpy.uint32
+    rows = frame.reshape(height, factor, width * factor * channels).sum(
+        axis=1, dtype=accumulator)
+
+    blocks = rows.reshape(height, width, factor, channels).sum(
+        axis=2, dtype=numpy.uint32)
+
+    return (blocks // (factor * factor)).astype(numpy.uint8)
+
+
+def resize(frame, width: int, height: int):
+    """
+    Scales the frame to the exact size with bilinear interpolation.
+
+    It is used after the box filter, so the frame is never shrunk by
+    more than a factor of two and no pixels are skipped.
+    """
+    source_height, source_width = frame.shape[:2]
+    if (source_width, source_height) == (width, height):
+        return frame
+
+    def sample(target: int, source: int):
+        # Maps the target pixels' centers onto the source.
+        positions = (numpy.arange(target, dtype=numpy.float32) + 0.5) * source / target - 0.5
+        positions = numpy.clip(positions, 0, source - 1)
+        lower = positions.astype(numpy.intp)
+        upper = numpy.minimum(lower + 1, source - 1)
+        return lower, upper, positions - lower
+
+    left, right, x_weight = sample(width, source_width)
+    top, bottom, y_weight = sample(height, source_height)
+
+    x_weight = x_weight[numpy.newaxis, :, numpy.newaxis]
+    y_weight = y_weight[:, numpy.newaxis, numpy.newaxis]
+
+    rows = frame[top].astype(numpy.float32)
+    upper = rows[:, left] * (1 - x_weight) + rows[:, right] * x_weight
+    rows = frame[bottom].astype(numpy.float32)
+    lower = rows[:, left] * (1 - x_weight) + rows[:, right] * x_weight
+
+    return (upper * (1 - y_weight) + lower * y_weight + 0.5).astype(numpy.uint8)
+
+
+def encode_png(frame) -> bytes:
+    """
+    Encodes a RGB frame as png.
+    """
+    height, width = frame.shape[:2]
+
+    # Every scanline is prefixed with its filter type, we use none.
+    rows = numpy.empty((height, width * 3 + 1), dtype=numpy.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = frame.reshape(height, width * 3)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data)))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPE_RGB, 0, 0, 0)
+
+    return (PNG_SIGNATURE
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(rows.tobytes(), PNG_COMPRESSION_LEVEL))
+            + chunk(b"IEND", b""))
+
+
+def encode(frame, options: ScreenshotOptions) -> bytes:
+    """
+    Encodes a RGB frame as requested by the options. Png is encoded
+    natively, all other formats need pillow.
+    """
+    if options.get_format() == "png":
+        return encode_png(frame)
+
+    if Image is None:
+        raise ScreenCaptureException(
+            f"Encoding {options.get_format()} needs pillow")
+
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(
+        buffer, format=options.get_format().upper(), quality=options.get_quality())
+
+    return buffer.getvalue()
+
+
+class ScreenCaptureBackend(ABC):
+    """
+    An abstract screen capture backend.
+    """
+
+    @abstractmethod
+    def capture(self, options: ScreenshotOptions) -> bytes:
+        """
+        Captures the screen, scales and encodes it as specified by the options.
+        """
+
+    def grab(self, options: ScreenshotOptions):
+        """
+        Captures the screen and returns it as scaled RGB frame.
+        """
+        raise ScreenCaptureException(
+            f"{type(self).__name__} does not support raw frames")
+
+    def close(self):
+        """
+        Releases all resources held by the backend.
+        """
+
+
+class XwdScreenCapture(ScreenCaptureBackend):
+    """
+    Captures the screen by piping xwd through ImageMagick's convert.
+    """
+
+    def get_convert_command(self, options: ScreenshotOptions):
+        """
+        Returns the convert command line for the given options.
+        """
+        command = ["convert", "xwd:-", "-resize", f"{options.get_scale()}%"]
+
+        if options.get_max_width() or options.get_max_height():
+            width = options.get_max_width() or ""
+            height = options.get_max_height() or ""
+            # Only shrink images which are larger than the limit.
+            command += ["-resize", f"{width}x{height}>"]
+
+        if options.get_quality():
+            command += ["-quality", str(options.get_quality())]
+
+        command.append(f"{options.get_format()}:-")
+        return command
+
+    def capture(self, options: ScreenshotOptions) -> bytes:
+        xwd_command = ["xwd", "-silent", "-root", "-display",":0"]
+        convert_command = self.get_convert_command(options)
+
+        # Run xwd command and capture its output
+        xwd_process = subprocess.run(
+            xwd_command, stdout=subprocess.PIPE, check=True)
+
+        # Run convert command with xwd output as input
+        convert_process = subprocess.run(
+            convert_command, input=xwd_process.stdout, stdout=subprocess.PIPE, check=True)
+
+        return convert_process.stdout
+
+
+class NativeScreenCapture(ScreenCaptureBackend):
+    """
+    Captures the root window over a persistent X connection.
+
+    It uses the MIT-SHM extension in case the server supports it,
+    so that the pixels are not copied through the socket. Otherwise
+    it falls back to a plain XGetImage.
+    """
+
+    def __init__(self, connection: XConnection = None):
+        if connection is None:
+            connection = XConnection()
+
+        self.__connection = connection
+        self.__shm_info = None
+        self.__shm_image = None
+        self.__shm_supported = None
+
+    def __release_shm(self):
+        if not self.__shm_image:
+            return
+
+        if not self.__connection.is_broken():
+            XLIB.xext().XShmDetach(self.__connection.get_display(), self.__shm_info)
+            destroy_image(self.__shm_image)
+
+        XLIB.libc().shmdt(ctypes.c_void_p(self.__shm_info.shmaddr))
+
+        self.__shm_image = None
+        self.__shm_info = None
+
+    def __create_shm(self, display, width: int, height: int):
+        x11 = XLIB.x11()
+        xext = XLIB.xext()
+        libc = XLIB.libc()
+
+        screen = x11.XDefaultScreen(display)
+
+        info = XShmSegmentInfo()
+        image = xext.XShmCreateImage(
+            display, x11.XDefaultVisual(display, screen), x11.XDefaultDepth(display, screen),
+            Z_PIXMAP, None, ctypes.byref(info), width, height)
+
+        if not image:
+            raise XlibException("Failed to create shared memory image")
+
+        size = image.contents.bytes_per_line * image.contents.height
+
+        info.shmid = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            destroy_image(image)
+            raise XlibException(f"shmget failed with errno {ctypes.get_errno()}")
+
+        info.shmaddr = libc.shmat(info.shmid, None, 0)
+        # The segment is freed automatically once both sides detached.
+        libc.shmctl(info.shmid, IPC_RMID, None)
+
+        if info.shmaddr in (None, ctypes.c_void_p(-1).value):
+            destroy_image(image)
+            raise XlibException(f"shmat failed with errno {ctypes.get_errno()}")
+
+        image.contents.data = info.shmaddr
+        info.readOnly = 0
+
+        self.__shm_info = info
+        self.__shm_image = image
+
+        xext.XShmAttach(display, ctypes.byref(info))
+        self.__connection.sync()
+
+    def __get_geometry(self, display, root):
+        root_return = ctypes.c_ulong()
+        x = ctypes.c_int()
+        y = ctypes.c_int()
+        width = ctypes.c_uint()
+        height = ctypes.c_uint()
+        border = ctypes.c_uint()
+        depth = ctypes.c_uint()
+
+        if not XLIB.x11().XGetGeometry(
+                display, root, ctypes.byref(root_return),
+                ctypes.byref(x), ctypes.byref(y),
+                ctypes.byref(width), ctypes.byref(height),
+                ctypes.byref(border), ctypes.byref(depth)):
+            raise XlibException("Failed to query the root window's geometry")
+
+        return width.value, height.value
+
+    def __to_frame(self, image: XImage):
+        """
+        Wraps the image's BGRX pixels without copying them. Only 32 bits
+        per pixel images are supported.
+        """
+        if image.bits_per_pixel != 32:
+            raise ScreenCaptureException(
+                f"Unsupported pixel depth {image.bits_per_pixel}")
+
+        buffer = (ctypes.c_uint8 * (image.bytes_per_line * image.height)).from_address(
+            image.data)
+
+        pixels = numpy.frombuffer(buffer, dtype=numpy.uint8).reshape(
+            image.height, image.bytes_per_line // 4, 4)
+
+        return pixels[:, :image.width]
+
+    def __to_rgb(self, frame):
+        """
+        Drops the padding byte and swaps BGR to RGB.
+        """
+        return numpy.ascontiguousarray(frame[:, :, 2::-1])
+
+    def __grab_shm(self, display, root, width: int, height: int, factor: int):
+        image = self.__shm_image
+        if image and (image.contents.width, image.contents.height) != (width, height):
+            self.__release_shm()
+
+        if not self.__shm_image:
+            self.__create_shm(display, width, height)
+
+        if not XLIB.xext().XShmGetImage(display, root, self.__shm_image, 0, 0, ALL_PLANES):
+            raise XlibException("XShmGetImage failed")
+
+        return self.__to_rgb(downsample(self.__to_frame(self.__shm_image.contents), factor))
+
+    def __grab_image(self, display, root, width: int, height: int, factor: int):
+        image = XLIB.x11().XGetImage(display, root, 0, 0, width, height, ALL_PLANES, Z_PIXMAP)
+        if not image:
+            self.__connection.sync()
+            raise XlibException("XGetImage failed")
+
+        try:
+            return self.__to_rgb(downsample(self.__to_frame(image.contents), factor))
+        finally:
+            destroy_image(image)
+
+    def grab(self, options: ScreenshotOptions):
+        """
+        Grabs the root window and returns it scaled to the options' exact
+        size as RGB frame, the same size the xwd fallback produces.
+        """
+        if numpy is None:
+            raise ScreenCaptureException("numpy is not installed")
+
+        with self.__connection.get_lock():
+            if self.__connection.is_broken():
+                # The server is gone, so is our shared memory attachment.
+                self.__release_shm()
+
+            display = self.__connection.open()
+            root = XLIB.x11().XDefaultRootWindow(display)
+            width, height = self.__get_geometry(display, root)
+            factor = options.get_factor(width, height)
+            size = options.get_size(width, height)
+
+            if self.__shm_supported is None:
+                self.__shm_supported = bool(XLIB.xext().XShmQueryExtension(display))
+
+            if self.__shm_supported:
+                try:
+                    return resize(self.__grab_shm(display, root, width, height, factor), *size)
+                except XlibException as ex:
+                    # e.g. the server runs in a different ipc namespace.
+                    logging.getLogger('flask.app').warning(
+                        "MIT-SHM capture failed, falling back to XGetImage: %s", ex)
+                    self.__release_shm()
+                    self.__shm_supported = False
+
+            return resize(self.__grab_image(display, root, width, height, factor), *size)
+
+    def capture(self, options: ScreenshotOptions) -> bytes:
+        if options.get_format() != "png" and Image is None:
+            raise ScreenCaptureException(
+                f"Encoding {options.get_format()} needs pillow")
+
+        return encode(self.grab(options), options)
+
+    def close(self):
+        with self.__connection.get_lock():
+            self.__release_shm()
+            self.__shm_supported = None
+            self.__connection.close()
+
+
+class ScreenCapture:
+    """
+    Captures the screen with the native backend and falls back to
+    xwd and convert in case it fails.
+    """
+
+    def __init__(self, native: ScreenCaptureBackend = None,
+                 fallback: ScreenCaptureBackend = None):
+        if native is None:
+            native = NativeScreenCapture()
+
+        if fallback is None:
+            fallback = XwdScreenCapture()
+
+        self.__native = native
+        self.__fallback = fallback
+        self.__lock = threading.Lock()
+        self.__native_failed = False
+
+    def capture(self, options: ScreenshotOptions = None) -> bytes:
+        """
+        Captures the screen and returns the encoded image.
+        """
+        if options is None:
+            options = ScreenshotOptions()
+
+        try:
+            return self.__native.capture(options)
+        except (ScreenCaptureException, XlibException) as ex:
+            with self.__lock:
+                if not self.__native_failed:
+                    logging.getLogger('flask.app').warning(
+                        "Native screen capture failed, using xwd: %s", ex)
+                self.__native_failed = True
+
+        return self.__fallback.capture(options)
+
+    def grab(self, options: ScreenshotOptions = None):
+        """
+        Captures the screen and returns it as RGB frame. Only the native
+        backend supports raw frames.
+        """
+        if options is None:
+            options = ScreenshotOptions()
+
+        return self.__native.grab(options)
+
+    def reset(self):
+        """
+        Drops the X connection, e.g. before the X server is restarted.
+        """
+        self.__native.close()
+
+
+class ScreenshotFlight:
+    """
+    A capture which is currently in progress. Requests for the same
+    variant wait for its result instead of starting their own capture.
+    """
+
+    def __init__(self):
+        self.__done = threading.Event()
+        self.__data = None
+        self.__error = None
+
+    def resolve(self, data: bytes):
+        """
+        Publishes the captured image to all waiters.
+        """
+        self.__data = data
+        self.__done.set()
+
+    def fail(self, error: Exception):
+        """
+        Publishes the capture's error to all waiters.
+        """
+        self.__error = error
+        self.__done.set()
+
+    def wait(self) -> bytes:
+        """
+        Waits for the capture to complete.
+        """
+        self.__done.wait()
+
+        if self.__error:
+            raise self.__error
+
+        return self.__data
+
+
+class ScreenshotCache:
+    """
+    Caches encoded screenshots for a short time.
+
+    Each variant e.g. a (scale, format) tuple is cached separately and
+    concurrent requests for the same variant share a single capture.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL):
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__flights = {}
+
+    def get_ttl(self) -> float:
+        """
+        Gets the time in seconds a screenshot is served from the cache.
+        """
+        return self.__ttl
+
+    def set_ttl(self, ttl: float):
+        """
+        Sets the time in seconds a screenshot is served from the cache.
+        """
+        self.__ttl = ttl
+
+    def get(self, key, factory, max_age: float = None) -> bytes:
+        """
+        Returns the cached screenshot for the key. In case there is none,
+        the factory is called to capture a new one. The max age overrides
+        the ttl for this request.
+        """
+        if max_age is None:
+            max_age = self.__ttl
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry and time.monotonic() - entry[0] < max_age:
+                return entry[1]
+
+            flight = self.__flights.get(key)
+            if flight:
+                leader = False
+            else:
+                flight = ScreenshotFlight()
+                self.__flights[key] = flight
+                leader = True
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            data = factory()
+        except Exception as ex:
+            with self.__lock:
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+
+            flight.fail(ex)
+            raise
+
+        with self.__lock:
+            # In case the cache was invalidated while capturing, the
+            # image may be outdated and must not be served to new requests.
+            if self.__flights.get(key) is flight:
+                del self.__flights[key]
+                self.__entries[key] = (time.monotonic(), data)
+
+        flight.resolve(data)
+        return data
+
+    def invalidate(self):
+        """
+        Drops all cached screenshots, called whenever the screen's content changed.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__flights.clear()
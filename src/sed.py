@@ -44,3 +44,22 @@ class SingleLineEditor():
                     continue
 
                 file.write(line)
+
+    def set_line(self, search:str, replacement:str):
+        """
+        Updates the line starting with the search string, it is appended
+        in case the file does not contain such a line.
+        """
+        if self.get_line(search) is not None:
+            self.update_line(search, replacement)
+            return
+
+        prefix = ""
+        if self.__filename.exists():
+            content = self.__filename.read_text(encoding="utf-8")
+            # Otherwise the new line would be glued onto the last one.
+            if content and not content.endswith("\n"):
+                prefix = "\n"
+
+        with self.__filename.open('a', encoding="utf-8") as file:
+            file.write(prefix+replacement+"\n")
@@ -0,0 +1,280 @@
+"""
+Keeps a last known good copy of the kiosk page, which is shown while
+the page can not be reached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pathlib
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import List
+
+from src.cdp import CdpException
+from src.worker.background import PeriodicWorker
+
+DEFAULT_SNAPSHOT_DIRECTORY = pathlib.Path("/etc/kiosk/snapshots")
+DEFAULT_MAX_SNAPSHOTS = 3
+
+# Snapshots are written to the sd card, so they are taken rarely.
+DEFAULT_CAPTURE_INTERVAL = 15 * 60
+MIN_CAPTURE_INTERVAL = 60
+DEFAULT_PROBE_INTERVAL = 30.0
+PROBE_TIMEOUT = 5.0
+
+SNAPSHOT_SUFFIX = ".mhtml"
+
+
+class SnapshotException(Exception):
+    """
+    Thrown in case a snapshot can not be taken.
+    """
+
+
+def probe(url: str, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    Checks if the url can be reached. Any response except a server
+    error counts, the page itself decides what to show.
+    """
+    try:
+        request = urllib.request.Request(url, method="HEAD")
+        with urllib.request.urlopen(request, timeout=timeout):
+            return True
+    except urllib.error.HTTPError as ex:
+        return ex.code < 500
+    except (OSError, ValueError):
+        return False
+
+
+class SnapshotStore:
+    """
+    Stores the latest snapshots per url as mhtml files, older ones are pruned.
+    """
+
+    def __init__(self, directory: pathlib.Path = None, max_count: int = DEFAULT_MAX_SNAPSHOTS):
+        if directory is None:
+            directory = DEFAULT_SNAPSHOT_DIRECTORY
+
+        self.__directory = pathlib.Path(directory)
+        self.__max_count = max_count
+        self.__lock = threading.Lock()
+
+    def get_directory(self) -> pathlib.Path:
+        """
+        Gets the directory which contains the snapshots.
+        """
+        return self.__directory
+
+    @staticmethod
+    def get_key(url: str) -> str:
+        """
+        Returns the file name prefix for the url.
+        """
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+
+    def get_snapshots(self, url: str) -> List[pathlib.Path]:
+        """
+        Returns the url's snapshots, the newest one first.
+        """
+        if not self.__directory.exists():
+            return []
+
+        return sorted(
+            self.__directory.glob(f"{SnapshotStore.get_key(url)}-*{SNAPSHOT_SUFFIX}"),
+            reverse=True)
+
+    def get_latest(self, url: str) -> pathlib.Path:
+        """
+        Returns the url's newest snapshot or None.
+        """
+        snapshots = self.get_snapshots(url)
+        if not snapshots:
+            return None
+
+        return snapshots[0]
+
+    def is_snapshot(self, url: str) -> bool:
+        """
+        Checks if the url points into the store.
+        """
+        return url.startswith(self.__directory.as_uri() + "/")
+
+    def save(self, url: str, data: bytes, now: float = None) -> pathlib.Path:
+        """
+        Stores a snapshot for the url and prunes the oldest ones.
+        """
+        if now is None:
+            now = time.time()
+
+        # The zero padded timestamp keeps the names sorted by age.
+        name = f"{SnapshotStore.get_key(url)}-{int(now * 1000):015d}{SNAPSHOT_SUFFIX}"
+        target = self.__directory / name
+        staged = target.with_name(f".{target.name}.tmp")
+
+        with self.__lock:
+            self.__directory.mkdir(parents=True, exist_ok=True)
+
+            with staged.open("wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(staged, target)
+
+            for snapshot in self.get_snapshots(url)[self.__max_count:]:
+                snapshot.unlink(missing_ok=True)
+
+        return target
+
+    def clear(self):
+        """
+        Deletes all snapshots.
+        """
+        with self.__lock:
+            if not self.__directory.exists():
+                return
+
+            for snapshot in self.__directory.glob(f"*{SNAPSHOT_SUFFIX}"):
+                snapshot.unlink(missing_ok=True)
+
+
+class OfflineFallback:
+    """
+    Periodically snapshots the homepage while it is reachable and shows
+    the newest snapshot once it is not.
+
+    Reachability is checked with a light probe, the browser is only
+    navigated back to the homepage after a probe succeeded. So a dead
+    uplink does not end in a reload loop.
+    """
+
+    def __init__(self, browser, store: SnapshotStore = None,
+                 capture_interval: float = DEFAULT_CAPTURE_INTERVAL,
+                 probe_interval: float = DEFAULT_PROBE_INTERVAL, prober=probe):
+        if store is None:
+            store = SnapshotStore()
+
+        self.__browser = browser
+        self.__store = store
+        self.__capture_interval = capture_interval
+        self.__prober = prober
+        self.__worker = PeriodicWorker("offline-fallback", self.__tick, probe_interval)
+        self.__last_capture = None
+        self.__counters = {"captures": 0, "fallbacks": 0, "recoveries": 0, "failures": 0}
+
+    def get_store(self) -> SnapshotStore:
+        """
+        Gets the snapshot store.
+        """
+        return self.__store
+
+    def get_counters(self) -> dict:
+        """
+        Returns how often snapshots were taken and shown.
+        """
+        return dict(self.__counters)
+
+    def set_capture_interval(self, interval: float):
+        """
+        Sets the seconds between two snapshots.
+        """
+        self.__capture_interval = interval
+
+    def is_running(self) -> bool:
+        """
+        Checks if the fallback is active.
+        """
+        return self.__worker.is_running()
+
+    def capture(self) -> pathlib.Path:
+        """
+        Takes a snapshot of the page currently shown. It fails in case
+        the page is not the homepage, e.g. chromium's error page.
+        """
+        url = self.__browser.get_url()
+        cdp = self.__browser.get_cdp()
+
+        with cdp.get_lock():
+            page = cdp.get_page()
+            if page.get("url") != self.__browser.get_start_url():
+                raise SnapshotException(f"Not showing the homepage but {page.get('url')}")
+
+            # Chromium's error page keeps the target's url, but not its location.
+            state = cdp.call("Runtime.evaluate", {
+                "expression": "({url: location.href, state: document.readyState})",
+                "returnByValue": True}).get("result", {}).get("value") or {}
+
+            if str(state.get("url")).startswith("chrome-error:"):
+                raise SnapshotException("Showing chromium's error page")
+
+            if state.get("state") != "complete":
+                raise SnapshotException("Page is still loading")
+
+            data = cdp.call("Page.captureSnapshot", {"format": "mhtml"})["data"]
+
+        path = self.__store.save(url, data.encode("utf-8"))
+        self.__last_capture = time.monotonic()
+        self.__counters["captures"] += 1
+        return path
+
+    def __is_capture_due(self) -> bool:
+        return (self.__last_capture is None
+                or time.monotonic() - self.__last_capture >= self.__capture_interval)
+
+    def check(self):
+        """
+        Probes the homepage once and switches between it and the snapshot.
+        """
+        url = self.__browser.get_url()
+        reachable = self.__prober(url)
+        showing = self.__store.is_snapshot(self.__browser.get_cdp().get_page().get("url", ""))
+
+        if reachable:
+            if showing:
+                logging.getLogger('flask.app').info("%s is reachable again, leaving snapshot", url)
+                self.__counters["recoveries"] += 1
+                self.__browser.reload()
+                self.__last_capture = None
+                return
+
+            if self.__is_capture_due():
+                try:
+                    self.capture()
+                except (SnapshotException, KeyError, OSError) as ex:
+                    logging.getLogger('flask.app').debug("Skipping snapshot: %s", ex)
+            return
+
+        if showing:
+            return
+
+        latest = self.__store.get_latest(url)
+        if latest is None:
+            return
+
+        logging.getLogger('flask.app').warning("%s is unreachable, showing %s", url, latest)
+        self.__counters["fallbacks"] += 1
+        self.__browser.navigate(latest.as_uri())
+
+    def start(self):
+        """
+        Starts probing in a background thread.
+        """
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops probing, a snapshot stays visible until the next reload.
+        """
+        self.__worker.stop()
+
+    def __tick(self):
+        try:
+            self.check()
+        except CdpException as ex:
+            self.__counters["failures"] += 1
+            logging.getLogger('flask.app').debug("Offline check failed: %s", ex)
@@ -0,0 +1,124 @@
+"""
+Streams the screen's content as motion jpeg.
+"""
+
+import logging
+import threading
+import time
+
+DEFAULT_STREAM_FPS = 2.0
+MIN_STREAM_FPS = 0.2
+MAX_STREAM_FPS = 10.0
+
+# Static content is resent at this interval, a server notices a
+# disconnected viewer only when it writes to it.
+DEFAULT_KEEPALIVE_INTERVAL = 5.0
+
+STREAM_BOUNDARY = "frame"
+STREAM_MIME_TYPE = f"multipart/x-mixed-replace; boundary={STREAM_BOUNDARY}"
+
+
+class ScreenshotStream:
+    """
+    Captures the screen periodically and distributes the frames to all
+    connected viewers.
+
+    All viewers share a single capture loop. It is started by the first
+    viewer and stops as soon as the last viewer disconnected.
+    """
+
+    def __init__(self, capture, fps: float = DEFAULT_STREAM_FPS,
+                 keepalive: float = DEFAULT_KEEPALIVE_INTERVAL):
+        """
+        The capture callback returns an encoded jpeg, it is called with
+        the maximal age in seconds a cached screenshot may have.
+        """
+        self.__capture = capture
+        self.__fps = min(max(float(fps), MIN_STREAM_FPS), MAX_STREAM_FPS)
+        self.__keepalive = keepalive
+
+        self.__condition = threading.Condition()
+        self.__viewers = 0
+        self.__worker = None
+        self.__frame = None
+        self.__sequence = 0
+
+    def get_fps(self) -> float:
+        """
+        Gets the frame rate in frames per second.
+        """
+        return self.__fps
+
+    def get_viewers(self) -> int:
+        """
+        Returns the number of connected viewers.
+        """
+        return self.__viewers
+
+    def __run(self):
+        """
+        The capture loop, runs until no viewer is connected anymore.
+        """
+        interval = 1.0 / self.__fps
+
+        while True:
+            with self.__condition:
+                if self.__viewers == 0:
+                    self.__worker = None
+                    self.__frame = None
+                    return
+
+            started = time.monotonic()
+
+            try:
+                frame = self.__capture(interval)
+
+                with self.__condition:
+                    # Static content is only sent once.
+                    if frame != self.__frame:
+                        self.__frame = frame
+                        self.__sequence += 1
+                        self.__condition.notify_all()
+
+            except Exception as ex:
+                logging.getLogger('flask.app').warning("Failed to capture stream frame: %s", ex)
+
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def __connect(self):
+        with self.__condition:
+            self.__viewers += 1
+
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    def __disconnect(self):
+        with self.__condition:
+            self.__viewers -= 1
+
+    def frames(self):
+        """
+        A generator which yields the multipart encoded frames for a viewer.
+        It blocks until a new frame is available, unchanged content is
+        resent after the keepalive interval.
+        """
+        self.__connect()
+
+        try:
+            sequence = 0
+            while True:
+                with self.__condition:
+                    self.__condition.wait_for(
+                        lambda: self.__sequence != sequence, self.__keepalive)
+                    sequence = self.__sequence
+                    frame = self.__frame
+
+                if frame is None:
+                    continue
+
+                yield (f"--{STREAM_BOUNDARY}\r\n"
+                       "Content-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(frame)}\r\n\r\n").encode("ascii") + frame + b"\r\n"
+        finally:
+            self.__disconnect()
@@ -4,18 +4,26 @@ Manages system wide settings like host name or reboots
 
 from pathlib import Path
 import subprocess
-import threading
-import time
+
+from src.scheduler import DeadlineScheduler
 
 ETC_HOSTNAME = Path("/etc/hostname")
 ETC_HOSTS = Path("/etc/hosts")
 
+REBOOT_DELAY = 5
+
 
 class System:
     """
     Manages system wide helper functions.
     """
 
+    def __init__(self, scheduler: DeadlineScheduler = None):
+        if scheduler is None:
+            scheduler = DeadlineScheduler()
+
+        self.__scheduler = scheduler
+
     def enable_ssh(self):
         """
         Enables the ssh service
@@ -42,13 +50,11 @@ class System:
         Reboots the system with a short delay.
         It is need to give http enough time so send a response to the client.
         """
-        def reboot_task():
-            print("Rebooting in 5 seconds...")
-            time.sleep(5)
-            subprocess.run("reboot", check=False)
+        print(f"Rebooting in {REBOOT_DELAY} seconds...")
+        self.__scheduler.call_later(REBOOT_DELAY, self.__reboot)
 
-        reboot_thread = threading.Thread(target=reboot_task)
-        reboot_thread.start()
+    def __reboot(self):
+        subprocess.run("reboot", check=False)
 
     def set_hostname(self, hostname:str):
         """
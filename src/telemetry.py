@@ -0,0 +1,215 @@
+"""
+Samples chromium's rendering performance via the devtools protocol.
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import List
+
+from src.cdp import CdpClient, CdpException
+from src.worker.background import PeriodicWorker
+
+DEFAULT_SAMPLE_INTERVAL = 10.0
+MIN_SAMPLE_INTERVAL = 1.0
+
+# One hour at the default interval.
+DEFAULT_HISTORY = 360
+
+# How long the animation frames are counted, once per sample.
+FRAME_SAMPLE_WINDOW = 1.0
+
+# Returns the frame rate of the previous window and starts the next one.
+# The counter stops by itself at the end of the window so that it does
+# not keep the page's renderer busy, it starts over with every document.
+SCRIPT_PAGE_STATE = """((duration) => {
+  const previous = window.__kioskFrames;
+  const current = { frames: 0, start: null, end: null };
+  window.__kioskFrames = current;
+
+  const tick = (now) => {
+    if (current.start === null) {
+      current.start = now;
+    } else {
+      current.frames++;
+    }
+
+    if (now - current.start >= duration) {
+      current.end = now;
+      return;
+    }
+    requestAnimationFrame(tick);
+  };
+  requestAnimationFrame(tick);
+
+  const navigation = performance.getEntriesByType("navigation")[0];
+  return {
+    fps: previous && previous.end > previous.start
+      ? previous.frames * 1000 / (previous.end - previous.start) : null,
+    navigation: navigation ? {
+      ttfb: navigation.responseStart,
+      dom_content_loaded: navigation.domContentLoadedEventEnd,
+      load: navigation.loadEventEnd,
+      transfer_size: navigation.transferSize
+    } : null
+  };
+})"""
+
+GAUGES = {
+    "JSHeapUsedSize": "js_heap_used",
+    "JSHeapTotalSize": "js_heap_total",
+    "Nodes": "nodes",
+    "Documents": "documents",
+    "Frames": "frames",
+    "JSEventListeners": "event_listeners"
+}
+
+# Cumulative counters, they are reported as rate per second.
+COUNTERS = {
+    "LayoutCount": "layouts",
+    "RecalcStyleCount": "recalc_styles",
+    "LayoutDuration": "layout_load",
+    "RecalcStyleDuration": "recalc_style_load",
+    "ScriptDuration": "script_load",
+    "TaskDuration": "task_load"
+}
+
+
+class PerformanceCollector:
+    """
+    Keeps a rolling time series of the page's performance metrics.
+
+    Counters like the layout count are converted into rates, durations
+    into the fraction of time the renderer was busy. The frame rate is
+    measured by an animation frame counter which runs only for a short
+    window after each sample, a hidden page reports no frame rate.
+    """
+
+    def __init__(self, cdp: CdpClient, interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 history: int = DEFAULT_HISTORY):
+        self.__cdp = cdp
+        self.__interval = max(MIN_SAMPLE_INTERVAL, interval)
+        # The window has to end before the next sample reads it.
+        self.__window = min(FRAME_SAMPLE_WINDOW, self.__interval / 2)
+        self.__samples = collections.deque(maxlen=history)
+        self.__previous = None
+        self.__lock = threading.Lock()
+        self.__worker = PeriodicWorker("performance", self.__tick, self.__interval)
+
+        self.__cdp.add_session_listener(self.__on_session)
+
+    def __on_session(self, connection):
+        """
+        The performance domain has to be enabled for every session.
+        """
+        connection.call("Performance.enable", {"timeDomain": "timeTicks"})
+
+    def get_interval(self) -> float:
+        """
+        Gets the seconds between two samples.
+        """
+        return self.__interval
+
+    def get_samples(self, since: float = None) -> List[dict]:
+        """
+        Returns the samples, optionally only those taken after the timestamp.
+        """
+        with self.__lock:
+            samples = list(self.__samples)
+
+        if since is None:
+            return samples
+
+        return [sample for sample in samples if sample["timestamp"] > since]
+
+    def __get_raw(self) -> dict:
+        with self.__cdp.get_lock():
+            url = self.__cdp.get_page().get("url")
+            metrics = self.__cdp.call("Performance.getMetrics").get("metrics", [])
+            state = self.__cdp.call("Runtime.evaluate", {
+                "expression": f"{SCRIPT_PAGE_STATE}({self.__window * 1000})",
+                "returnByValue": True}).get("result", {}).get("value") or {}
+
+        raw = {metric["name"]: metric["value"] for metric in metrics}
+        raw["url"] = url
+        raw["fps"] = state.get("fps")
+        raw["navigation"] = state.get("navigation")
+        return raw
+
+    @staticmethod
+    def get_rate(current: dict, previous: dict, name: str, elapsed: float) -> float:
+        """
+        Returns the counter's change per second, None in case it was reset.
+        """
+        if previous is None or elapsed <= 0:
+            return None
+
+        if current.get(name) is None or previous.get(name) is None:
+            return None
+
+        delta = current[name] - previous[name]
+        if delta < 0:
+            return None
+
+        return delta / elapsed
+
+    def sample(self) -> dict:
+        """
+        Takes a sample and appends it to the series.
+        """
+        raw = self.__get_raw()
+        raw["monotonic"] = time.monotonic()
+
+        previous = self.__previous
+        # Counters start over with a new page.
+        if previous is not None and previous["url"] != raw["url"]:
+            previous = None
+
+        elapsed = raw["monotonic"] - previous["monotonic"] if previous else 0
+
+        sample = {
+            "timestamp": time.time(),
+            "url": raw["url"],
+            "navigation": raw["navigation"],
+            "fps": raw["fps"]
+        }
+
+        for name, key in GAUGES.items():
+            sample[key] = raw.get(name)
+
+        for name, key in COUNTERS.items():
+            sample[key] = PerformanceCollector.get_rate(raw, previous, name, elapsed)
+
+        self.__previous = raw
+
+        with self.__lock:
+            self.__samples.append(sample)
+
+        return sample
+
+    def is_running(self) -> bool:
+        """
+        Checks if samples are taken.
+        """
+        return self.__worker.is_running()
+
+    def start(self):
+        """
+        Starts sampling in a background thread.
+        """
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops sampling, the series is kept.
+        """
+        self.__worker.stop()
+
+    def __tick(self):
+        try:
+            self.sample()
+        except (CdpException, KeyError, TypeError) as ex:
+            # The rates are meaningless across a gap.
+            self.__previous = None
+            logging.getLogger('flask.app').debug("Performance sample failed: %s", ex)
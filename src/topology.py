@@ -0,0 +1,309 @@
+"""
+Parses the output of xrandr --query --verbose into an immutable model.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Tuple
+
+REGEX_SCREEN = re.compile(
+    r"^Screen \d+: minimum \d+ x \d+, current (?P<width>\d+) x (?P<height>\d+)")
+
+REGEX_OUTPUT = re.compile(
+    r"^(?P<name>\S+) (?P<status>connected|disconnected|unknown connection)"
+    r"( (?P<primary>primary))?"
+    r"( (?P<width>\d+)x(?P<height>\d+)\+(?P<x>-?\d+)\+(?P<y>-?\d+))?"
+    r"( \((?P<mode>0x[0-9a-fA-F]+)\))?"
+    r"( (?P<rotation>normal|left|inverted|right))?"
+    r"( (?P<reflection>X axis|Y axis|X and Y axis))?"
+    r" \(")
+
+REGEX_HEX = re.compile(r"[0-9a-fA-F]+")
+
+REGEX_MODE = re.compile(
+    r"^  (?P<width>\d+)x(?P<height>\d+)(?P<interlaced>i)? \((?P<id>0x[0-9a-fA-F]+)\)"
+    r" (?P<clock>[\d.]+)MHz(?P<flags>.*)$")
+
+
+class XrandrMode:
+    """
+    A video mode supported by an output.
+    """
+
+    def __init__(self, identifier: str, width: int, height: int,
+                 refresh: float, current: bool, preferred: bool):
+        self.__id = identifier
+        self.__width = width
+        self.__height = height
+        self.__refresh = refresh
+        self.__current = current
+        self.__preferred = preferred
+
+    def get_id(self) -> str:
+        """
+        Gets the mode's xid, e.g. 0x47
+        """
+        return self.__id
+
+    def get_width(self) -> int:
+        """
+        Gets the horizontal resolution.
+        """
+        return self.__width
+
+    def get_height(self) -> int:
+        """
+        Gets the vertical resolution.
+        """
+        return self.__height
+
+    def get_refresh(self) -> float:
+        """
+        Gets the refresh rate in Hz.
+        """
+        return self.__refresh
+
+    def is_current(self) -> bool:
+        """
+        Checks if the mode is currently active.
+        """
+        return self.__current
+
+    def is_preferred(self) -> bool:
+        """
+        Checks if the monitor prefers this mode.
+        """
+        return self.__preferred
+
+
+class XrandrOutput:
+    """
+    A video output e.g. HDMI-1 and the monitor attached to it.
+    """
+
+    def __init__(self, name: str, status: str, primary: bool,
+                 geometry: Tuple[int, int, int, int], rotation: str,
+                 reflection: str, modes: Tuple[XrandrMode, ...], edid: bytes):
+        self.__name = name
+        self.__status = status
+        self.__primary = primary
+        self.__geometry = geometry
+        self.__rotation = rotation
+        self.__reflection = reflection
+        self.__modes = modes
+        self.__edid = edid
+
+    def get_name(self) -> str:
+        """
+        Gets the output's name.
+        """
+        return self.__name
+
+    def get_status(self) -> str:
+        """
+        Gets the connection status, e.g. connected or disconnected.
+        """
+        return self.__status
+
+    def is_connected(self) -> bool:
+        """
+        Checks if a monitor is connected.
+        """
+        return self.__status == "connected"
+
+    def is_primary(self) -> bool:
+        """
+        Checks if this is the primary output.
+        """
+        return self.__primary
+
+    def get_geometry(self) -> Tuple[int, int, int, int]:
+        """
+        Returns width, height, x and y, all of them are zero in case
+        the output is disabled.
+        """
+        return self.__geometry
+
+    def get_width(self) -> int:
+        """
+        Gets the horizontal resolution.
+        """
+        return self.__geometry[0]
+
+    def get_height(self) -> int:
+        """
+        Gets the vertical resolution.
+        """
+        return self.__geometry[1]
+
+    def get_rotation(self) -> str:
+        """
+        Gets the rotation, one of normal, left, inverted or right.
+        """
+        return self.__rotation
+
+    def get_reflection(self) -> str:
+        """
+        Gets the reflection, None in case the output is not mirrored.
+        """
+        return self.__reflection
+
+    def get_modes(self) -> Tuple[XrandrMode, ...]:
+        """
+        Returns all modes supported by the output.
+        """
+        return self.__modes
+
+    def get_edid(self) -> bytes:
+        """
+        Returns the monitor's raw EDID, it is empty if not available.
+        """
+        return self.__edid
+
+
+class DisplayTopology:
+    """
+    A snapshot of all outputs known to the X server.
+    """
+
+    def __init__(self, width: int, height: int, outputs: Tuple[XrandrOutput, ...]):
+        self.__width = width
+        self.__height = height
+        self.__outputs = outputs
+        self.__by_name = {output.get_name(): output for output in outputs}
+
+    def get_width(self) -> int:
+        """
+        Gets the width of the virtual screen spanning all outputs.
+        """
+        return self.__width
+
+    def get_height(self) -> int:
+        """
+        Gets the height of the virtual screen spanning all outputs.
+        """
+        return self.__height
+
+    def get_outputs(self) -> Tuple[XrandrOutput, ...]:
+        """
+        Returns all outputs in the order reported by xrandr.
+        """
+        return self.__outputs
+
+    def get_output(self, name: str) -> XrandrOutput:
+        """
+        Returns the output with the given name or None.
+        """
+        return self.__by_name.get(name)
+
+    @staticmethod
+    def parse(xrandr_data: str) -> DisplayTopology:
+        """
+        Parses the verbose xrandr output in a single pass.
+        """
+        return XrandrParser().parse(xrandr_data)
+
+
+class XrandrParser:
+    """
+    A single pass, line based parser for xrandr --query --verbose.
+    """
+
+    def __init__(self):
+        self.__width = 0
+        self.__height = 0
+        self.__outputs: List[XrandrOutput] = []
+        self.__output = None
+        self.__modes: List[XrandrMode] = []
+        self.__mode = None
+        self.__edid = b""
+
+    def __flush_mode(self, refresh: float = 0.0):
+        if self.__mode is None:
+            return
+
+        match = self.__mode
+        flags = match.group("flags")
+        self.__modes.append(XrandrMode(
+            match.group("id"), int(match.group("width")), int(match.group("height")),
+            refresh, "*current" in flags, "+preferred" in flags))
+        self.__mode = None
+
+    def __flush_output(self):
+        self.__flush_mode()
+
+        if self.__output is None:
+            return
+
+        match = self.__output
+        geometry = (0, 0, 0, 0)
+        if match.group("width"):
+            geometry = (int(match.group("width")), int(match.group("height")),
+                        int(match.group("x")), int(match.group("y")))
+
+        self.__outputs.append(XrandrOutput(
+            match.group("name"), match.group("status"),
+            match.group("primary") is not None, geometry,
+            match.group("rotation") or "normal", match.group("reflection"),
+            tuple(self.__modes), self.__edid))
+
+        self.__output = None
+        self.__modes = []
+        self.__edid = b""
+
+    def parse(self, xrandr_data: str) -> DisplayTopology:
+        """
+        Parses the output line by line and returns the topology.
+        """
+        edid = None
+
+        for line in xrandr_data.splitlines():
+
+            # Most lines are indented properties or mode timings, they
+            # are dispatched by cheap string checks before any regex runs.
+            if line.startswith(("\t", "        ")):
+                data = line.strip()
+
+                if edid is not None:
+                    if REGEX_HEX.fullmatch(data):
+                        edid.append(data)
+                        continue
+
+                    self.__edid = bytes.fromhex("".join(edid))
+                    edid = None
+
+                if self.__mode is not None and data.startswith("v:"):
+                    self.__flush_mode(float(data.rsplit(None, 1)[1][:-2]))
+                elif data == "EDID:" and self.__output is not None:
+                    edid = []
+
+                continue
+
+            if edid is not None:
+                self.__edid = bytes.fromhex("".join(edid))
+                edid = None
+
+            if line.startswith("  "):
+                match = REGEX_MODE.match(line)
+                if match and self.__output is not None:
+                    self.__flush_mode()
+                    self.__mode = match
+                continue
+
+            match = REGEX_OUTPUT.match(line)
+            if match:
+                self.__flush_output()
+                self.__output = match
+                continue
+
+            match = REGEX_SCREEN.match(line)
+            if match:
+                self.__width = int(match.group("width"))
+                self.__height = int(match.group("height"))
+
+        if edid is not None:
+            self.__edid = bytes.fromhex("".join(edid))
+
+        self.__flush_output()
+        return DisplayTopology(self.__width, self.__height, tuple(self.__outputs))
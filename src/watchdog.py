@@ -0,0 +1,219 @@
+"""
+Detects a frozen screen and escalates from a browser reload to a
+window manager restart.
+"""
+
+import hashlib
+import io
+import logging
+import subprocess
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from src.config import DEFAULT_FREEZE_TIMEOUT
+from src.reload import RELOAD_TIMEOUT
+from src.screenshot import ScreenCaptureException, ScreenshotOptionException
+from src.worker.background import PeriodicWorker
+from src.xlib import XlibException
+
+DEFAULT_CHECK_INTERVAL = 60.0
+# The shortest time the content may stay unchanged, static pages need more.
+MIN_FREEZE_TIMEOUT = 60
+
+# Frames differing in less bits are considered equal, which hides
+# scaling noise and a blinking caret.
+DEFAULT_HASH_THRESHOLD = 2
+HASH_SIZE = 16
+CAPTURE_WIDTH = 128
+
+LEVEL_BROWSER = 0
+LEVEL_DISPLAY = 1
+
+# Content which never changes would otherwise restart the window manager
+# every timeout, so each unsuccessful restart doubles the timeout up to
+# this factor.
+MAX_BACKOFF = 16
+
+
+def get_hash(data: bytes) -> int:
+    """
+    Returns the difference hash of the encoded image. Without pillow the
+    digest of the data is used, so that any change counts.
+    """
+    if Image is None:
+        return int.from_bytes(hashlib.sha256(data).digest()[:8], "big")
+
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = list(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE)).getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            right = pixels[row * (HASH_SIZE + 1) + column + 1]
+            value = (value << 1) | (left > right)
+
+    return value
+
+
+def get_distance(first: int, second: int) -> int:
+    """
+    Returns the number of differing bits.
+    """
+    return bin(first ^ second).count("1")
+
+
+class FreezeWatchdog:
+    """
+    Periodically hashes a small screenshot. In case the hash did not
+    change within the freeze timeout, the browser is reloaded. If this
+    does not help the window manager is restarted, with a timeout that
+    doubles after every restart until the content changes again.
+
+    Checks are skipped while the display is off.
+    """
+
+    def __init__(self, display, browser, freeze_timeout: float = DEFAULT_FREEZE_TIMEOUT,
+                 interval: float = DEFAULT_CHECK_INTERVAL,
+                 threshold: int = DEFAULT_HASH_THRESHOLD):
+        self.__display = display
+        self.__browser = browser
+        self.__freeze_timeout = freeze_timeout
+        self.__threshold = threshold
+
+        # Content seen before the start says nothing about a freeze.
+        self.__worker = PeriodicWorker("watchdog", self.__tick, interval, on_start=self.reset)
+
+        self.__hash = None
+        self.__changed = None
+        self.__level = LEVEL_BROWSER
+        self.__backoff = 1
+        self.__counters = {
+            "checks": 0, "freezes": 0, "browser_reloads": 0,
+            "display_reloads": 0, "failures": 0}
+
+    def get_freeze_timeout(self) -> float:
+        """
+        Gets the seconds the content may stay unchanged.
+        """
+        return self.__freeze_timeout
+
+    def set_freeze_timeout(self, timeout: float):
+        """
+        Sets the seconds the content may stay unchanged, the counters are kept.
+        """
+        self.__freeze_timeout = timeout
+
+    def get_counters(self) -> dict:
+        """
+        Returns the counters of each escalation step and the factor the
+        timeout is currently multiplied with.
+        """
+        counters = dict(self.__counters)
+        counters["backoff"] = self.__backoff
+        return counters
+
+    def get_unchanged(self) -> float:
+        """
+        Returns the seconds since the content changed the last time.
+        """
+        if self.__changed is None:
+            return None
+
+        return time.monotonic() - self.__changed
+
+    def reset(self):
+        """
+        Forgets the last frame, e.g. because the content was changed on purpose.
+        """
+        self.__hash = None
+        self.__changed = None
+        self.__level = LEVEL_BROWSER
+        self.__backoff = 1
+
+    def check(self):
+        """
+        Hashes the current screen once and escalates in case it is frozen.
+        """
+        if self.__display.is_off():
+            self.reset()
+            return
+
+        frame = get_hash(self.__display.get_screenshot(
+            picture_format="png", max_width=CAPTURE_WIDTH, max_age=0))
+        self.__counters["checks"] += 1
+
+        now = time.monotonic()
+        if self.__hash is None:
+            self.__hash = frame
+            if self.__changed is None:
+                self.__changed = now
+            return
+
+        if get_distance(frame, self.__hash) > self.__threshold:
+            self.__hash = frame
+            self.__changed = now
+            self.__level = LEVEL_BROWSER
+            self.__backoff = 1
+            return
+
+        if now - self.__changed < self.__freeze_timeout * self.__backoff:
+            return
+
+        self.__counters["freezes"] += 1
+        self.__escalate()
+
+        # Give the reaction a full timeout to show an effect, the
+        # escalation level is kept until the content changes.
+        self.__hash = None
+        self.__changed = now
+
+    def __escalate(self):
+        logger = logging.getLogger('flask.app')
+
+        if self.__level == LEVEL_BROWSER:
+            logger.warning("Screen frozen for %ss, reloading the browser", self.__freeze_timeout)
+            self.__counters["browser_reloads"] += 1
+            self.__level = LEVEL_DISPLAY
+            handle = self.__browser.reload()
+        else:
+            logger.warning("Screen still frozen, restarting the window manager")
+            self.__counters["display_reloads"] += 1
+            self.__backoff = min(self.__backoff * 2, MAX_BACKOFF)
+            handle = self.__display.reload()
+
+        if not handle.wait(RELOAD_TIMEOUT):
+            logger.warning("Reaction to the frozen screen timed out")
+            self.__counters["failures"] += 1
+        elif handle.get_error() is not None:
+            self.__counters["failures"] += 1
+
+    def is_running(self) -> bool:
+        """
+        Checks if the watchdog is active.
+        """
+        return self.__worker.is_running()
+
+    def start(self):
+        """
+        Starts watching in a background thread.
+        """
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops watching.
+        """
+        self.__worker.stop()
+
+    def __tick(self):
+        try:
+            self.check()
+        except (ScreenCaptureException, ScreenshotOptionException, XlibException,
+                OSError, subprocess.CalledProcessError, ValueError) as ex:
+            self.__counters["failures"] += 1
+            logging.getLogger('flask.app').warning("Watchdog check failed: %s", ex)
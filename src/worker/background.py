@@ -0,0 +1,110 @@
+"""
+Runs a task in a background thread which can be stopped and started again.
+"""
+
+import threading
+
+
+class BackgroundWorker:
+    """
+    Owns the thread of a long running task.
+
+    The task polls is_running and sleeps via wait, so that a stop takes
+    effect immediately. Starts are serialized, a previous thread has to
+    exit before a new one is created, so there is never more than one.
+    """
+
+    def __init__(self, name: str, target, condition: threading.Condition = None,
+                 on_start=None):
+        self.__name = name
+        self.__target = target
+        self.__on_start = on_start
+        self.__condition = condition if condition is not None else threading.Condition()
+        self.__start_lock = threading.Lock()
+        self.__running = False
+        self.__thread = None
+
+    def get_condition(self) -> threading.Condition:
+        """
+        Returns the condition which is notified on stop, it may guard the
+        task's own state as well.
+        """
+        return self.__condition
+
+    def is_running(self) -> bool:
+        """
+        Checks if the task should keep running.
+        """
+        return self.__running
+
+    def start(self):
+        """
+        Starts the task in a new thread, it does nothing in case it is running.
+        """
+        with self.__start_lock:
+            with self.__condition:
+                if self.__running:
+                    return
+                thread = self.__thread
+
+            # A previous thread leaves as soon as it notices the stop.
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+
+            with self.__condition:
+                if self.__on_start is not None:
+                    self.__on_start()
+
+                self.__running = True
+                self.__thread = threading.Thread(
+                    target=self.__target, name=self.__name, daemon=True)
+                self.__thread.start()
+
+    def stop(self):
+        """
+        Asks the task to stop, it does not wait for the thread to exit.
+        """
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps for the timeout or until stopped, returns false once stopped.
+        """
+        with self.__condition:
+            if self.__running:
+                self.__condition.wait(timeout)
+
+            return self.__running
+
+
+class PeriodicWorker(BackgroundWorker):
+    """
+    Calls the task every interval seconds until stopped. The task is
+    responsible for handling its own errors.
+    """
+
+    def __init__(self, name: str, task, interval: float, on_start=None):
+        super().__init__(name, self.__run, on_start=on_start)
+        self.__task = task
+        self.__interval = interval
+
+    def get_interval(self) -> float:
+        """
+        Gets the seconds between two calls.
+        """
+        return self.__interval
+
+    def set_interval(self, interval: float):
+        """
+        Sets the seconds between two calls, it applies after the next call.
+        """
+        self.__interval = interval
+
+    def __run(self):
+        while True:
+            self.__task()
+
+            if not self.wait(self.__interval):
+                return
@@ -0,0 +1,436 @@
+"""
+A local caching reverse proxy for the kiosk's content.
+"""
+
+import http.client
+import http.server
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from src.httpcache import CacheEntry, HttpCache, MAX_OBJECT_SIZE
+
+DEFAULT_PROXY_PORT = 8081
+PROXY_HOST = "127.0.0.1"
+UPSTREAM_TIMEOUT = 10.0
+
+HOP_BY_HOP_HEADERS = (
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ProxyMetrics:
+    """
+    Counts how requests were served.
+    """
+
+    COUNTERS = (
+        "requests", "hits", "misses", "revalidated", "stale_while_revalidate",
+        "stale_if_error", "uncacheable", "errors", "bytes_from_cache", "bytes_from_upstream")
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = dict.fromkeys(ProxyMetrics.COUNTERS, 0)
+
+    def increment(self, name: str, value: int = 1):
+        """
+        Increments a counter.
+        """
+        with self.__lock:
+            self.__counters[name] += value
+
+    def get(self, name: str) -> int:
+        """
+        Returns a counter's value.
+        """
+        return self.__counters[name]
+
+    def to_dict(self) -> dict:
+        """
+        Returns all counters along with the hit ratio.
+        """
+        with self.__lock:
+            counters = dict(self.__counters)
+
+        served = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = counters["hits"] / served if served else 0.0
+        return counters
+
+
+class UpstreamResponse:
+    """
+    A response from upstream, the body is buffered as long as it is
+    small enough to be cached.
+    """
+
+    def __init__(self, status: int, headers: list, body: bytes, stream=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stream = stream
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """
+    Redirects are passed to the browser, so that its address bar stays correct.
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class CachingProxyWorker:
+    """
+    Serves the upstream origin on a local port and caches its responses.
+
+    Chromium is pointed at the local port instead of the origin. Fresh
+    responses are served from disk, stale ones are revalidated and served
+    stale in case upstream allows it or is not reachable.
+    """
+
+    def __init__(self, upstream: str, cache: HttpCache = None,
+                 port: int = DEFAULT_PROXY_PORT):
+        parsed = urllib.parse.urlsplit(upstream)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            raise ValueError(f"Invalid upstream {upstream}")
+
+        if cache is None:
+            cache = HttpCache()
+
+        self.__upstream = f"{parsed.scheme}://{parsed.netloc}"
+        self.__cache = cache
+        self.__port = port
+        self.__metrics = ProxyMetrics()
+        self.__opener = urllib.request.build_opener(NoRedirectHandler)
+        self.__revalidating = set()
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__worker = None
+
+    def get_upstream(self) -> str:
+        """
+        Gets the origin which is proxied, e.g. https://example.com
+        """
+        return self.__upstream
+
+    def get_port(self) -> int:
+        """
+        Gets the local port, it is the bound one while the proxy runs.
+        """
+        if self.__server is not None:
+            return self.__server.server_address[1]
+
+        return self.__port
+
+    def get_origin(self) -> str:
+        """
+        Gets the local origin chromium has to use.
+        """
+        return f"http://{PROXY_HOST}:{self.get_port()}"
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the hit and miss counters as well as the cache's usage.
+        """
+        metrics = self.__metrics.to_dict()
+        metrics.update({
+            "entries": self.__cache.get_count(),
+            "size": self.__cache.get_size(),
+            "max_size": self.__cache.get_max_size(),
+            "evictions": self.__cache.get_evictions()
+        })
+        return metrics
+
+    def get_cache(self) -> HttpCache:
+        """
+        Returns the cache.
+        """
+        return self.__cache
+
+    def rewrite(self, url: str) -> str:
+        """
+        Rewrites an upstream url to the local proxy, other urls are returned unchanged.
+        """
+        if url.startswith(self.__upstream + "/") or url == self.__upstream:
+            return self.get_origin() + url[len(self.__upstream):]
+
+        return url
+
+    def is_running(self) -> bool:
+        """
+        Checks if the proxy is serving requests.
+        """
+        return self.__worker is not None and self.__worker.is_alive()
+
+    def fetch(self, method: str, url: str, headers: dict, body: bytes = None) -> UpstreamResponse:
+        """
+        Forwards a request to upstream. Error responses are returned as
+        well, only network failures raise.
+        """
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+
+        try:
+            response = self.__opener.open(request, timeout=UPSTREAM_TIMEOUT)
+        except urllib.error.HTTPError as ex:
+            response = ex
+
+        status = response.getcode()
+        response_headers = [
+            (key, value) for key, value in response.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS]
+
+        body = response.read(MAX_OBJECT_SIZE + 1)
+        self.__metrics.increment("bytes_from_upstream", len(body))
+
+        if len(body) > MAX_OBJECT_SIZE:
+            return UpstreamResponse(status, response_headers, body, response)
+
+        response.close()
+        return UpstreamResponse(status, response_headers, body)
+
+    def __store(self, url: str, response: UpstreamResponse, headers: dict):
+        if response.stream is not None:
+            self.__metrics.increment("uncacheable")
+            return
+
+        if not CacheEntry.is_storable(
+                response.status, response.headers, len(response.body), headers):
+            self.__metrics.increment("uncacheable")
+            self.__cache.remove(url)
+            return
+
+        # Cookies belong to the response which set them, they are never replayed.
+        headers = [(key, value) for key, value in response.headers
+                   if key.lower() != "set-cookie"]
+
+        self.__cache.put(
+            CacheEntry(url, response.status, headers, time.time(), len(response.body)),
+            response.body)
+
+    def __revalidate(self, entry: CacheEntry, headers: dict) -> UpstreamResponse:
+        """
+        Asks upstream whether the entry is still valid. Returns the
+        response to serve, it is built from the cache on a 304.
+        """
+        conditional = dict(headers)
+        conditional.update(entry.get_validators())
+
+        response = self.fetch("GET", entry.get_url(), conditional)
+
+        if response.status == 304:
+            self.__metrics.increment("revalidated")
+            updated = entry.update(response.headers, time.time())
+            self.__cache.put(updated)
+
+            body = self.__cache.read(updated)
+            if body is not None:
+                return UpstreamResponse(updated.get_status(), updated.get_headers(), body)
+
+            # The body vanished, fetch it unconditionally.
+            response = self.fetch("GET", entry.get_url(), headers)
+
+        if response.status >= 500:
+            return response
+
+        self.__store(entry.get_url(), response, headers)
+        return response
+
+    def __revalidate_in_background(self, entry: CacheEntry, headers: dict):
+        with self.__lock:
+            if entry.get_url() in self.__revalidating:
+                return
+            self.__revalidating.add(entry.get_url())
+
+        def revalidate():
+            try:
+                self.__revalidate(entry, headers)
+            except (OSError, http.client.HTTPException) as ex:
+                logging.getLogger('flask.app').info(
+                    "Background revalidation of %s failed: %s", entry.get_url(), ex)
+            finally:
+                with self.__lock:
+                    self.__revalidating.discard(entry.get_url())
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+    def __from_cache(self, entry: CacheEntry, counter: str) -> UpstreamResponse:
+        body = self.__cache.read(entry)
+        if body is None:
+            return None
+
+        self.__metrics.increment(counter)
+        self.__metrics.increment("bytes_from_cache", len(body))
+
+        headers = [(key, value) for key, value in entry.get_headers() if key.lower() != "age"]
+        headers.append(("Age", str(int(entry.get_age()))))
+        return UpstreamResponse(entry.get_status(), headers, body)
+
+    def get(self, path: str, headers: dict) -> UpstreamResponse:
+        """
+        Serves a GET request for the upstream path from the cache or upstream.
+        """
+        self.__metrics.increment("requests")
+
+        url = self.__upstream + path
+        entry = self.__cache.get(url)
+        request_control = headers.get("Cache-Control", "")
+
+        if entry is not None and "no-cache" not in request_control:
+            if entry.is_fresh():
+                response = self.__from_cache(entry, "hits")
+                if response is not None:
+                    return response
+
+            elif entry.can_serve_while_revalidate():
+                response = self.__from_cache(entry, "stale_while_revalidate")
+                if response is not None:
+                    self.__revalidate_in_background(entry, headers)
+                    return response
+
+        try:
+            if entry is not None:
+                response = self.__revalidate(entry, headers)
+            else:
+                response = self.fetch("GET", url, headers)
+                self.__metrics.increment("misses")
+
+                if response.status < 500:
+                    self.__store(url, response, headers)
+
+        except (OSError, http.client.HTTPException) as ex:
+            logging.getLogger('flask.app').warning("Upstream request for %s failed: %s", url, ex)
+            response = None
+
+        if response is None or response.status >= 500:
+            self.__metrics.increment("errors")
+
+            if entry is not None and entry.can_serve_on_error():
+                stale = self.__from_cache(entry, "stale_if_error")
+                if stale is not None:
+                    return stale
+
+        if response is None:
+            return UpstreamResponse(502, [("Content-Type", "text/plain")], b"Bad Gateway")
+
+        return response
+
+    def create_handler(self):
+        """
+        Returns the request handler class bound to this proxy.
+        """
+        proxy = self
+
+        class ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+            """
+            Translates between the browser's requests and the proxy.
+            """
+
+            protocol_version = "HTTP/1.1"
+
+            def __get_headers(self) -> dict:
+                headers = {
+                    key: value for key, value in self.headers.items()
+                    if key.lower() not in HOP_BY_HOP_HEADERS}
+
+                # The cache stores one representation per url.
+                headers.pop("Accept-Encoding", None)
+                headers["Accept-Encoding"] = "gzip"
+                return headers
+
+            def __send(self, response: UpstreamResponse, head: bool = False):
+                self.send_response(response.status)
+
+                for key, value in response.headers:
+                    if key.lower() == "location":
+                        value = value.replace(proxy.get_upstream(), proxy.get_origin(), 1)
+                    self.send_header(key, value)
+
+                if response.stream is None:
+                    self.send_header("Content-Length", str(len(response.body)))
+                else:
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+
+                if head:
+                    return
+
+                self.wfile.write(response.body)
+
+                if response.stream is not None:
+                    while True:
+                        chunk = response.stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                    response.stream.close()
+
+            def do_GET(self):
+                """
+                Serves GET requests, they are cached.
+                """
+                self.__send(proxy.get(self.path, self.__get_headers()))
+
+            def do_HEAD(self):
+                """
+                Serves HEAD requests from the cached GET.
+                """
+                self.__send(proxy.get(self.path, self.__get_headers()), head=True)
+
+            def __forward(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else None
+
+                try:
+                    response = proxy.fetch(
+                        self.command, proxy.get_upstream() + self.path, self.__get_headers(), body)
+                except (OSError, http.client.HTTPException):
+                    response = UpstreamResponse(
+                        502, [("Content-Type", "text/plain")], b"Bad Gateway")
+
+                self.__send(response)
+
+            do_POST = __forward
+            do_PUT = __forward
+            do_PATCH = __forward
+            do_DELETE = __forward
+            do_OPTIONS = __forward
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                logging.getLogger('flask.app').debug("proxy: " + format, *args)
+
+        return ProxyRequestHandler
+
+    def run(self):
+        """
+        Runs the helper thread which serves the proxy.
+        """
+        if self.is_running():
+            raise RuntimeError("The proxy is already running.")
+
+        self.__server = http.server.ThreadingHTTPServer(
+            (PROXY_HOST, self.__port), self.create_handler())
+        self.__server.daemon_threads = True
+
+        self.__worker = threading.Thread(target=self.__server.serve_forever)
+        self.__worker.daemon = True
+        self.__worker.start()
+
+    def stop(self):
+        """
+        Stops serving requests.
+        """
+        if self.__server is None:
+            return
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__worker.join()
+
+        self.__server = None
+        self.__worker = None
@@ -0,0 +1,400 @@
+"""
+Minimal ctypes bindings for the X11 client library.
+
+Only the calls needed by the kiosk are bound. The libraries are loaded
+lazily, so importing this module works on systems without X11.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+X_DISPLAY = b":0"
+
+Z_PIXMAP = 2
+ALL_PLANES = 0xFFFFFFFFFFFFFFFF
+
+RR_SCREEN_CHANGE_NOTIFY_MASK = 1 << 0
+RR_CRTC_CHANGE_NOTIFY_MASK = 1 << 1
+RR_OUTPUT_CHANGE_NOTIFY_MASK = 1 << 2
+
+RR_SCREEN_CHANGE_NOTIFY = 0
+RR_NOTIFY = 1
+
+DPMS_MODE_ON = 0
+DPMS_MODE_STANDBY = 1
+DPMS_MODE_SUSPEND = 2
+DPMS_MODE_OFF = 3
+
+DONT_PREFER_BLANKING = 0
+DEFAULT_EXPOSURES = 2
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class XlibException(Exception):
+    """
+    Thrown in case a X11 call failed or the library is not available.
+    """
+
+
+class XImageFuncs(ctypes.Structure):
+    """
+    The function table embedded in each XImage.
+    """
+    _fields_ = [
+        ("create_image", ctypes.c_void_p),
+        ("destroy_image", ctypes.c_void_p),
+        ("get_pixel", ctypes.c_void_p),
+        ("put_pixel", ctypes.c_void_p),
+        ("sub_image", ctypes.c_void_p),
+        ("add_pixel", ctypes.c_void_p)]
+
+
+class XImage(ctypes.Structure):
+    """
+    Mirrors the XImage struct from Xlib.h
+    """
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+        ("obdata", ctypes.c_void_p),
+        ("f", XImageFuncs)]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    """
+    Mirrors the XShmSegmentInfo struct from XShm.h
+    """
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int)]
+
+
+class XErrorEvent(ctypes.Structure):
+    """
+    Mirrors the XErrorEvent struct from Xlib.h
+    """
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte)]
+
+
+class XEvent(ctypes.Union):
+    """
+    Mirrors the XEvent union from Xlib.h, only the type is of interest.
+    """
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("pad", ctypes.c_long * 24)]
+
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+XIOErrorExitHandler = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p)
+XDestroyImageFunc = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(XImage))
+
+
+class XLibrary:
+    """
+    Loads the shared libraries and declares the function prototypes.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__x11 = None
+        self.__xext = None
+        self.__xrandr = None
+        self.__libc = None
+
+    def __load(self, name):
+        path = ctypes.util.find_library(name)
+        if not path:
+            raise XlibException(f"Library {name} not found")
+
+        return ctypes.CDLL(path, use_errno=True)
+
+    def x11(self):
+        """
+        Returns the libX11 handle.
+        """
+        if self.__x11:
+            return self.__x11
+
+        with self.__lock:
+            if self.__x11:
+                return self.__x11
+
+            return self.__load_x11()
+
+    def __load_x11(self):
+        lib = self.__load("X11")
+
+        # Capture, dpms and hotplug use their own connections from different
+        # threads, xlib has to be made thread safe before the first call.
+        lib.XInitThreads.argtypes = []
+        if not lib.XInitThreads():
+            raise XlibException("Xlib does not support threads")
+
+        lib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        lib.XOpenDisplay.restype = ctypes.c_void_p
+        lib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        lib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        lib.XDefaultRootWindow.restype = ctypes.c_ulong
+        lib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        lib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.XDefaultVisual.restype = ctypes.c_void_p
+        lib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.XGetGeometry.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong,
+            ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+            ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint)]
+        lib.XGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+        lib.XGetImage.restype = ctypes.POINTER(XImage)
+        lib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        lib.XPending.argtypes = [ctypes.c_void_p]
+        lib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+        lib.XSetScreenSaver.argtypes = [
+            ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.XFlush.argtypes = [ctypes.c_void_p]
+        lib.XSetErrorHandler.argtypes = [XErrorHandler]
+        lib.XSetErrorHandler.restype = ctypes.c_void_p
+
+        if hasattr(lib, "XSetIOErrorExitHandler"):
+            lib.XSetIOErrorExitHandler.argtypes = [
+                ctypes.c_void_p, XIOErrorExitHandler, ctypes.c_void_p]
+
+        self.__x11 = lib
+        return lib
+
+    def xext(self):
+        """
+        Returns the libXext handle.
+        """
+        if self.__xext:
+            return self.__xext
+
+        lib = self.__load("Xext")
+
+        lib.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        lib.XShmCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo),
+            ctypes.c_uint, ctypes.c_uint]
+        lib.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        lib.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        lib.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        lib.XShmGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+            ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+
+        lib.DPMSQueryExtension.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+        lib.DPMSCapable.argtypes = [ctypes.c_void_p]
+        lib.DPMSEnable.argtypes = [ctypes.c_void_p]
+        lib.DPMSDisable.argtypes = [ctypes.c_void_p]
+        lib.DPMSForceLevel.argtypes = [ctypes.c_void_p, ctypes.c_ushort]
+        lib.DPMSInfo.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_ushort), ctypes.POINTER(ctypes.c_ubyte)]
+
+        self.__xext = lib
+        return lib
+
+    def xrandr(self):
+        """
+        Returns the libXrandr handle.
+        """
+        if self.__xrandr:
+            return self.__xrandr
+
+        lib = self.__load("Xrandr")
+
+        lib.XRRQueryExtension.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+        lib.XRRSelectInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int]
+
+        self.__xrandr = lib
+        return lib
+
+    def libc(self):
+        """
+        Returns the libc handle, needed for the SysV shared memory calls.
+        """
+        if self.__libc:
+            return self.__libc
+
+        lib = self.__load("c")
+
+        lib.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        lib.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        lib.shmat.restype = ctypes.c_void_p
+        lib.shmdt.argtypes = [ctypes.c_void_p]
+        lib.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        self.__libc = lib
+        return lib
+
+
+XLIB = XLibrary()
+
+# The error handler is process wide, errors are routed to the connection
+# they belong to by their display pointer.
+CONNECTIONS = {}
+
+
+@XErrorHandler
+def on_x_error(display, event):
+    """
+    Called by Xlib for every failed request.
+    """
+    connection = CONNECTIONS.get(display)
+    if connection:
+        connection.set_error(event.contents.error_code)
+
+    return 0
+
+
+def destroy_image(image):
+    """
+    Implements the XDestroyImage macro, it calls the image's destructor.
+    """
+    XDestroyImageFunc(image.contents.f.destroy_image)(image)
+
+
+class XConnection:
+    """
+    A persistent connection to the X server.
+
+    Xlib terminates the process on I/O errors, e.g. when the window manager
+    and thus the X server is restarted. A persistent connection is only
+    safe in case libX11 provides XSetIOErrorExitHandler, otherwise opening
+    the connection fails and the callers need to fall back to spawning
+    helper processes.
+    """
+
+    def __init__(self, display: bytes = X_DISPLAY):
+        self.__display_name = display
+        self.__display = None
+        self.__broken = False
+        self.__last_error = None
+        self.__lock = threading.RLock()
+
+        # Keep a reference to the callback, otherwise ctypes will
+        # garbage collect it while Xlib still points to it.
+        self.__io_error_handler = XIOErrorExitHandler(self.__on_io_error)
+
+    def __on_io_error(self, _display, _data):
+        logging.getLogger('flask.app').warning("Lost connection to the X server")
+        self.__broken = True
+
+    def set_error(self, error_code: int):
+        """
+        Records a failed request, it is reported by the next sync.
+        """
+        self.__last_error = error_code
+
+    def get_display(self):
+        """
+        Returns the raw display pointer, the connection needs to be open.
+        """
+        return self.__display
+
+    def get_lock(self) -> threading.RLock:
+        """
+        Xlib is not thread safe, every user of the connection has to hold this lock.
+        """
+        return self.__lock
+
+    def open(self):
+        """
+        Opens the connection in case it is not yet open or was lost.
+        """
+        with self.__lock:
+            if self.__broken:
+                self.close()
+
+            if self.__display:
+                return self.__display
+
+            x11 = XLIB.x11()
+
+            if not hasattr(x11, "XSetIOErrorExitHandler"):
+                raise XlibException("libX11 does not support recoverable I/O errors")
+
+            x11.XSetErrorHandler(on_x_error)
+
+            display = x11.XOpenDisplay(self.__display_name)
+            if not display:
+                raise XlibException(
+                    f"Failed to open display {self.__display_name.decode()}")
+
+            x11.XSetIOErrorExitHandler(display, self.__io_error_handler, None)
+
+            CONNECTIONS[display] = self
+            self.__display = display
+            self.__broken = False
+            return display
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        with self.__lock:
+            if not self.__display:
+                return
+
+            # A broken connection has to be leaked, calling into it will fail.
+            if not self.__broken:
+                XLIB.x11().XCloseDisplay(self.__display)
+
+            CONNECTIONS.pop(self.__display, None)
+            self.__display = None
+            self.__broken = False
+
+    def is_broken(self) -> bool:
+        """
+        Checks if the connection to the server was lost.
+        """
+        return self.__broken
+
+    def sync(self):
+        """
+        Waits until all requests were processed by the server and raises
+        an exception in case any of them failed.
+        """
+        XLIB.x11().XSync(self.__display, 0)
+
+        if self.__broken:
+            raise XlibException("Lost connection to the X server")
+
+        if self.__last_error is not None:
+            error = self.__last_error
+            self.__last_error = None
+            raise XlibException(f"X request failed with error code {error}")
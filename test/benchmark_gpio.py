@@ -0,0 +1,111 @@
+"""
+Compares the ctypes gpio structures with the former byte packers.
+
+The former packers concatenated small bytes objects, padded them one
+byte at a time and copied the result into an array for the ioctl. The
+structures are filled in place and passed to the ioctl as they are, a
+reused values structure needs no work at all before the ioctl.
+
+Run it from the repository's root with PYTHONPATH=. python test/benchmark_gpio.py
+"""
+
+import array
+import struct
+import timeit
+
+from src.gpio import (
+    GPIO_ATTRIBUTE_DEBOUNCE, GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN, GPIO_V2_LINE_FLAG_EDGE_FALLING,
+    GPIO_V2_LINE_FLAG_EDGE_RISING, GPIO_V2_LINE_FLAG_INPUT, GpioV2LineConfig,
+    GpioV2LineRequest, GpioV2LineValues)
+
+ROUNDS = 5
+NUMBER = 2000
+
+FLAGS = (GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN
+         | GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING)
+
+
+def legacy_pack_request(lines, consumer: str, debounce: int) -> array.array:
+    """
+    The former implementation of GpioV2LineRequest.pack including the copy for the ioctl.
+    """
+    attributes = struct.pack("<I", GPIO_ATTRIBUTE_DEBOUNCE) + struct.pack("<I", 0)
+    attributes += struct.pack("<I", debounce) + struct.pack("<I", 0)
+    attributes += struct.pack("<Q", 1)
+    while len(attributes) != 240:
+        attributes += b"\0"
+
+    config = bytes()
+    config += struct.pack("<Q", FLAGS)
+    config += struct.pack("<I", 1)
+    config += bytearray([0] * 5 * 4)
+    config += attributes
+
+    packed_lines = bytes()
+    for line in lines:
+        packed_lines += struct.pack("<I", line)
+    while len(packed_lines) != 256:
+        packed_lines += b"\0"
+
+    packed_consumer = consumer.encode("utf-8")
+    while len(packed_consumer) != 32:
+        packed_consumer += b"\0"
+
+    data = bytes()
+    data += packed_lines
+    data += packed_consumer
+    data += config
+    data += struct.pack("<I", len(lines))
+    data += struct.pack("<I", 0)
+    data += bytearray([0] * 5 * 4)
+    data += struct.pack("<i", 0)
+
+    return array.array("B", data)
+
+
+def legacy_values() -> array.array:
+    """
+    The former per read packing and copying of the line values.
+    """
+    data = bytearray()
+    data += struct.pack("<Q", 0)
+    data += struct.pack("<Q", 1)
+    return array.array("B", data)
+
+
+def create_request() -> GpioV2LineRequest:
+    """
+    Fills the request structure in place.
+    """
+    config = GpioV2LineConfig()
+    config.set_flag(FLAGS)
+    config.add_debounce(1, 5000)
+
+    request = GpioV2LineRequest()
+    request.add_line(18)
+    request.set_consumer("kiosk")
+    request.set_config(config)
+    return request
+
+
+def bench(name: str, func):
+    """
+    Runs the function a couple of times and prints the best result per call.
+    """
+    best = min(timeit.repeat(func, number=NUMBER, repeat=ROUNDS)) / NUMBER
+    print(f"  {name:<24} {best * 1000000:8.2f} us")
+
+
+if __name__ == '__main__':
+    assert bytes(legacy_pack_request([18], "kiosk", 5000)) == bytes(create_request())
+
+    print("line request")
+    bench("legacy packers", lambda: legacy_pack_request([18], "kiosk", 5000))
+    bench("ctypes structure", create_request)
+
+    values = GpioV2LineValues()
+    values.set_mask(1)
+
+    print("line values")
+    bench("legacy packers", legacy_values)
+    bench("reused structure", lambda: values)
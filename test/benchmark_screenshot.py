@@ -0,0 +1,106 @@
+"""
+Compares the native screenshot pipeline with xwd and convert.
+
+The frame sizes are taken from the xrandr fixtures. The offline run feeds
+a synthetic frame through both pipelines, the live run captures display :0
+in case it is available.
+
+Run it from the repository's root with PYTHONPATH=. python test/benchmark_screenshot.py
+"""
+
+from pathlib import Path
+import shutil
+import subprocess
+import timeit
+
+from src.display import Screen
+from src.screenshot import (
+    NativeScreenCapture, ScreenCaptureException, ScreenshotOptions, XwdScreenCapture,
+    downsample, encode_png, numpy)
+from src.xlib import XlibException
+
+FIXTURES = ["xrandr-hdmi1-connected.txt", "xrandr-no-screen-connected.txt"]
+SCALE = 10
+ROUNDS = 5
+
+
+def get_fixture_sizes():
+    """
+    Returns the resolutions of the primary screens in the fixtures.
+    """
+    sizes = set()
+    for fixture in FIXTURES:
+        with (Path(__file__).parent / fixture).open("r", encoding="utf-8") as f:
+            screen = Screen("HDMI-1").load(f.read())
+
+        sizes.add((screen.get_x_resolution(), screen.get_y_resolution()))
+
+    return sorted(sizes)
+
+
+def create_frame(width: int, height: int):
+    """
+    Creates a noisy frame in the X server's BGRX layout.
+    """
+    rng = numpy.random.default_rng(0)
+    return rng.integers(0, 256, (height, width, 4), dtype=numpy.uint8)
+
+
+def bench(name: str, func):
+    """
+    Runs the function a couple of times and prints the best result.
+    """
+    best = min(timeit.repeat(func, number=1, repeat=ROUNDS))
+    print(f"  {name:<32} {best * 1000:8.1f} ms")
+
+
+def run_offline(width: int, height: int):
+    """
+    Benchmarks the scaling and encoding on a synthetic frame.
+    """
+    frame = create_frame(width, height)
+
+    bench("native downsample + png", lambda: encode_png(
+        numpy.ascontiguousarray(downsample(frame, SCALE)[:, :, 2::-1])))
+
+    if not shutil.which("convert"):
+        print("  convert not installed, skipping")
+        return
+
+    ppm = (f"P6 {width} {height} 255\n".encode("ascii")
+           + numpy.ascontiguousarray(frame[:, :, 2::-1]).tobytes())
+
+    bench("convert -resize + png", lambda: subprocess.run(
+        ["convert", "ppm:-", "-resize", f"{SCALE}%", "png:-"],
+        input=ppm, stdout=subprocess.PIPE, check=True))
+
+
+def run_live():
+    """
+    Benchmarks both backends against the running X server.
+    """
+    native = NativeScreenCapture()
+    options = ScreenshotOptions(SCALE, "png")
+
+    try:
+        native.capture(options)
+    except (ScreenCaptureException, XlibException) as ex:
+        print(f"  display not available, skipping: {ex}")
+        return
+
+    bench("native capture", lambda: native.capture(options))
+
+    if shutil.which("xwd") and shutil.which("convert"):
+        xwd = XwdScreenCapture()
+        bench("xwd | convert", lambda: xwd.capture(options))
+
+    native.close()
+
+
+if __name__ == '__main__':
+    for fixture_width, fixture_height in get_fixture_sizes():
+        print(f"Synthetic frame {fixture_width}x{fixture_height}")
+        run_offline(fixture_width, fixture_height)
+
+    print("Live capture")
+    run_live()
@@ -0,0 +1,74 @@
+"""
+Compares the single pass topology parser with the former per screen regex scan.
+
+The parser extracts more than the former scan (modes, refresh rates and
+the EDID), the gain comes from parsing once per topology change instead
+of spawning xrandr and parsing on every request. The cost of a process
+spawn is printed as reference.
+
+Run it from the repository's root with PYTHONPATH=. python test/benchmark_xrandr.py
+"""
+
+from pathlib import Path
+import re
+import subprocess
+import timeit
+from unittest.mock import MagicMock, patch
+
+from src.display import Display
+from src.topology import DisplayTopology
+
+FIXTURES = [
+    "xrandr-hdmi1-connected.txt",
+    "xrandr-hdmi2-connected.txt",
+    "xrandr-no-screen-connected.txt"]
+
+ROUNDS = 5
+NUMBER = 200
+
+LEGACY_REGEX_GET_SCREEN_PROPERTIES = (
+    r"^(?P<name>\S+) (connected|disconnected) \S+( \S+)?( (\d+)x(\d+)\S+ \S+ (\S+))?")
+
+
+def legacy_parse(xrandr_data: str):
+    """
+    The former implementation, every screen built its own regex
+    and scanned the complete text again.
+    """
+    result = []
+    for match in re.finditer(LEGACY_REGEX_GET_SCREEN_PROPERTIES, xrandr_data, re.MULTILINE):
+        name = match.group('name')
+        pattern = (f"^{name}"
+            " (?P<status>disconnected|connected)"
+            "( (?P<primary>primary))?"
+            "( (?P<x_resolution>\\d+)x(?P<y_resolution>\\d+)\\S+ \\S+ (?P<orientation>\\S+))?")
+
+        screen = re.search(pattern, xrandr_data.strip(), re.MULTILINE)
+        result.append(screen.groupdict())
+
+    return result
+
+
+def bench(name: str, func):
+    """
+    Runs the function a couple of times and prints the best result per call.
+    """
+    best = min(timeit.repeat(func, number=NUMBER, repeat=ROUNDS)) / NUMBER
+    print(f"  {name:<24} {best * 1000000:8.1f} us")
+
+
+if __name__ == '__main__':
+    for fixture in FIXTURES:
+        with (Path(__file__).parent / fixture).open("r", encoding="utf-8") as f:
+            data = f.read()
+
+        print(fixture)
+        bench("legacy regex scan", lambda: legacy_parse(data))
+        bench("topology parser", lambda: DisplayTopology.parse(data))
+
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=data, returncode=0)
+            display = Display()
+            bench("cached get_screens", display.get_screens)
+
+    bench("process spawn", lambda: subprocess.run("true", shell=True, check=True))
@@ -0,0 +1,71 @@
+"""
+Test the background and periodic workers.
+"""
+
+import threading
+import unittest
+
+from src.worker.background import BackgroundWorker, PeriodicWorker
+
+TIMEOUT = 5
+
+
+class TestBackgroundWorker(unittest.TestCase):
+    """
+    Test starting and stopping the worker's thread.
+    """
+
+    def test_concurrent_start(self):
+        """
+        Concurrent starts create a single thread.
+        """
+        entered = threading.Semaphore(0)
+        threads = []
+
+        def run():
+            threads.append(threading.current_thread())
+            entered.release()
+            while worker.wait(TIMEOUT):
+                pass
+
+        worker = BackgroundWorker("test", run)
+        starters = [threading.Thread(target=worker.start) for _ in range(10)]
+        for starter in starters:
+            starter.start()
+        for starter in starters:
+            starter.join()
+
+        self.assertTrue(entered.acquire(timeout=TIMEOUT))
+        self.assertTrue(worker.is_running())
+
+        worker.stop()
+        self.assertFalse(worker.is_running())
+
+        worker.start()
+        self.assertTrue(entered.acquire(timeout=TIMEOUT))
+        self.assertEqual(2, len(threads))
+        # The previous thread exited before the new one was created.
+        self.assertFalse(threads[0].is_alive())
+
+        worker.stop()
+
+    def test_periodic(self):
+        """
+        Calls the task until stopped, the start hook runs before the thread.
+        """
+        calls = threading.Semaphore(0)
+        started = []
+
+        worker = PeriodicWorker("test", calls.release, 0.01, on_start=lambda: started.append(1))
+        worker.start()
+
+        for _ in range(3):
+            self.assertTrue(calls.acquire(timeout=TIMEOUT))
+
+        self.assertEqual([1], started)
+        worker.stop()
+        self.assertFalse(worker.wait(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Test the chromium performance profile.
+"""
+
+import unittest
+
+from src.browserprofile import BrowserProfile, BrowserProfileException
+
+
+class TestBrowserProfile(unittest.TestCase):
+    """
+    Test the validation and the translation into command line flags.
+    """
+
+    def test_flags(self):
+        """
+        Round trips through the command line flags.
+        """
+        profile = BrowserProfile(
+            gpu_rasterization=True, disk_cache_dir="/dev/shm/chromium", disk_cache_size=64,
+            renderer_process_limit=2, background_throttling=False,
+            disabled_features=["Translate", "MediaRouter"])
+
+        self.assertEqual([
+            "--enable-gpu-rasterization",
+            "--disk-cache-dir=/dev/shm/chromium",
+            "--disk-cache-size=67108864",
+            "--renderer-process-limit=2",
+            "--disable-background-timer-throttling",
+            "--disable-renderer-backgrounding",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-features=Translate,MediaRouter"], profile.to_flags())
+
+        self.assertEqual(
+            profile.to_dict(), BrowserProfile.from_flags(profile.to_flags()).to_dict())
+        self.assertEqual([], BrowserProfile().to_flags())
+
+    def test_invalid(self):
+        """
+        Rejects options which would break or inject into the command line.
+        """
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile(disk_cache_dir="/tmp/cache --no-sandbox")
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile(renderer_process_limit=0)
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile(disabled_features=["SitePerProcess"])
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile.from_dict({"no_sandbox": True})
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile.from_dict({"gpu_rasterization": "false"})
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile.from_dict({"disabled_features": "Translate"})
+
+        with self.assertRaises(BrowserProfileException):
+            BrowserProfile.from_flags(["--disk-cache-size=large"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+"""
+Test the devtools client and the browser's soft reload.
+"""
+
+import base64
+import hashlib
+import json
+from pathlib import Path
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.browserprofile import BrowserProfile
+from src.cdp import WEBSOCKET_GUID, CdpCommandException, CdpConnection, CdpException
+from src.display import Browser
+
+BROWSER_CONFIG = (
+    "KIOSK_HOME=https://www.example.com/\n"
+    "KIOSK_SCALE_FACTOR=1.5\n")
+
+
+def server_frame(opcode: int, payload: bytes, final: bool = True) -> bytes:
+    """
+    Encodes an unmasked server frame.
+    """
+    first = (0x80 if final else 0x00) | opcode
+    if len(payload) < 126:
+        return struct.pack("!BB", first, len(payload)) + payload
+
+    return struct.pack("!BBH", first, 126, len(payload)) + payload
+
+
+def read_client_frame(reader) -> dict:
+    """
+    Decodes a masked client frame into a json message.
+    """
+    _, second = reader.read(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", reader.read(2))[0]
+
+    mask = reader.read(4)
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(reader.read(length)))
+    return json.loads(payload)
+
+
+class FakeDevtools(threading.Thread):
+    """
+    Accepts one websocket and answers a single command. The answer
+    is preceded by an event and split into two fragments.
+    """
+
+    def __init__(self, error: bool = False):
+        super().__init__(daemon=True)
+        self.__server = socket.create_server(("127.0.0.1", 0))
+        self.__error = error
+        self.received = None
+
+    def get_url(self) -> str:
+        """
+        Returns the websocket url.
+        """
+        return f"ws://127.0.0.1:{self.__server.getsockname()[1]}/devtools/page/1"
+
+    def run(self):
+        connection, _ = self.__server.accept()
+        reader = connection.makefile("rb")
+
+        key = None
+        while True:
+            line = reader.readline().decode("latin-1").strip()
+            if not line:
+                break
+            if line.lower().startswith("sec-websocket-key:"):
+                key = line.split(":", 1)[1].strip()
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        connection.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("ascii"))
+
+        self.received = read_client_frame(reader)
+
+        event = json.dumps({"method": "Page.loadEventFired", "params": {"timestamp": 1}})
+        connection.sendall(server_frame(0x1, event.encode()))
+
+        if self.__error:
+            result = {"id": self.received["id"], "error": {"message": "Invalid url"}}
+        else:
+            result = {"id": self.received["id"], "result": {"frameId": "A" * 200}}
+
+        data = json.dumps(result).encode()
+        connection.sendall(server_frame(0x1, data[:100], final=False))
+        connection.sendall(server_frame(0x0, data[100:]))
+
+        reader.close()
+        connection.close()
+        self.__server.close()
+
+
+class TestCdpConnection(unittest.TestCase):
+    """
+    Test the websocket based devtools session.
+    """
+
+    def test_call(self):
+        """
+        Sends a command, dispatches events and reassembles the result.
+        """
+        server = FakeDevtools()
+        server.start()
+
+        events = []
+        connection = CdpConnection(server.get_url())
+        connection.add_listener("Page.loadEventFired", events.append)
+
+        result = connection.call("Page.navigate", {"url": "https://example.com"})
+        server.join()
+        connection.close()
+
+        self.assertEqual("A" * 200, result["frameId"])
+        self.assertEqual([{"timestamp": 1}], events)
+        self.assertEqual("Page.navigate", server.received["method"])
+        self.assertEqual({"url": "https://example.com"}, server.received["params"])
+
+    def test_error(self):
+        """
+        Command errors are reported as exception.
+        """
+        server = FakeDevtools(error=True)
+        server.start()
+
+        connection = CdpConnection(server.get_url())
+        with self.assertRaises(CdpCommandException):
+            connection.call("Page.navigate", {"url": "invalid"})
+
+        server.join()
+        connection.close()
+
+
+class TestBrowser(unittest.TestCase):
+    """
+    Test the soft reload logic.
+    """
+
+    def setUp(self):
+        self.__directory = tempfile.TemporaryDirectory()
+        self.__config = Path(self.__directory.name) / "browser.conf"
+        self.__config.write_text(BROWSER_CONFIG)
+
+    def tearDown(self):
+        self.__directory.cleanup()
+
+    def test_soft_reload(self):
+        """
+        Navigates in case the url changed, reloads otherwise.
+        """
+        cdp = MagicMock()
+        cdp.get_page.return_value = {"url": "https://www.example.com/"}
+        cdp.call.return_value = {}
+
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                patch("subprocess.run") as mock_run:
+            browser = Browser(cdp=cdp)
+
+            browser.reload().wait()
+            cdp.call.assert_called_with("Page.reload", {"ignoreCache": False})
+
+            browser.set_url("https://www.example.org/")
+            browser.reload().wait()
+            cdp.call.assert_called_with("Page.navigate", {"url": "https://www.example.org/"})
+
+            mock_run.assert_not_called()
+
+    def test_scale(self):
+        """
+        The scale is a command line flag, changing it restarts the browser once.
+        """
+        cdp = MagicMock()
+        cdp.get_page.return_value = {"url": "https://www.example.com/"}
+        cdp.call.return_value = {}
+
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                patch("subprocess.run") as mock_run:
+            browser = Browser(cdp=cdp)
+
+            browser.set_scale_factor("1.5")
+            browser.reload().wait()
+            mock_run.assert_not_called()
+
+            browser.set_scale_factor("2.0")
+            self.assertIn("KIOSK_SCALE_FACTOR=2.0\n", self.__config.read_text())
+            browser.reload().wait()
+            mock_run.assert_called_once_with(
+                "systemctl restart kiosk-browser.service", shell=True, check=True)
+
+            browser.reload().wait()
+            mock_run.assert_called_once()
+
+            for call in cdp.call.call_args_list:
+                self.assertNotEqual("Emulation.setDeviceMetricsOverride", call[0][0])
+
+    def test_restart(self):
+        """
+        Restarts the browser in case it does not respond.
+        """
+        cdp = MagicMock()
+        cdp.call.side_effect = CdpException("Connection refused")
+
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                patch("subprocess.run") as mock_run:
+            Browser(cdp=cdp).reload().wait()
+
+            mock_run.assert_called_once_with(
+                "systemctl restart kiosk-browser.service", shell=True, check=True)
+            cdp.close.assert_called_once()
+
+    def test_proxy(self):
+        """
+        The proxy is only used by navigating the running browser.
+        """
+        cdp = MagicMock()
+        cdp.get_page.return_value = {"url": "https://www.example.com/"}
+        cdp.call.return_value = {}
+        proxy = MagicMock()
+        proxy.rewrite.return_value = "http://127.0.0.1:8080/"
+
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                patch("subprocess.run") as mock_run:
+            browser = Browser(cdp=cdp)
+
+            browser.set_proxy(proxy).wait()
+            cdp.call.assert_called_with("Page.navigate", {"url": "http://127.0.0.1:8080/"})
+            self.assertNotIn("127.0.0.1", self.__config.read_text())
+
+            mock_run.assert_not_called()
+
+    def test_profile(self):
+        """
+        A changed profile is stored in the config and restarts the browser once.
+        """
+        cdp = MagicMock()
+        cdp.get_page.return_value = {"url": "https://www.example.com/"}
+        cdp.call.return_value = {}
+
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                patch("subprocess.run") as mock_run:
+            browser = Browser(cdp=cdp)
+
+            browser.set_profile(BrowserProfile(gpu_rasterization=True))
+            self.assertIn("KIOSK_FLAGS=--enable-gpu-rasterization\n", self.__config.read_text())
+            self.assertTrue(browser.get_profile().to_dict()["gpu_rasterization"])
+
+            browser.reload().wait()
+            mock_run.assert_called_once_with(
+                "systemctl restart kiosk-browser.service", shell=True, check=True)
+
+            browser.set_profile(BrowserProfile(gpu_rasterization=True))
+            browser.reload().wait()
+            mock_run.assert_called_once()
+
+        # Broken flags fall back to the defaults.
+        self.__config.write_text(BROWSER_CONFIG + "KIOSK_FLAGS=--disk-cache-size=large\n")
+        with patch("src.display.CONFIG_BROWSER", self.__config), \
+                self.assertLogs('flask.app', level="WARNING"):
+            self.assertEqual(
+                BrowserProfile().to_dict(), Browser(cdp=cdp).get_profile().to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
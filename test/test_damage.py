@@ -0,0 +1,76 @@
+"""
+Test the damage tracking logic.
+"""
+
+import unittest
+
+from src.damage import DamageTracker, TileHasher, numpy
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestDamageTracker(unittest.TestCase):
+    """
+    Test the tile hashes and the damage regions.
+    """
+
+    def test_tile_hashes(self):
+        """
+        A single changed byte alters only the hash of its tile.
+        """
+        hasher = TileHasher(16)
+        frame = numpy.zeros((40, 50, 3), dtype=numpy.uint8)
+
+        before = hasher.hash(frame)
+        self.assertEqual(before.shape, (3, 4))
+
+        frame[39, 49, 2] = 1
+        after = hasher.hash(frame)
+
+        self.assertEqual((before != after).sum(), 1)
+        self.assertNotEqual(before[2, 3], after[2, 3])
+
+    def test_damage(self):
+        """
+        Returns the changed regions merged into horizontal runs.
+        """
+        tracker = DamageTracker(TileHasher(16), keyframe_ratio=0.5)
+        frame = numpy.zeros((64, 72, 3), dtype=numpy.uint8)
+
+        first, _, regions = tracker.track(frame)
+        self.assertIsNone(regions)
+        self.assertEqual(tracker.track(frame.copy(), first)[0], first)
+
+        frame = frame.copy()
+        frame[20, 0:40] = 255
+        frame[50, 70] = 255
+        second, current, regions = tracker.track(frame, first)
+        self.assertEqual(second, first + 1)
+        self.assertIs(current, frame)
+
+        self.assertEqual(
+            [(r.get_x(), r.get_y(), r.get_width(), r.get_height()) for r in regions],
+            [(0, 16, 48, 16), (64, 48, 8, 16)])
+
+        frame_id, _, regions = tracker.track(frame, second)
+        self.assertEqual(frame_id, second)
+        self.assertEqual(regions, [])
+
+    def test_keyframe(self):
+        """
+        Requests a keyframe for unknown frames or when too much changed.
+        """
+        tracker = DamageTracker(TileHasher(16), history=2, keyframe_ratio=0.5)
+        frame = numpy.zeros((32, 32, 3), dtype=numpy.uint8)
+
+        first = tracker.track(frame)[0]
+        self.assertIsNone(tracker.track(frame, None)[2])
+        self.assertIsNone(tracker.track(frame, first - 1)[2])
+
+        self.assertIsNone(tracker.track(numpy.full((32, 32, 3), 1, dtype=numpy.uint8), first)[2])
+
+        # The first frame dropped out of the history.
+        tracker.track(numpy.full((32, 32, 3), 2, dtype=numpy.uint8))
+        self.assertIsNone(tracker.track(frame.copy(), first)[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,26 @@ Test the cron file logic.
 """
 
 from pathlib import Path
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
 from src.display import CMD_GET_SCREENS, Display, DisplayException, Screen
+from src.screenconfig import ScreenConfigStore
+from src.topology import DisplayTopology
+
+ROTATED_SCREEN = (
+    "Screen 0: minimum 320 x 200, current 1080 x 1920, maximum 7680 x 7680\n"
+    "HDMI-1 connected 1080x1920+0+0 (0x4c) left X axis (normal left inverted right x axis y axis) 597mm x 336mm\n"
+    "\tIdentifier: 0x44\n"
+    "\tEDID:\n"
+    "\t\t00ffffffffffff00\n"
+    "\t\t15c31429f08dc403\n"
+    "\tnon-desktop: 0\n"
+    "  1920x1080 (0x4c) 148.500MHz +HSync +VSync *current +preferred\n"
+    "        h: width  1920 start 2008 end 2052 total 2200 skew    0 clock  67.50KHz\n"
+    "        v: height 1080 start 1084 end 1089 total 1125           clock  60.00Hz\n"
+    "HDMI-2 disconnected (normal left inverted right x axis y axis)\n")
 
 class TestDisplay(unittest.TestCase):
     """
@@ -39,6 +55,172 @@ class TestDisplay(unittest.TestCase):
             self.assertEqual(0, hdmi2.get_y_resolution())
             self.assertEqual("normal", hdmi2.get_orientation())
 
+    def test_cached_topology(self):
+        """
+        The topology is queried once and shared until it is invalidated.
+        """
+        with patch("subprocess.run") as mock_run:
+
+            data = ""
+            with (Path(__file__).parent / "xrandr-hdmi1-connected.txt").open("r") as f:
+                data = f.read()
+
+            mock_run.return_value = MagicMock(stdout=data, returncode=0)
+
+            display = Display()
+            self.assertEqual(2, len(display.get_screens()))
+            self.assertEqual("connected", display.get_screen("HDMI-1").get_status())
+            self.assertEqual(1, mock_run.call_count)
+
+            with self.assertRaises(DisplayException):
+                display.get_screen("HDMI-3")
+
+            display.invalidate_topology()
+            display.get_screen("HDMI-2")
+            self.assertEqual(2, mock_run.call_count)
+
+            # Failed queries are not cached.
+            mock_run.return_value = MagicMock(stdout="", returncode=1)
+            display.invalidate_topology()
+            self.assertEqual([], display.get_screens())
+            self.assertEqual([], display.get_screens())
+            self.assertEqual(4, mock_run.call_count)
+
+
+    def test_refresh_topology(self):
+        """
+        Refreshing replaces the cache and notifies listeners only on changes.
+        """
+        with patch("subprocess.run") as mock_run:
+
+            with (Path(__file__).parent / "xrandr-hdmi1-connected.txt").open("r") as f:
+                hdmi1 = f.read()
+            with (Path(__file__).parent / "xrandr-hdmi2-connected.txt").open("r") as f:
+                hdmi2 = f.read()
+
+            changes = []
+            display = Display()
+            display.add_topology_listener(changes.append)
+
+            mock_run.return_value = MagicMock(stdout=hdmi1, returncode=0)
+            display.refresh_topology()
+            display.refresh_topology()
+            self.assertEqual([], changes)
+
+            mock_run.return_value = MagicMock(stdout=hdmi2, returncode=0)
+            display.refresh_topology()
+            self.assertEqual(1, len(changes))
+
+            # Served from memory without spawning xrandr.
+            self.assertIs(changes[0], display.get_topology())
+            self.assertEqual(3, mock_run.call_count)
+
+
+    def test_set_screen_live(self):
+        """
+        Rotates the screen via xrandr without restarting the window manager.
+        """
+        with (Path(__file__).parent / "xrandr-hdmi1-connected.txt").open("r") as f:
+            before = f.read()
+
+        after = ROTATED_SCREEN.replace("connected 1080", "connected primary 1080")
+        state = {"xrandr": before}
+
+        def run(command, **_kwargs):
+            if isinstance(command, list):
+                state["xrandr"] = after
+                return MagicMock(returncode=0)
+
+            return MagicMock(stdout=state["xrandr"], returncode=0)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch("subprocess.run", side_effect=run) as mock_run:
+
+            store = ScreenConfigStore(directory)
+            display = Display(screen_configs=store)
+            display.set_screen("HDMI-1", "left")
+
+            mock_run.assert_any_call(
+                ["xrandr", "--display", ":0",
+                 "--output", "HDMI-1", "--auto", "--rotate", "left", "--primary",
+                 "--output", "HDMI-2", "--off"],
+                capture_output=True, text=True, check=False)
+
+            for call in mock_run.call_args_list:
+                self.assertNotIn("systemctl", str(call))
+
+            self.assertEqual("left", display.get_screen("HDMI-1").get_orientation())
+            self.assertEqual(
+                "#!/bin/sh\nxrandr --output HDMI-1 --rotate left --primary\n",
+                (Path(directory) / "HDMI-1").read_text())
+            self.assertTrue(store.get("HDMI-2").is_off())
+
+
+class TestDisplayTopology(unittest.TestCase):
+    """
+    Test the xrandr parser.
+    """
+
+    def test_connected(self):
+        """
+        Parses outputs, modes and the EDID.
+        """
+        with (Path(__file__).parent / "xrandr-hdmi1-connected.txt").open("r") as f:
+            topology = DisplayTopology.parse(f.read())
+
+        self.assertEqual((3840, 2160), (topology.get_width(), topology.get_height()))
+        self.assertEqual(
+            ["HDMI-1", "HDMI-2"], [output.get_name() for output in topology.get_outputs()])
+
+        hdmi1 = topology.get_output("HDMI-1")
+        self.assertTrue(hdmi1.is_connected())
+        self.assertTrue(hdmi1.is_primary())
+        self.assertEqual((3840, 2160, 0, 0), hdmi1.get_geometry())
+        self.assertEqual("normal", hdmi1.get_rotation())
+        self.assertIsNone(hdmi1.get_reflection())
+        self.assertEqual(256, len(hdmi1.get_edid()))
+        self.assertEqual(b"\x00\xff\xff\xff\xff\xff\xff\x00", hdmi1.get_edid()[:8])
+
+        modes = hdmi1.get_modes()
+        self.assertEqual(26, len(modes))
+        self.assertEqual("0x47", modes[0].get_id())
+        self.assertEqual((3840, 2160), (modes[0].get_width(), modes[0].get_height()))
+        self.assertEqual(30.0, modes[0].get_refresh())
+        self.assertTrue(modes[0].is_current())
+        self.assertFalse(modes[1].is_current())
+        self.assertEqual(70.08, modes[-1].get_refresh())
+
+        hdmi2 = topology.get_output("HDMI-2")
+        self.assertFalse(hdmi2.is_connected())
+        self.assertFalse(hdmi2.is_primary())
+        self.assertEqual((0, 0, 0, 0), hdmi2.get_geometry())
+        self.assertEqual((), hdmi2.get_modes())
+        self.assertEqual(b"", hdmi2.get_edid())
+
+        self.assertIsNone(topology.get_output("HDMI-3"))
+
+    def test_rotated(self):
+        """
+        Parses the rotation and reflection.
+        """
+        topology = DisplayTopology.parse(ROTATED_SCREEN)
+
+        hdmi1 = topology.get_output("HDMI-1")
+        self.assertFalse(hdmi1.is_primary())
+        self.assertEqual((1080, 1920, 0, 0), hdmi1.get_geometry())
+        self.assertEqual("left", hdmi1.get_rotation())
+        self.assertEqual("X axis", hdmi1.get_reflection())
+        self.assertEqual(16, len(hdmi1.get_edid()))
+
+        mode = hdmi1.get_modes()[0]
+        self.assertTrue(mode.is_current())
+        self.assertTrue(mode.is_preferred())
+        self.assertEqual(60.0, mode.get_refresh())
+
+        screen = Screen("HDMI-1").load(ROTATED_SCREEN)
+        self.assertEqual("left", screen.get_orientation())
+        self.assertEqual(1080, screen.get_x_resolution())
+
 
 
 class TestScreen(unittest.TestCase):
@@ -0,0 +1,97 @@
+"""
+Test the display power logic.
+"""
+
+import subprocess
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.dpms import DisplayPower, XsetDisplayPower
+from src.xlib import XlibException
+
+XSET_MONITOR_OFF = (
+    "DPMS (Energy Star):\n"
+    "  Standby: 600    Suspend: 600    Off: 600\n"
+    "  DPMS is Enabled\n"
+    "  Monitor is Off\n")
+
+XSET_DPMS_DISABLED = (
+    "DPMS (Energy Star):\n"
+    "  Standby: 600    Suspend: 600    Off: 600\n"
+    "  DPMS is Disabled\n")
+
+
+class TestDisplayPower(unittest.TestCase):
+    """
+    Test the backend selection.
+    """
+
+    def test_native_power(self):
+        """
+        Uses the native backend if it works.
+        """
+        native = MagicMock()
+        native.is_off.return_value = True
+        fallback = MagicMock()
+
+        power = DisplayPower(native, fallback)
+        power.on()
+        power.off()
+        self.assertTrue(power.is_off())
+
+        native.on.assert_called_once()
+        native.off.assert_called_once()
+        fallback.on.assert_not_called()
+        fallback.off.assert_not_called()
+        fallback.is_off.assert_not_called()
+
+    def test_fallback_power(self):
+        """
+        Falls back to xset in case the native backend fails.
+        """
+        native = MagicMock()
+        native.on.side_effect = XlibException("No display")
+        native.is_off.side_effect = XlibException("No display")
+        fallback = MagicMock()
+        fallback.is_off.return_value = False
+
+        power = DisplayPower(native, fallback)
+        power.on()
+        self.assertFalse(power.is_off())
+
+        fallback.on.assert_called_once()
+        fallback.is_off.assert_called_once()
+
+
+class TestXsetDisplayPower(unittest.TestCase):
+    """
+    Test the xset based backend.
+    """
+
+    def test_is_off(self):
+        """
+        Scans the xset status for the monitor's state.
+        """
+        with patch("subprocess.run") as mock_run:
+            power = XsetDisplayPower()
+
+            mock_run.return_value = MagicMock(stdout=XSET_MONITOR_OFF)
+            self.assertTrue(power.is_off())
+
+            mock_run.return_value = MagicMock(stdout=XSET_DPMS_DISABLED)
+            self.assertFalse(power.is_off())
+
+            mock_run.assert_called_with(
+                ["/bin/bash", "-c", "DISPLAY=:0 xset -q"],
+                check=True, stdout=subprocess.PIPE, text=True)
+
+    def test_on(self):
+        """
+        Turns the monitor on and disables the screensaver.
+        """
+        with patch("subprocess.run") as mock_run:
+            XsetDisplayPower().on()
+
+            self.assertEqual(4, mock_run.call_count)
+            mock_run.assert_any_call(
+                ["/bin/bash", "-c", "DISPLAY=:0 xset dpms force on"], check=True)
@@ -0,0 +1,119 @@
+"""
+Test the gpio uapi structures against the kernel's abi.
+"""
+
+import os
+import struct
+import unittest
+
+from src.gpio import (
+    GPIO_ATTRIBUTE_DEBOUNCE, GPIO_V2_GET_LINE_IOCTL, GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN,
+    GPIO_V2_LINE_FLAG_INPUT, GPIO_V2_LINE_GET_VALUES_IOCTL, GPIO_V2_LINE_SET_CONFIG_IOCTL,
+    GpioException,
+    GPIO_V2_LINE_EVENT_FALLING_EDGE, GPIO_V2_LINE_EVENT_RISING_EDGE, GpioLine,
+    GpioV2LineConfig, GpioV2LineEvent, GpioV2LineRequest, GpioV2LineValues)
+
+
+class TestGpioLayout(unittest.TestCase):
+    """
+    Test the structures' layout.
+    """
+
+    def test_offsets(self):
+        """
+        The fields are at the offsets defined by linux/gpio.h.
+        """
+        self.assertEqual(256, GpioV2LineRequest.consumer.offset)
+        self.assertEqual(288, GpioV2LineRequest.config.offset)
+        self.assertEqual(560, GpioV2LineRequest.num_lines.offset)
+        self.assertEqual(588, GpioV2LineRequest.fd.offset)
+        self.assertEqual(32, GpioV2LineConfig.attrs.offset)
+        self.assertEqual(24, GpioV2LineEvent.padding.offset)
+        self.assertEqual(8, GpioV2LineValues.mask.offset)
+
+    def test_ioctl(self):
+        """
+        The request codes are derived from the structure sizes.
+        """
+        self.assertEqual(0xC250B407, GPIO_V2_GET_LINE_IOCTL)
+        self.assertEqual(0xC010B40E, GPIO_V2_LINE_GET_VALUES_IOCTL)
+        self.assertEqual(0xC110B40D, GPIO_V2_LINE_SET_CONFIG_IOCTL)
+
+    def test_request(self):
+        """
+        The request is laid out exactly like the former byte packers did.
+        """
+        config = GpioV2LineConfig()
+        config.enable_input()
+        config.enable_pull_down()
+        config.add_debounce(1, 5000)
+
+        request = GpioV2LineRequest()
+        request.add_line(18)
+        request.set_consumer("kiosk")
+        request.set_config(config)
+
+        expected = struct.pack("<64I", 18, *[0] * 63)
+        expected += b"kiosk".ljust(32, b"\0")
+        expected += struct.pack(
+            "<QI20x", GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN, 1)
+        expected += struct.pack("<IIIIQ", GPIO_ATTRIBUTE_DEBOUNCE, 0, 5000, 0, 1)
+        expected += bytes(216)
+        expected += struct.pack("<II20xi", 1, 0, 0)
+
+        self.assertEqual(expected, bytes(request))
+
+    def test_limits(self):
+        """
+        Rejects more attributes than the kernel supports.
+        """
+        config = GpioV2LineConfig()
+        for _ in range(10):
+            config.add_debounce(1, 1000)
+
+        with self.assertRaises(GpioException):
+            config.add_debounce(1, 1000)
+
+
+class TestGpioLine(unittest.TestCase):
+    """
+    Test reading edge events.
+    """
+
+    def setUp(self):
+        self.reader, self.writer = os.pipe()
+
+    def tearDown(self):
+        os.close(self.reader)
+        os.close(self.writer)
+
+    def write_event(self, edge: int, seqno: int):
+        """
+        Writes an event the way the kernel does.
+        """
+        os.write(self.writer, struct.pack("<QIIII24x", seqno * 1000, edge, 18, seqno, seqno))
+
+    def test_read_events(self):
+        """
+        Reads several events at once and reports gaps in the sequence.
+        """
+        line = GpioLine(self.reader, [18], batch=4)
+
+        self.write_event(GPIO_V2_LINE_EVENT_RISING_EDGE, 1)
+        self.write_event(GPIO_V2_LINE_EVENT_FALLING_EDGE, 2)
+
+        events = line.read_events()
+        self.assertEqual(2, len(events))
+        self.assertTrue(events[0].is_rising())
+        self.assertFalse(events[1].is_rising())
+        self.assertEqual((2000, 18, 2), (events[1].timestamp_ns, events[1].offset, events[1].seqno))
+        self.assertEqual(0, line.get_dropped())
+
+        self.write_event(GPIO_V2_LINE_EVENT_RISING_EDGE, 5)
+        with self.assertLogs('flask.app', level="WARNING"):
+            self.assertEqual(5, line.read_events()[0].seqno)
+        self.assertEqual(2, line.get_dropped())
+
+
+if __name__ == '__main__':
+    unittest.main()
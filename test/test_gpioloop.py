@@ -0,0 +1,174 @@
+"""
+Test multiplexing gpio lines in a single thread.
+"""
+
+import os
+import queue
+import struct
+import time
+import unittest
+
+from src.gpio import GPIO_V2_LINE_EVENT_FALLING_EDGE, GPIO_V2_LINE_EVENT_RISING_EDGE, GpioLine
+from src.gpioloop import GpioEventLoop
+
+TIMEOUT = 5
+
+
+class TestGpioEventLoop(unittest.TestCase):
+    """
+    Test the event loop with pipes in place of line requests.
+    """
+
+    def setUp(self):
+        self.loop = GpioEventLoop()
+        self.events = queue.Queue()
+        self.writers = []
+
+    def tearDown(self):
+        self.loop.stop()
+        for writer in self.writers:
+            os.close(writer)
+
+    def create_line(self, offset: int) -> GpioLine:
+        """
+        Creates a line backed by a pipe.
+        """
+        reader, writer = os.pipe()
+        self.writers.append(writer)
+        return GpioLine(reader, [offset])
+
+    def write_event(self, line: int, edge: int, offset: int, seqno: int):
+        """
+        Writes an event the way the kernel does.
+        """
+        os.write(self.writers[line], struct.pack("<QIIII24x", seqno, edge, offset, seqno, seqno))
+
+    def on_events(self, line, events):
+        """
+        Collects the events.
+        """
+        self.events.put((line, events))
+
+    def test_multiplex(self):
+        """
+        Events of several lines are dispatched to their handlers.
+        """
+        first = self.create_line(17)
+        second = self.create_line(18)
+        self.loop.add_line(first, self.on_events)
+        self.loop.add_line(second, self.on_events)
+
+        self.write_event(1, GPIO_V2_LINE_EVENT_RISING_EDGE, 18, 1)
+        line, events = self.events.get(timeout=TIMEOUT)
+        self.assertIs(second, line)
+        self.assertEqual(18, events[0].offset)
+
+        self.write_event(0, GPIO_V2_LINE_EVENT_FALLING_EDGE, 17, 1)
+        line, events = self.events.get(timeout=TIMEOUT)
+        self.assertIs(first, line)
+        self.assertFalse(events[0].is_rising())
+
+    def test_remove_line(self):
+        """
+        A removed line is released without waiting for an event.
+        """
+        line = self.create_line(18)
+        self.loop.add_line(line, self.on_events)
+        self.assertEqual(1, self.loop.get_line_count())
+
+        self.loop.remove_line(line)
+
+        deadline = time.monotonic() + TIMEOUT
+        while line.get_fd() != -1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(-1, line.get_fd())
+        self.assertEqual(0, self.loop.get_line_count())
+        self.assertTrue(self.loop.is_running())
+
+    def test_remove_line_wait(self):
+        """
+        Waiting for the removal returns once the line is released.
+        """
+        line = self.create_line(18)
+        self.loop.add_line(line, self.on_events)
+
+        self.assertTrue(self.loop.remove_line(line, wait=True))
+        self.assertEqual(-1, line.get_fd())
+
+    def test_stop(self):
+        """
+        Stopping returns immediately and releases all lines.
+        """
+        line = self.create_line(18)
+        self.loop.add_line(line, self.on_events)
+
+        start = time.monotonic()
+        self.loop.stop()
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(self.loop.is_running())
+        self.assertEqual(-1, line.get_fd())
+
+    def test_failing_handler(self):
+        """
+        An exception in a handler does not end the loop.
+        """
+        def fail(line, events):
+            raise ValueError("failed")
+
+        self.loop.add_line(self.create_line(17), fail)
+        self.loop.add_line(self.create_line(18), self.on_events)
+
+        with self.assertLogs('flask.app', level="ERROR"):
+            self.write_event(0, GPIO_V2_LINE_EVENT_RISING_EDGE, 17, 1)
+            self.write_event(1, GPIO_V2_LINE_EVENT_RISING_EDGE, 18, 1)
+            self.events.get(timeout=TIMEOUT)
+
+            # Handlers run one after another, the failure was logged by now.
+            time.sleep(0.1)
+            self.write_event(1, GPIO_V2_LINE_EVENT_RISING_EDGE, 18, 2)
+            self.events.get(timeout=TIMEOUT)
+
+        self.assertTrue(self.loop.is_running())
+
+    def test_failing_line(self):
+        """
+        A line which can not be read is released, the others are still served.
+        """
+        broken = self.create_line(17)
+        self.loop.add_line(broken, self.on_events)
+        self.loop.add_line(self.create_line(18), self.on_events)
+
+        with self.assertLogs('flask.app', level="ERROR"):
+            # A partial event can not be decoded.
+            os.write(self.writers[0], b"partial")
+
+            deadline = time.monotonic() + TIMEOUT
+            while broken.get_fd() != -1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(-1, broken.get_fd())
+        self.assertTrue(self.loop.is_running())
+
+        self.write_event(1, GPIO_V2_LINE_EVENT_RISING_EDGE, 18, 1)
+        line, _ = self.events.get(timeout=TIMEOUT)
+        self.assertEqual([18], line.get_lines())
+
+    def test_restart(self):
+        """
+        A stopped loop is started again by the next line.
+        """
+        self.loop.add_line(self.create_line(17), self.on_events)
+        self.loop.stop()
+
+        self.loop.add_line(self.create_line(18), self.on_events)
+        self.assertTrue(self.loop.is_running())
+
+        self.write_event(1, GPIO_V2_LINE_EVENT_RISING_EDGE, 18, 1)
+        line, _ = self.events.get(timeout=TIMEOUT)
+        self.assertEqual([18], line.get_lines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+"""
+Test the http cache and the caching proxy.
+"""
+
+import http.server
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+
+from src.httpcache import CacheEntry, HttpCache
+from src.worker.proxy import CachingProxyWorker
+
+URL = "https://example.com/index.html"
+
+
+class TestCacheEntry(unittest.TestCase):
+    """
+    Test the freshness calculation.
+    """
+
+    def test_max_age(self):
+        """
+        Fresh within max-age, stale while revalidate only within its window.
+        """
+        entry = CacheEntry(
+            URL, 200, [("Cache-Control", "max-age=60, stale-while-revalidate=30")], 1000)
+
+        self.assertTrue(entry.is_fresh(1059))
+        self.assertFalse(entry.is_fresh(1060))
+        self.assertTrue(entry.can_serve_while_revalidate(1089))
+        self.assertFalse(entry.can_serve_while_revalidate(1090))
+
+    def test_stale_if_error(self):
+        """
+        Stale content is served on errors unless upstream requires revalidation.
+        """
+        entry = CacheEntry(URL, 200, [("Cache-Control", "max-age=0, stale-if-error=10")], 1000)
+        self.assertTrue(entry.can_serve_on_error(1009))
+        self.assertFalse(entry.can_serve_on_error(1010))
+
+        entry = CacheEntry(URL, 200, [("Cache-Control", "max-age=0, must-revalidate")], 1000)
+        self.assertFalse(entry.can_serve_on_error(1001))
+
+        # The default window does not apply to responses marked no-cache.
+        entry = CacheEntry(URL, 200, [("Cache-Control", "no-cache")], 1000)
+        self.assertFalse(entry.can_serve_on_error(1001))
+
+        entry = CacheEntry(URL, 200, [("Cache-Control", "max-age=0")], 1000)
+        self.assertTrue(entry.can_serve_on_error(1001))
+
+    def test_is_storable(self):
+        """
+        Rejects no-store, private, uncacheable status codes and arbitrary
+        vary headers. Responses to requests with credentials need to be
+        marked as shared.
+        """
+        self.assertTrue(CacheEntry.is_storable(200, [("Vary", "Accept-Encoding")], 10))
+        self.assertFalse(CacheEntry.is_storable(200, [("Cache-Control", "no-store")], 10))
+        self.assertFalse(CacheEntry.is_storable(200, [("Vary", "Cookie")], 10))
+        self.assertFalse(CacheEntry.is_storable(500, [], 10))
+        self.assertFalse(CacheEntry.is_storable(200, [("Cache-Control", "private")], 10))
+
+        credentials = {"Authorization": "Basic a2lvc2s6a2lvc2s="}
+        self.assertFalse(CacheEntry.is_storable(200, [], 10, credentials))
+        self.assertFalse(CacheEntry.is_storable(200, [], 10, {"Cookie": "session=1"}))
+        self.assertTrue(CacheEntry.is_storable(
+            200, [("Cache-Control", "public, max-age=60")], 10, credentials))
+        self.assertTrue(CacheEntry.is_storable(
+            200, [("Cache-Control", "s-maxage=60")], 10, credentials))
+
+    def test_update(self):
+        """
+        A 304 refreshes the headers but keeps the body's metadata.
+        """
+        entry = CacheEntry(
+            URL, 200, [("ETag", '"a"'), ("Content-Length", "3"), ("Cache-Control", "max-age=1")],
+            1000, 3)
+
+        updated = entry.update([("Cache-Control", "max-age=60"), ("Content-Length", "0")], 2000)
+
+        self.assertEqual("max-age=60", updated.get_header("Cache-Control"))
+        self.assertEqual("3", updated.get_header("Content-Length"))
+        self.assertEqual('"a"', updated.get_header("ETag"))
+        self.assertEqual(2000, updated.get_stored())
+
+
+class TestHttpCache(unittest.TestCase):
+    """
+    Test the on disk store.
+    """
+
+    def test_lru_eviction(self):
+        """
+        Evicts the least recently used entries once the limit is exceeded.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache = HttpCache(directory, max_size=20)
+
+            for name in ("a", "b"):
+                cache.put(CacheEntry(f"{URL}?{name}", 200, [], time.time(), 10), b"0123456789")
+
+            # Touch a, so that b is evicted.
+            self.assertIsNotNone(cache.get(f"{URL}?a"))
+            cache.put(CacheEntry(f"{URL}?c", 200, [], time.time(), 10), b"0123456789")
+
+            self.assertIsNone(cache.get(f"{URL}?b"))
+            self.assertEqual(b"0123456789", cache.read(cache.get(f"{URL}?a")))
+            self.assertEqual(1, cache.get_evictions())
+            self.assertEqual(20, cache.get_size())
+
+            # The entries survive a restart.
+            restored = HttpCache(directory, max_size=20)
+            self.assertEqual(2, restored.get_count())
+            self.assertIsNotNone(restored.get(f"{URL}?c"))
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves a cacheable page and counts the requests.
+    """
+
+    requests = 0
+    fail = False
+
+    def do_GET(self):
+        """
+        Answers with a short lived, revalidatable page.
+        """
+        UpstreamHandler.requests += 1
+
+        if UpstreamHandler.fail:
+            self.send_error(503)
+            return
+
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Cache-Control", "max-age=60")
+            self.end_headers()
+            return
+
+        body = b"hello"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Cache-Control", "max-age=60")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestCachingProxy(unittest.TestCase):
+    """
+    Test the proxy against a local upstream.
+    """
+
+    def setUp(self):
+        UpstreamHandler.requests = 0
+        UpstreamHandler.fail = False
+
+        self.upstream = http.server.ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+        threading.Thread(target=self.upstream.serve_forever, daemon=True).start()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.proxy = CachingProxyWorker(
+            f"http://127.0.0.1:{self.upstream.server_port}", HttpCache(self.directory.name), 0)
+
+    def tearDown(self):
+        self.upstream.shutdown()
+        self.upstream.server_close()
+        self.directory.cleanup()
+
+    def test_hit_and_miss(self):
+        """
+        The first request is a miss, the second one is served from the cache.
+        """
+        self.assertEqual(b"hello", self.proxy.get("/", {}).body)
+        self.assertEqual(b"hello", self.proxy.get("/", {}).body)
+
+        metrics = self.proxy.get_metrics()
+        self.assertEqual(1, metrics["misses"])
+        self.assertEqual(1, metrics["hits"])
+        self.assertEqual(1, UpstreamHandler.requests)
+
+    def test_revalidate_and_error(self):
+        """
+        Stale entries are revalidated and served stale when upstream fails.
+        """
+        self.proxy.get("/", {})
+        entry = self.proxy.get_cache().get(self.proxy.get_upstream() + "/")
+        self.proxy.get_cache().put(
+            CacheEntry(entry.get_url(), 200, entry.get_headers(), time.time() - 120, 5))
+
+        self.assertEqual(b"hello", self.proxy.get("/", {}).body)
+        self.assertEqual(1, self.proxy.get_metrics()["revalidated"])
+
+        entry = self.proxy.get_cache().get(self.proxy.get_upstream() + "/")
+        self.proxy.get_cache().put(
+            CacheEntry(entry.get_url(), 200, entry.get_headers(), time.time() - 120, 5))
+
+        UpstreamHandler.fail = True
+        response = self.proxy.get("/", {})
+        self.assertEqual(200, response.status)
+        self.assertEqual(b"hello", response.body)
+        self.assertEqual(1, self.proxy.get_metrics()["stale_if_error"])
+
+    def test_rewrite(self):
+        """
+        Only urls of the upstream origin are routed through the proxy.
+        """
+        upstream = self.proxy.get_upstream()
+
+        self.assertEqual(
+            self.proxy.get_origin() + "/page?a=1", self.proxy.rewrite(upstream + "/page?a=1"))
+        self.assertEqual("https://other.com/", self.proxy.rewrite("https://other.com/"))
+
+    def test_serve(self):
+        """
+        The browser facing server relays the cached response.
+        """
+        proxy = CachingProxyWorker(self.proxy.get_upstream(), self.proxy.get_cache(), 0)
+        proxy.run()
+
+        try:
+            port = proxy.get_port()
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=5) as response:
+                self.assertEqual(b"hello", response.read())
+        finally:
+            proxy.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
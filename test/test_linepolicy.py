@@ -0,0 +1,101 @@
+"""
+Test translating the motion sensor's line settings into a line config.
+"""
+
+import unittest
+
+from src.gpio import (
+    GPIO_ATTRIBUTE_DEBOUNCE, GPIO_V2_LINE_FLAG_ACTIVE_LOW, GPIO_V2_LINE_FLAG_BIAS_DISABLED,
+    GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN, GPIO_V2_LINE_FLAG_BIAS_PULL_UP,
+    GPIO_V2_LINE_FLAG_EDGE_FALLING, GPIO_V2_LINE_FLAG_EDGE_RISING,
+    GPIO_V2_LINE_FLAG_EVENT_CLOCK_REALTIME, GPIO_V2_LINE_FLAG_INPUT)
+from src.linepolicy import LinePolicy, LinePolicyException
+
+
+class TestLinePolicy(unittest.TestCase):
+    """
+    Test the line policy.
+    """
+
+    def test_defaults(self):
+        """
+        By default the line is pulled down and reports both edges without debounce.
+        """
+        config = LinePolicy().to_config()
+
+        self.assertEqual(
+            GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_BIAS_PULL_DOWN
+            | GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING,
+            config.flags)
+        self.assertEqual(0, config.num_attrs)
+
+    def test_to_config(self):
+        """
+        Every setting is mapped to its flag, the debounce to an attribute.
+        """
+        config = LinePolicy(
+            bias="pull-up", edges="rising", active_low=True,
+            debounce=3500, clock="realtime").to_config(mask=0b10)
+
+        self.assertEqual(
+            GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_BIAS_PULL_UP
+            | GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_ACTIVE_LOW
+            | GPIO_V2_LINE_FLAG_EVENT_CLOCK_REALTIME,
+            config.flags)
+
+        self.assertEqual(1, config.num_attrs)
+        self.assertEqual(0b10, config.attrs[0].mask)
+        self.assertEqual(GPIO_ATTRIBUTE_DEBOUNCE, config.attrs[0].attr.id)
+        self.assertEqual(3500000, config.attrs[0].attr.debounce_period_us)
+
+        self.assertEqual(
+            GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_BIAS_DISABLED
+            | GPIO_V2_LINE_FLAG_EDGE_RISING | GPIO_V2_LINE_FLAG_EDGE_FALLING,
+            LinePolicy(bias="disabled").to_config().flags)
+
+        self.assertEqual(
+            GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_EDGE_RISING
+            | GPIO_V2_LINE_FLAG_EDGE_FALLING,
+            LinePolicy(bias="as-is").to_config().flags)
+
+    def test_dict(self):
+        """
+        The settings survive a round trip.
+        """
+        policy = LinePolicy(bias="pull-up", debounce="250", clock="hte")
+        self.assertEqual(policy.to_dict(), LinePolicy.from_dict(policy.to_dict()).to_dict())
+        self.assertEqual(250, policy.get_debounce())
+
+        self.assertEqual(LinePolicy().to_dict(), LinePolicy.from_dict({}).to_dict())
+
+    def test_invalid(self):
+        """
+        Unknown values and out of range periods are rejected.
+        """
+        with self.assertRaises(LinePolicyException):
+            LinePolicy(bias="floating")
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy(edges="falling")
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy(clock="boottime")
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy(debounce=-1)
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy(debounce="soon")
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy.from_dict({"pull": "up"})
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy.from_dict([])
+
+        with self.assertRaises(LinePolicyException):
+            LinePolicy.from_dict({"active_low": "false"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Test the chromium memory governor.
+"""
+
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.memory import MemoryGovernor, find_process_tree, read_pressure, read_usage
+from src.reload import RELOAD_TIMEOUT
+
+MEGABYTE = 1024 * 1024
+
+
+class TestMemoryGovernor(unittest.TestCase):
+    """
+    Test reading the usage from a fake proc filesystem and recycling.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.proc = pathlib.Path(self.directory.name)
+
+        (self.proc / "meminfo").write_text("MemTotal:        1000000 kB\n", encoding="utf-8")
+        (self.proc / "pressure").mkdir()
+        self.set_pressure(0.0)
+
+        self.add_process(1, "systemd", 0)
+        self.add_process(100, "chromium-browse", 1, 200 * 1024, 150 * 1024)
+        self.add_process(101, "chromium-browse", 100, 300 * 1024, 250 * 1024)
+        self.add_process(102, "renderer helper", 101, 100 * 1024, 100 * 1024)
+        self.add_process(200, "python3", 1, 50 * 1024, 50 * 1024)
+
+        self.browser = MagicMock()
+        self.browser.restart.return_value.get_error.return_value = None
+        self.display = MagicMock()
+        self.display.is_off.return_value = False
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def set_pressure(self, avg60: float):
+        """
+        Writes the memory pressure stall information.
+        """
+        (self.proc / "pressure" / "memory").write_text(
+            f"some avg10=0.00 avg60={avg60:.2f} avg300=0.00 total=0\n"
+            "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n", encoding="utf-8")
+
+    def add_process(self, pid: int, name: str, ppid: int, rss: int = 0, pss: int = 0):
+        """
+        Creates a fake process with the given memory usage in kilobytes.
+        """
+        directory = self.proc / str(pid)
+        directory.mkdir()
+        (directory / "stat").write_text(f"{pid} ({name}) S {ppid} 0 0\n", encoding="utf-8")
+        (directory / "smaps_rollup").write_text(
+            f"00400000-7fff [rollup]\nRss:  {rss} kB\nPss:  {pss} kB\n", encoding="utf-8")
+
+    def create_governor(self, limit: int) -> MemoryGovernor:
+        """
+        Creates a governor reading from the fake proc filesystem.
+        """
+        return MemoryGovernor(
+            self.browser, self.display, limit, quiet_wait=60,
+            proc=self.proc, pressure_file=self.proc / "pressure" / "memory")
+
+    def test_usage(self):
+        """
+        Sums up the whole process tree including children with other names.
+        """
+        self.assertEqual([100, 101, 102], find_process_tree(proc=self.proc))
+        self.assertEqual({"rss": 200 * MEGABYTE, "pss": 150 * MEGABYTE}, read_usage(100, self.proc))
+        self.assertEqual(0.0, read_pressure(self.proc / "pressure" / "memory")["some"]["avg60"])
+
+        sample = self.create_governor(None).sample()
+        self.assertEqual(3, sample["processes"])
+        self.assertEqual(500 * MEGABYTE, sample["pss"])
+        self.assertEqual(600 * MEGABYTE, sample["rss"])
+
+        self.assertEqual(500000 * 1024, self.create_governor(None).get_limit())
+
+    def test_deferred_recycle(self):
+        """
+        Waits for the display to be switched off before recycling.
+        """
+        governor = self.create_governor(450 * MEGABYTE)
+
+        governor.check()
+        self.browser.restart.assert_not_called()
+        self.assertEqual(1, governor.get_status()["counters"]["deferred"])
+
+        self.display.is_off.return_value = True
+        governor.check()
+        self.browser.restart.assert_called_once()
+        self.assertEqual(1, governor.get_status()["counters"]["recycles"])
+        self.assertEqual(0, governor.get_status()["counters"]["forced_recycles"])
+
+    def test_forced_recycle(self):
+        """
+        Recycles right away beyond the hard limit or under pressure, the
+        pressure alone does not count as chromium may not be the cause.
+        """
+        self.create_governor(300 * MEGABYTE).check()
+        self.browser.restart.assert_called_once()
+
+        self.browser.reset_mock()
+        governor = self.create_governor(1000 * MEGABYTE)
+        governor.check()
+        self.assertFalse(governor.get_status()["pending"])
+
+        self.set_pressure(50.0)
+        governor.check()
+        self.assertFalse(governor.get_status()["pending"])
+        self.browser.restart.assert_not_called()
+
+        self.create_governor(450 * MEGABYTE).check()
+        self.browser.restart.assert_called_once()
+
+    def test_restart_timeout(self):
+        """
+        A restart which does not finish in time counts as failure.
+        """
+        self.browser.restart.return_value.wait.return_value = False
+
+        governor = self.create_governor(300 * MEGABYTE)
+        governor.check()
+
+        self.browser.restart.return_value.wait.assert_called_once_with(RELOAD_TIMEOUT)
+        self.assertEqual(1, governor.get_status()["counters"]["failures"])
+        self.assertEqual(0, governor.get_status()["counters"]["recycles"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,321 @@
+"""
+Test combining several motion sensors.
+"""
+
+import errno
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.gpio import (
+    GPIO_V2_LINE_EVENT_FALLING_EDGE, GPIO_V2_LINE_EVENT_RISING_EDGE, GpioEdgeEvent, GpioLine)
+from src.gpioloop import GpioEventLoop
+from src.linepolicy import LinePolicy
+from src.motionsensor import (
+    AGGREGATION_QUORUM, MotionSensor, MotionSensorException, Sensor)
+from src.scheduler import DeadlineScheduler
+
+TIMEOUT = 5
+
+
+def edge(offset: int, rising: bool, seqno: int = 1) -> GpioEdgeEvent:
+    """
+    Creates an edge event for the line.
+    """
+    kind = GPIO_V2_LINE_EVENT_RISING_EDGE if rising else GPIO_V2_LINE_EVENT_FALLING_EDGE
+    return GpioEdgeEvent(seqno, kind, offset, seqno, seqno)
+
+
+class TestMotionSensor(unittest.TestCase):
+    """
+    Test the sensor registry and the aggregation.
+    """
+
+    def setUp(self):
+        self.display = MagicMock()
+        self.display.is_off.return_value = True
+        self.loop = MagicMock()
+        self.requests = []
+
+        patcher = patch("src.motionsensor.GpioDevice", side_effect=self.create_device)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_device(self, chip):
+        """
+        Fakes a gpio chip which records the line requests.
+        """
+        def get_lines(name, offsets, config):
+            lines = MagicMock()
+            lines.get_fd.return_value = len(self.requests)
+            lines.get_lines.return_value = offsets
+            lines.get_active.return_value = {}
+            lines.get_dropped.return_value = 0
+            self.requests.append((chip, offsets, lines))
+            return lines
+
+        device = MagicMock()
+        device.__enter__.return_value.get_lines.side_effect = get_lines
+        return device
+
+    def wait_for(self, condition):
+        """
+        Polls until the timers did their job.
+        """
+        deadline = time.monotonic() + TIMEOUT
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertTrue(condition())
+
+    def test_line_requests(self):
+        """
+        Lines on the same chip share one request.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("door", "/dev/gpiochip0", 17),
+            Sensor("desk", "/dev/gpiochip0", 18),
+            Sensor("hall", "/dev/gpiochip1", 4)])
+
+        sensor.enable()
+
+        self.assertEqual(
+            [("/dev/gpiochip0", [17, 18]), ("/dev/gpiochip1", [4])],
+            [(chip, offsets) for chip, offsets, _ in self.requests])
+        self.assertEqual(2, self.loop.add_line.call_count)
+        self.assertTrue(sensor.is_enabled())
+
+        sensor.disable()
+        self.assertEqual(2, self.loop.remove_line.call_count)
+        self.assertFalse(sensor.is_enabled())
+
+    def test_any(self):
+        """
+        Any active sensor keeps the screen on, each one with its own delay.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("door", line=17, delay=0.05, zone="entrance"),
+            Sensor("desk", line=18, delay=0.2)])
+        sensor.enable()
+        lines = self.requests[0][2]
+
+        sensor.on_events("/dev/gpiochip0", lines, [edge(17, True), edge(18, True, 2)])
+        self.display.on.assert_called_once()
+
+        sensor.on_events("/dev/gpiochip0", lines, [edge(17, False, 3), edge(18, False, 4)])
+        self.wait_for(lambda: not sensor.get_sensors()[0].is_active())
+        self.display.off.assert_not_called()
+
+        self.wait_for(lambda: self.display.off.called)
+
+        stats = sensor.get_sensors()[0].get_stats()
+        self.assertEqual("entrance", stats["zone"])
+        self.assertEqual(2, stats["events"])
+        self.assertEqual(1, stats["activations"])
+        self.assertFalse(stats["active"])
+        self.assertEqual(2, sensor.get_wakeups())
+
+    def test_quorum(self):
+        """
+        In quorum mode a single sensor does not turn the screen on.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("left", line=17), Sensor("right", line=18), Sensor("top", line=19)],
+            aggregation=AGGREGATION_QUORUM, quorum=2)
+        sensor.enable()
+        lines = self.requests[0][2]
+
+        sensor.on_events("/dev/gpiochip0", lines, [edge(17, True)])
+        self.display.on.assert_not_called()
+
+        sensor.on_events("/dev/gpiochip0", lines, [edge(19, True, 2)])
+        self.display.on.assert_called_once()
+
+        sensor.disable()
+
+    def test_latest_edge(self):
+        """
+        Only the latest edge of a batch counts for each sensor.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop)
+        sensor.enable()
+        lines = self.requests[0][2]
+
+        sensor.on_events("/dev/gpiochip0", lines, [edge(18, False), edge(18, True, 2)])
+        self.assertTrue(sensor.get_sensors()[0].is_active())
+        self.display.on.assert_called_once()
+
+        sensor.disable()
+        self.assertFalse(sensor.get_sensors()[0].is_active())
+
+    def test_repeated_falling_edges(self):
+        """
+        Each falling edge replaces the sensor's pending timeout.
+        """
+        scheduler = DeadlineScheduler()
+        sensor = MotionSensor(self.display, 30, self.loop, scheduler=scheduler)
+        sensor.enable()
+        lines = self.requests[0][2]
+
+        for seqno in range(1, 100, 2):
+            sensor.on_events("/dev/gpiochip0", lines, [edge(18, True, seqno)])
+            sensor.on_events("/dev/gpiochip0", lines, [edge(18, False, seqno + 1)])
+
+        self.assertEqual(1, scheduler.get_pending())
+
+        sensor.disable()
+        self.assertEqual(0, scheduler.get_pending())
+
+    @patch("src.motionsensor.GPIO_V2_LINES_MAX", 1)
+    def test_dropped_events(self):
+        """
+        Lost events of every line request on a chip are summed up, also
+        after the lines were released.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("door", "/dev/gpiochip0", 17), Sensor("desk", "/dev/gpiochip0", 18)])
+        sensor.enable()
+
+        self.assertEqual(2, len(self.requests))
+        self.requests[0][2].get_dropped.return_value = 3
+        self.requests[1][2].get_dropped.return_value = 2
+
+        for _, _, lines in self.requests:
+            sensor.on_events("/dev/gpiochip0", lines, [])
+
+        self.assertEqual(5, sensor.get_dropped_events())
+
+        sensor.disable()
+        self.assertEqual(5, sensor.get_dropped_events())
+
+    def test_rejected_policy(self):
+        """
+        A policy the kernel rejects is not taken over.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("door", "/dev/gpiochip0", 17), Sensor("hall", "/dev/gpiochip1", 4)])
+        sensor.enable()
+        self.requests[1][2].set_config.side_effect = OSError(errno.EINVAL, "Invalid argument")
+
+        with self.assertRaises(OSError):
+            sensor.set_policy(LinePolicy(clock="hte"))
+
+        self.assertEqual("monotonic", sensor.get_policy().to_dict()["clock"])
+        # The first request was reconfigured and is rolled back.
+        self.assertEqual(2, self.requests[0][2].set_config.call_count)
+
+    def test_invalid(self):
+        """
+        Duplicate sensors and impossible quorums are rejected before
+        anything changes.
+        """
+        with self.assertRaises(MotionSensorException):
+            MotionSensor(self.display, 30, self.loop, sensors=[
+                Sensor("left", line=17), Sensor("left", line=18)])
+
+        with self.assertRaises(MotionSensorException):
+            MotionSensor(self.display, 30, self.loop, sensors=[
+                Sensor("left", line=17), Sensor("right", line=17)])
+
+        with self.assertRaises(MotionSensorException):
+            MotionSensor(self.display, 30, self.loop, aggregation=AGGREGATION_QUORUM, quorum=2)
+
+        sensor = MotionSensor(self.display, 30, self.loop)
+        with self.assertRaises(MotionSensorException):
+            sensor.set_sensors(
+                [Sensor("left", line=17), Sensor("right", line=18)], AGGREGATION_QUORUM, 3)
+        self.assertEqual(["default"], [item.get_name() for item in sensor.get_sensors()])
+
+        with self.assertRaises(MotionSensorException):
+            Sensor(chip="/tmp/gpiochip0")
+
+        with self.assertRaises(MotionSensorException):
+            Sensor.from_dict({"name": "door", "pin": 4})
+
+        self.assertEqual(
+            Sensor("door", line="4").to_dict(),
+            Sensor.from_dict(Sensor("door", line=4).to_dict()).to_dict())
+
+
+class TestMotionSensorLoop(unittest.TestCase):
+    """
+    Test requesting lines again with the real event loop, pipes stand in
+    for the line requests and a held line is busy like in the kernel.
+    """
+
+    def setUp(self):
+        self.display = MagicMock()
+        self.loop = GpioEventLoop()
+        self.held = []
+        self.writers = []
+
+        patcher = patch("src.motionsensor.GpioDevice", side_effect=self.create_device)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.stop()
+        for writer in self.writers:
+            os.close(writer)
+
+    def create_device(self, chip):
+        """
+        Fakes a gpio chip which refuses lines held by an open request.
+        """
+        def get_lines(name, offsets, config):
+            for lines in self.held:
+                if lines.get_fd() != -1 and set(lines.get_lines()) & set(offsets):
+                    raise OSError(errno.EBUSY, os.strerror(errno.EBUSY))
+
+            reader, writer = os.pipe()
+            self.writers.append(writer)
+            lines = GpioLine(reader, offsets)
+            self.held.append(lines)
+            return lines
+
+        device = MagicMock()
+        device.__enter__.return_value.get_lines.side_effect = get_lines
+        return device
+
+    def test_set_sensors(self):
+        """
+        Replacing the sensors releases the lines before requesting them again.
+        """
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[
+            Sensor("door", line=17)])
+
+        with self.assertLogs('flask.app', level="WARNING"):
+            sensor.enable()
+            sensor.set_sensors([Sensor("door", line=17), Sensor("desk", line=18)])
+
+        self.assertTrue(sensor.is_enabled())
+        self.assertEqual(-1, self.held[0].get_fd())
+        self.assertEqual([17, 18], self.held[1].get_lines())
+
+        sensor.disable()
+        self.assertEqual(-1, self.held[1].get_fd())
+
+    def test_busy(self):
+        """
+        A busy line is reported and the previous sensors keep running.
+        """
+        other = MotionSensor(self.display, 30, self.loop, sensors=[Sensor("other", line=18)])
+        sensor = MotionSensor(self.display, 30, self.loop, sensors=[Sensor("door", line=17)])
+
+        with self.assertLogs('flask.app', level="WARNING"):
+            other.enable()
+            sensor.enable()
+
+            with self.assertRaises(MotionSensorException):
+                sensor.set_sensors([Sensor("desk", line=18)])
+
+        self.assertTrue(sensor.is_enabled())
+        self.assertEqual("door", sensor.get_sensors()[0].get_name())
+
+        with self.assertRaises(MotionSensorException):
+            MotionSensor(self.display, 30, self.loop, sensors=[Sensor("desk", line=18)]).enable()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Test the playlist logic.
+"""
+
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from src.playlist import (
+    Playlist, PlaylistException, PlaylistItem, PreloadedPage, ScheduleWindow)
+
+# A monday
+MONDAY_NOON = datetime.datetime(2024, 1, 1, 12, 0)
+
+
+class TestScheduleWindow(unittest.TestCase):
+    """
+    Test the schedule windows.
+    """
+
+    def test_daytime(self):
+        """
+        A window within a single day.
+        """
+        window = ScheduleWindow("08:00", "18:00", [0, 1, 2, 3, 4])
+
+        self.assertTrue(window.contains(MONDAY_NOON))
+        self.assertFalse(window.contains(MONDAY_NOON.replace(hour=18)))
+        self.assertFalse(window.contains(MONDAY_NOON - datetime.timedelta(days=1)))
+
+    def test_overnight(self):
+        """
+        A window spanning midnight belongs to the day it started.
+        """
+        window = ScheduleWindow("22:00", "02:00", [4])
+
+        friday = datetime.datetime(2024, 1, 5, 23, 0)
+        self.assertTrue(window.contains(friday))
+        self.assertTrue(window.contains(friday + datetime.timedelta(hours=2)))
+        self.assertFalse(window.contains(friday + datetime.timedelta(hours=3)))
+        self.assertFalse(window.contains(friday - datetime.timedelta(days=1)))
+
+    def test_invalid(self):
+        """
+        Rejects malformed times and weekdays.
+        """
+        with self.assertRaises(PlaylistException):
+            ScheduleWindow("8am", "18:00")
+
+        with self.assertRaises(PlaylistException):
+            ScheduleWindow("08:00", "18:00", [7])
+
+
+class TestPlaylist(unittest.TestCase):
+    """
+    Test the item selection.
+    """
+
+    def test_get_next(self):
+        """
+        Skips items outside of their schedule and wraps around.
+        """
+        playlist = Playlist.from_list([
+            {"url": "https://example.com/a", "dwell": 10},
+            {"url": "https://example.com/b", "dwell": 10,
+             "schedule": [{"start": "20:00", "end": "22:00"}]},
+            {"url": "https://example.com/c", "dwell": 10},
+        ])
+
+        self.assertEqual(0, playlist.get_next(-1, MONDAY_NOON))
+        self.assertEqual(2, playlist.get_next(0, MONDAY_NOON))
+        self.assertEqual(0, playlist.get_next(2, MONDAY_NOON))
+        self.assertEqual(1, playlist.get_next(0, MONDAY_NOON.replace(hour=21)))
+
+        self.assertIsNone(Playlist().get_next(-1, MONDAY_NOON))
+
+    def test_serialize(self):
+        """
+        Round trips through the json representation.
+        """
+        data = [{
+            "url": "https://example.com",
+            "dwell": 30.0,
+            "schedule": [{"start": "08:00", "end": "18:00", "days": [0, 1]}]}]
+
+        self.assertEqual(data, Playlist.from_list(data).to_list())
+
+        with self.assertRaises(PlaylistException):
+            PlaylistItem("https://example.com", 1)
+
+
+class TestPreloadedPage(unittest.TestCase):
+    """
+    Test swapping in a preloaded page.
+    """
+
+    def test_show(self):
+        """
+        Loads the page in a background tab, activates it and closes the old tab.
+        """
+        cdp = MagicMock()
+        cdp.call_browser.return_value = {"targetId": "next"}
+        cdp.get_page_id.return_value = "previous"
+
+        page = PreloadedPage(cdp, "https://example.com")
+        cdp.call_browser.assert_called_with(
+            "Target.createTarget", {"url": "about:blank", "background": True})
+
+        connection = cdp.open_page.return_value
+        connection.call.assert_called_with("Page.navigate", {"url": "https://example.com"})
+
+        connection.call.return_value = {"result": {"value": "complete"}}
+        self.assertTrue(page.is_ready())
+
+        page.show()
+        cdp.call_browser.assert_any_call("Target.activateTarget", {"targetId": "next"})
+        cdp.call_browser.assert_called_with("Target.closeTarget", {"targetId": "previous"})
+        cdp.set_page.assert_called_once_with("next", connection)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Test merging reloads.
+"""
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.reload import RELOAD_BROWSER, RESTART_BROWSER, RESTART_DISPLAY, ReloadScheduler
+
+
+class TestReloadScheduler(unittest.TestCase):
+    """
+    Test the coalescing and serialization of reloads.
+    """
+
+    def test_coalesce(self):
+        """
+        A browser reload is dropped in favour of a pending window manager restart.
+        """
+        scheduler = ReloadScheduler(delay=0.1)
+        browser = MagicMock()
+        display = MagicMock()
+
+        first = scheduler.request(RELOAD_BROWSER, browser)
+        second = scheduler.request(RESTART_DISPLAY, display)
+        third = scheduler.request(RESTART_BROWSER, browser)
+
+        self.assertTrue(first.wait(5))
+        self.assertTrue(second.wait(5) and third.wait(5))
+
+        browser.assert_not_called()
+        display.assert_called_once()
+        self.assertEqual(RESTART_DISPLAY, first.get_executed())
+        self.assertEqual(RESTART_DISPLAY, third.get_executed())
+
+        counters = scheduler.get_counters()
+        self.assertEqual(3, counters["requests"])
+        self.assertEqual(2, counters["coalesced"])
+        self.assertEqual(1, counters["restart_display"])
+
+    def test_serialize(self):
+        """
+        Requests arriving during a restart are merged into the next one.
+        """
+        scheduler = ReloadScheduler(delay=0)
+        started = threading.Event()
+        release = threading.Event()
+        running = []
+
+        def restart():
+            running.append(1)
+            self.assertEqual(1, len(running))
+            started.set()
+            release.wait(5)
+            running.pop()
+
+        first = scheduler.request(RESTART_BROWSER, restart)
+        self.assertTrue(started.wait(5))
+
+        reload_browser = MagicMock()
+        second = scheduler.request(RELOAD_BROWSER, reload_browser)
+        third = scheduler.request(RELOAD_BROWSER, reload_browser)
+        self.assertFalse(second.is_done())
+
+        release.set()
+        self.assertTrue(first.wait(5) and second.wait(5) and third.wait(5))
+        self.assertIsNone(first.get_error())
+        reload_browser.assert_called_once()
+
+    def test_error(self):
+        """
+        Errors are passed to all merged handles.
+        """
+        scheduler = ReloadScheduler(delay=0)
+        handle = scheduler.request(RESTART_DISPLAY, MagicMock(side_effect=OSError("failed")))
+
+        self.assertTrue(handle.wait(5))
+        self.assertIsInstance(handle.get_error(), OSError)
+
+
+if __name__ == '__main__':
+    unittest.main()
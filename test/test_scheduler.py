@@ -0,0 +1,95 @@
+"""
+Test running deferred calls from a single thread.
+"""
+
+import queue
+import threading
+import time
+import unittest
+
+from src.scheduler import DeadlineScheduler
+
+TIMEOUT = 5
+
+
+class TestDeadlineScheduler(unittest.TestCase):
+    """
+    Test the deadline scheduler.
+    """
+
+    def setUp(self):
+        self.scheduler = DeadlineScheduler()
+        self.calls = queue.Queue()
+
+    def test_order(self):
+        """
+        Calls run by their deadline, not by the order they were scheduled.
+        """
+        self.scheduler.call_later(0.2, self.calls.put, "late")
+        self.scheduler.call_later(0.05, self.calls.put, "early")
+        self.scheduler.call_later(0.05, self.calls.put, "second")
+
+        self.assertEqual(
+            ["early", "second", "late"],
+            [self.calls.get(timeout=TIMEOUT) for _ in range(3)])
+        self.assertEqual(0, self.scheduler.get_pending())
+
+    def test_cancel(self):
+        """
+        A cancelled call never runs, a fired one can not be cancelled.
+        """
+        cancelled = self.scheduler.call_later(0.05, self.calls.put, "cancelled")
+        fired = self.scheduler.call_later(0.1, self.calls.put, "fired")
+
+        self.assertTrue(cancelled.cancel())
+        self.assertTrue(cancelled.is_cancelled())
+        self.assertEqual(1, self.scheduler.get_pending())
+
+        self.assertEqual("fired", self.calls.get(timeout=TIMEOUT))
+        self.assertTrue(fired.is_fired())
+        self.assertFalse(fired.cancel())
+        self.assertTrue(self.calls.empty())
+
+    def test_thread_count(self):
+        """
+        Many pending calls share one thread.
+        """
+        self.scheduler.call_later(60, self.calls.put, "warmup")
+        threads = threading.active_count()
+
+        deadlines = [self.scheduler.call_later(60, self.calls.put, index) for index in range(1000)]
+        self.assertEqual(threads, threading.active_count())
+        self.assertEqual(1001, self.scheduler.get_pending())
+
+        for deadline in deadlines:
+            deadline.cancel()
+        self.assertEqual(1, self.scheduler.get_pending())
+
+    def test_failing_call(self):
+        """
+        An exception does not stop the scheduler.
+        """
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertLogs('flask.app', level="WARNING"):
+            self.scheduler.call_later(0, fail)
+            self.scheduler.call_later(0.01, self.calls.put, "after")
+            self.assertEqual("after", self.calls.get(timeout=TIMEOUT))
+
+    def test_earlier_deadline(self):
+        """
+        An earlier deadline wakes the sleeping worker.
+        """
+        self.scheduler.call_later(60, self.calls.put, "late")
+        time.sleep(0.05)
+
+        start = time.monotonic()
+        self.scheduler.call_later(0.05, self.calls.put, "early")
+
+        self.assertEqual("early", self.calls.get(timeout=TIMEOUT))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Test the screens.d config store.
+"""
+
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from src.screenconfig import ScreenConfig, ScreenConfigStore
+from src.topology import DisplayTopology
+from src.display import Screen
+
+PRIMARY_SCRIPT = (
+    "#!/bin/sh\n"
+    "xrandr --output HDMI-1 --rotate left --primary\n")
+
+DISABLED_SCRIPT = (
+    "#!/bin/sh\n"
+    "xrandr --output HDMI-2 --off\n")
+
+
+class TestScreenConfig(unittest.TestCase):
+    """
+    Test parsing and serializing a single script.
+    """
+
+    def test_parse(self):
+        """
+        Extracts rotation, primary and off from the xrandr command.
+        """
+        config = ScreenConfig.parse("HDMI-1", PRIMARY_SCRIPT)
+        self.assertEqual("HDMI-1", config.get_output())
+        self.assertEqual("left", config.get_rotation())
+        self.assertTrue(config.is_primary())
+        self.assertFalse(config.is_off())
+        self.assertEqual(PRIMARY_SCRIPT, config.get_script())
+
+        config = ScreenConfig.parse("HDMI-2", DISABLED_SCRIPT)
+        self.assertIsNone(config.get_rotation())
+        self.assertFalse(config.is_primary())
+        self.assertTrue(config.is_off())
+        self.assertEqual(DISABLED_SCRIPT, config.get_script())
+
+        self.assertIsNone(ScreenConfig.parse("HDMI-2", PRIMARY_SCRIPT))
+
+
+class TestScreenConfigStore(unittest.TestCase):
+    """
+    Test the in memory store.
+    """
+
+    def test_write_through(self):
+        """
+        Screens read and write their config through the store.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            (Path(directory) / "HDMI-1").write_text(PRIMARY_SCRIPT)
+            (Path(directory) / "HDMI-2").write_text(DISABLED_SCRIPT)
+
+            store = ScreenConfigStore(directory)
+            with (Path(__file__).parent / "xrandr-hdmi2-connected.txt").open("r") as f:
+                topology = DisplayTopology.parse(f.read())
+
+            hdmi1 = Screen("HDMI-1", store).load_topology(topology)
+            self.assertTrue(hdmi1.is_primary())
+            self.assertTrue(hdmi1.is_enabled())
+            self.assertEqual("left", hdmi1.get_orientation())
+
+            hdmi2 = Screen("HDMI-2", store).load_topology(topology)
+            self.assertFalse(hdmi2.is_primary())
+            self.assertFalse(hdmi2.is_enabled())
+
+            store.clear()
+            hdmi1.disable()
+            hdmi2.enable("right")
+
+            self.assertEqual(DISABLED_SCRIPT.replace("HDMI-2", "HDMI-1"),
+                             (Path(directory) / "HDMI-1").read_text())
+            self.assertTrue(hdmi2.is_primary())
+            self.assertEqual("right", hdmi2.get_orientation())
+
+    def test_watch(self):
+        """
+        Changes made outside the service are picked up.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            store = ScreenConfigStore(directory)
+            if not store.watch():
+                self.skipTest("inotify not available")
+
+            self.assertEqual([], store.get_all())
+
+            (Path(directory) / "HDMI-2").write_text(DISABLED_SCRIPT)
+
+            for _ in range(100):
+                if store.get("HDMI-2"):
+                    break
+                time.sleep(0.01)
+
+            self.assertTrue(store.get("HDMI-2").is_off())
+
+
+if __name__ == '__main__':
+    unittest.main()
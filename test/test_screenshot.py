@@ -0,0 +1,284 @@
+"""
+Test the screen capture logic.
+"""
+
+import struct
+import threading
+import unittest
+import zlib
+from unittest.mock import MagicMock
+
+from src.screenshot import (
+    ScreenCapture, ScreenCaptureException, ScreenshotCache,
+    ScreenshotOptions, ScreenshotOptionException, XwdScreenCapture,
+    downsample, encode_png, numpy, resize)
+from src.xlib import XlibException
+
+
+class TestScreenCapture(unittest.TestCase):
+    """
+    Test the backend selection.
+    """
+
+    def test_native_capture(self):
+        """
+        Uses the native backend if it works.
+        """
+        native = MagicMock()
+        native.capture.return_value = b"native"
+        fallback = MagicMock()
+
+        capture = ScreenCapture(native, fallback)
+
+        options = ScreenshotOptions()
+        self.assertEqual(capture.capture(options), b"native")
+        native.capture.assert_called_once_with(options)
+        fallback.capture.assert_not_called()
+
+    def test_fallback_capture(self):
+        """
+        Falls back to xwd in case the native backend fails.
+        """
+        native = MagicMock()
+        fallback = MagicMock()
+        fallback.capture.return_value = b"fallback"
+
+        capture = ScreenCapture(native, fallback)
+
+        options = ScreenshotOptions(20, "png")
+        native.capture.side_effect = XlibException("No display")
+        self.assertEqual(capture.capture(options), b"fallback")
+        fallback.capture.assert_called_with(options)
+
+        native.capture.side_effect = ScreenCaptureException("No numpy")
+        self.assertEqual(capture.capture(options), b"fallback")
+
+    def test_convert_command(self):
+        """
+        Passes the options to convert.
+        """
+        xwd = XwdScreenCapture()
+
+        self.assertEqual(
+            xwd.get_convert_command(ScreenshotOptions()),
+            ["convert", "xwd:-", "-resize", "10%", "png:-"])
+
+        self.assertEqual(
+            xwd.get_convert_command(ScreenshotOptions(50, "jpeg", 60, 800)),
+            ["convert", "xwd:-", "-resize", "50%", "-resize", "800x>",
+             "-quality", "60", "jpeg:-"])
+
+
+class TestScreenshotOptions(unittest.TestCase):
+    """
+    Test the screenshot options.
+    """
+
+    def test_defaults(self):
+        """
+        Uses png at 10 percent by default.
+        """
+        options = ScreenshotOptions()
+
+        self.assertEqual(options.get_scale(), 10)
+        self.assertEqual(options.get_format(), "png")
+        self.assertEqual(options.get_mime_type(), "image/png")
+        self.assertIsNone(options.get_quality())
+        self.assertEqual(options.get_key(), (10, "png", None, None, None))
+
+    def test_query_parameters(self):
+        """
+        Parses the query parameters which are passed as strings.
+        """
+        options = ScreenshotOptions("25", "webp", "70", "640", "480")
+
+        self.assertEqual(options.get_mime_type(), "image/webp")
+        self.assertEqual(options.get_key(), (25, "webp", 70, 640, 480))
+
+        # The quality is ignored for lossless formats.
+        self.assertEqual(
+            ScreenshotOptions(10, "png", 70).get_key(),
+            ScreenshotOptions(10, "png").get_key())
+
+        self.assertEqual(ScreenshotOptions(10, "jpeg").get_quality(), 80)
+
+    def test_limits(self):
+        """
+        Rejects values out of range.
+        """
+        for args in [(0, "png"), (101, "png"), ("abc", "png"), (10, "gif"),
+                     (10, "jpeg", 101), (10, "png", None, 8), (10, "png", None, None, 10000)]:
+            with self.assertRaises(ScreenshotOptionException):
+                ScreenshotOptions(*args)
+
+    def test_factor(self):
+        """
+        Scales by the exact percentage and honors the maximal dimensions,
+        the box filter never shrinks below that size.
+        """
+        self.assertEqual(ScreenshotOptions(10).get_factor(3840, 2160), 10)
+        self.assertEqual(ScreenshotOptions(30).get_factor(3840, 2160), 3)
+        self.assertEqual(ScreenshotOptions(100, max_width=1000).get_factor(3840, 2160), 3)
+        self.assertEqual(ScreenshotOptions(50, max_height=100).get_factor(3840, 2160), 21)
+
+        self.assertEqual(ScreenshotOptions(75).get_size(3840, 2160), (2880, 1620))
+        self.assertEqual(ScreenshotOptions(75).get_factor(3840, 2160), 1)
+        self.assertEqual(ScreenshotOptions(30).get_size(3840, 2160), (1152, 648))
+        self.assertEqual(
+            ScreenshotOptions(100, max_width=1000).get_size(3840, 2160), (1000, 563))
+        self.assertEqual(
+            ScreenshotOptions(50, max_height=100).get_size(3840, 2160), (178, 100))
+
+
+class TestScreenshotCache(unittest.TestCase):
+    """
+    Test the screenshot cache.
+    """
+
+    def test_cached_variants(self):
+        """
+        Caches each variant separately.
+        """
+        cache = ScreenshotCache(60)
+        factory = MagicMock(side_effect=[b"a", b"b", b"c"])
+
+        self.assertEqual(cache.get((10, "png"), factory), b"a")
+        self.assertEqual(cache.get((10, "png"), factory), b"a")
+        self.assertEqual(cache.get((20, "png"), factory), b"b")
+        self.assertEqual(factory.call_count, 2)
+
+        cache.invalidate()
+        self.assertEqual(cache.get((10, "png"), factory), b"c")
+
+    def test_expired(self):
+        """
+        Captures a new screenshot once the ttl expired.
+        """
+        cache = ScreenshotCache(0)
+        factory = MagicMock(side_effect=[b"a", b"b"])
+
+        self.assertEqual(cache.get((10, "png"), factory), b"a")
+        self.assertEqual(cache.get((10, "png"), factory), b"b")
+
+    def test_single_flight(self):
+        """
+        Concurrent requests share a single capture.
+        """
+        cache = ScreenshotCache(60)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def factory():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return b"shared"
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(cache.get("key", factory)))
+        leader.start()
+        started.wait()
+
+        followers = [threading.Thread(
+            target=lambda: results.append(cache.get("key", factory))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b"shared"] * 4)
+
+    def test_invalidate_during_capture(self):
+        """
+        A capture started before the cache was invalidated is not cached.
+        """
+        cache = ScreenshotCache(60)
+
+        def factory():
+            cache.invalidate()
+            return b"stale"
+
+        self.assertEqual(cache.get("key", factory), b"stale")
+        self.assertEqual(cache.get("key", lambda: b"fresh"), b"fresh")
+
+    def test_failed_capture(self):
+        """
+        Errors are raised and not cached.
+        """
+        cache = ScreenshotCache(60)
+
+        with self.assertRaises(ScreenCaptureException):
+            cache.get("key", MagicMock(side_effect=ScreenCaptureException("failed")))
+
+        self.assertEqual(cache.get("key", lambda: b"ok"), b"ok")
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestDownsample(unittest.TestCase):
+    """
+    Test the box filter and the png encoder.
+    """
+
+    def test_box_filter(self):
+        """
+        Averages blocks of pixels.
+        """
+        frame = numpy.zeros((4, 6, 3), dtype=numpy.uint8)
+        frame[0:2, 0:2] = 200
+        frame[0, 0] = 0
+
+        result = downsample(frame, 2)
+
+        self.assertEqual(result.shape, (2, 3, 3))
+        self.assertEqual(result[0, 0, 0], 150)
+        self.assertEqual(result[1, 2, 0], 0)
+
+    def test_incomplete_blocks(self):
+        """
+        Drops border pixels which do not fill a complete block.
+        """
+        frame = numpy.full((2160, 3840, 3), 7, dtype=numpy.uint8)
+
+        result = downsample(frame, 14)
+
+        self.assertEqual(result.shape, (154, 274, 3))
+        self.assertTrue((result == 7).all())
+
+    def test_resize(self):
+        """
+        Scales to the exact size, uniform areas keep their color.
+        """
+        frame = numpy.full((1080, 1920, 3), 7, dtype=numpy.uint8)
+        frame[:, 960:] = 200
+
+        result = resize(frame, 1440, 810)
+
+        self.assertEqual(result.shape, (810, 1440, 3))
+        self.assertTrue((result[:, :700] == 7).all())
+        self.assertTrue((result[:, 740:] == 200).all())
+        self.assertIs(resize(frame, 1920, 1080), frame)
+
+    def test_encode_png(self):
+        """
+        Encodes a frame as png.
+        """
+        frame = numpy.arange(2 * 3 * 3, dtype=numpy.uint8).reshape(2, 3, 3)
+
+        data = encode_png(frame)
+
+        self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n")
+        width, height = struct.unpack(">II", data[16:24])
+        self.assertEqual((width, height), (3, 2))
+
+        length = struct.unpack(">I", data[33:37])[0]
+        rows = zlib.decompress(data[41:41 + length])
+        self.assertEqual(rows, b"\0" + bytes(range(9)) + b"\0" + bytes(range(9, 18)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Test editing line based config files.
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.sed import SingleLineEditor
+
+
+class TestSingleLineEditor(unittest.TestCase):
+    """
+    Test getting, updating and appending lines.
+    """
+
+    def setUp(self):
+        self.__directory = tempfile.TemporaryDirectory()
+        self.__config = Path(self.__directory.name) / "browser.conf"
+
+    def tearDown(self):
+        self.__directory.cleanup()
+
+    def test_set_line(self):
+        """
+        Updates an existing line, a new one is appended on a line of its own.
+        """
+        self.__config.write_text("KIOSK_HOME=https://www.example.com/", encoding="utf-8")
+        editor = SingleLineEditor(self.__config)
+
+        editor.set_line("KIOSK_FLAGS=", "KIOSK_FLAGS=--enable-zero-copy")
+        self.assertEqual(
+            "KIOSK_HOME=https://www.example.com/\nKIOSK_FLAGS=--enable-zero-copy\n",
+            self.__config.read_text(encoding="utf-8"))
+
+        editor.set_line("KIOSK_FLAGS=", "KIOSK_FLAGS=")
+        self.assertEqual("KIOSK_FLAGS=\n", editor.get_line("KIOSK_FLAGS="))
+        self.assertEqual(2, len(self.__config.read_text(encoding="utf-8").splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
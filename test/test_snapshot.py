@@ -0,0 +1,104 @@
+"""
+Test the offline snapshots.
+"""
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.snapshot import OfflineFallback, SnapshotStore
+
+URL = "https://www.example.com/"
+
+
+class TestSnapshotStore(unittest.TestCase):
+    """
+    Test storing and pruning snapshots.
+    """
+
+    def test_prune(self):
+        """
+        Keeps only the newest snapshots per url.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            store = SnapshotStore(directory, max_count=2)
+
+            for now in (1, 2, 3):
+                store.save(URL, f"snapshot {now}".encode("utf-8"), now)
+            store.save("https://other.com/", b"other", 4)
+
+            self.assertEqual(2, len(store.get_snapshots(URL)))
+            self.assertEqual(b"snapshot 3", store.get_latest(URL).read_bytes())
+            self.assertTrue(store.is_snapshot(store.get_latest(URL).as_uri()))
+            self.assertFalse(store.is_snapshot(URL))
+
+            store.clear()
+            self.assertIsNone(store.get_latest(URL))
+
+
+class TestOfflineFallback(unittest.TestCase):
+    """
+    Test switching between the homepage and its snapshot.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.directory.name)
+
+        self.browser = MagicMock()
+        self.browser.get_url.return_value = URL
+        self.browser.get_start_url.return_value = URL
+
+        self.cdp = self.browser.get_cdp.return_value
+        self.cdp.get_page.return_value = {"url": URL}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_capture(self):
+        """
+        Takes a snapshot while the page is reachable, but not of the error page.
+        """
+        fallback = OfflineFallback(self.browser, self.store, prober=lambda url: True)
+
+        self.cdp.call.side_effect = [
+            {"result": {"value": {"url": "chrome-error://chromewebdata/", "state": "complete"}}}]
+        fallback.check()
+        self.assertIsNone(self.store.get_latest(URL))
+
+        self.cdp.call.side_effect = [
+            {"result": {"value": {"url": URL, "state": "complete"}}},
+            {"data": "mhtml"}]
+        fallback.check()
+        self.assertEqual(b"mhtml", self.store.get_latest(URL).read_bytes())
+        self.assertEqual(1, fallback.get_counters()["captures"])
+
+    def test_fallback_and_recovery(self):
+        """
+        Shows the snapshot while offline and returns once the probe succeeds.
+        """
+        reachable = [False]
+        fallback = OfflineFallback(self.browser, self.store, prober=lambda url: reachable[0])
+
+        # Nothing to fall back to yet.
+        fallback.check()
+        self.browser.navigate.assert_not_called()
+
+        snapshot = self.store.save(URL, b"mhtml")
+        fallback.check()
+        self.browser.navigate.assert_called_once_with(snapshot.as_uri())
+
+        # Offline and showing the snapshot, nothing is reloaded.
+        self.cdp.get_page.return_value = {"url": snapshot.as_uri()}
+        fallback.check()
+        self.browser.reload.assert_not_called()
+
+        reachable[0] = True
+        fallback.check()
+        self.browser.reload.assert_called_once()
+        self.assertEqual(1, fallback.get_counters()["fallbacks"])
+        self.assertEqual(1, fallback.get_counters()["recoveries"])
+
+
+if __name__ == '__main__':
+    unittest.main()
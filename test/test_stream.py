@@ -0,0 +1,104 @@
+"""
+Test the live view stream.
+"""
+
+import itertools
+import threading
+import time
+import unittest
+
+from src.stream import ScreenshotStream
+
+
+class TestScreenshotStream(unittest.TestCase):
+    """
+    Test the stream logic.
+    """
+
+    def test_shared_capture(self):
+        """
+        All viewers share a single capture loop which stops without viewers.
+        """
+        counter = itertools.count()
+        calls = []
+
+        def capture(max_age):
+            calls.append(threading.current_thread())
+            return f"frame{next(counter)}".encode()
+
+        stream = ScreenshotStream(capture, 10)
+
+        viewer1 = stream.frames()
+        viewer2 = stream.frames()
+
+        chunk = next(viewer1)
+        self.assertTrue(chunk.startswith(b"--frame\r\nContent-Type: image/jpeg\r\n"))
+        self.assertTrue(chunk.endswith(b"\r\n"))
+        next(viewer2)
+        next(viewer1)
+
+        self.assertEqual(stream.get_viewers(), 2)
+        self.assertEqual(len(set(calls)), 1)
+
+        viewer1.close()
+        viewer2.close()
+        self.assertEqual(stream.get_viewers(), 0)
+
+        time.sleep(0.3)
+        count = len(calls)
+        time.sleep(0.3)
+        self.assertEqual(len(calls), count)
+
+    def test_static_content(self):
+        """
+        Frames are only sent when the content changed.
+        """
+        frames = iter([b"a", b"a", b"a", b"b"] + [b"b"] * 100)
+        stream = ScreenshotStream(lambda max_age: next(frames), 10)
+
+        viewer = stream.frames()
+        self.assertIn(b"\r\n\r\na\r\n", next(viewer))
+        self.assertIn(b"\r\n\r\nb\r\n", next(viewer))
+        viewer.close()
+
+    def test_disconnect_static_content(self):
+        """
+        A viewer disconnecting from static content is noticed by the
+        keepalive, so that the capture loop stops.
+        """
+        calls = []
+
+        def capture(max_age):
+            calls.append(max_age)
+            return b"static"
+
+        stream = ScreenshotStream(capture, 10, keepalive=0.2)
+        connected = threading.Event()
+        connected.set()
+
+        def serve():
+            # Mimics a server which closes the response once a write failed.
+            viewer = stream.frames()
+            for _ in viewer:
+                if not connected.is_set():
+                    viewer.close()
+
+        server = threading.Thread(target=serve, daemon=True)
+        server.start()
+
+        time.sleep(0.3)
+        self.assertEqual(1, stream.get_viewers())
+
+        connected.clear()
+        server.join(5)
+        self.assertFalse(server.is_alive())
+        self.assertEqual(0, stream.get_viewers())
+
+        time.sleep(0.3)
+        count = len(calls)
+        time.sleep(0.3)
+        self.assertEqual(len(calls), count)
+
+
+if __name__ == '__main__':
+    unittest.main()
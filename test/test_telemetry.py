@@ -0,0 +1,84 @@
+"""
+Test the browser performance sampling.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.telemetry import PerformanceCollector
+
+URL = "https://www.example.com/"
+
+
+def create_responses(layouts: float, task: float, fps: float):
+    """
+    Returns the devtools replies for a single sample.
+    """
+    return [
+        {"metrics": [
+            {"name": "LayoutCount", "value": layouts},
+            {"name": "TaskDuration", "value": task},
+            {"name": "JSHeapUsedSize", "value": 1024}]},
+        {"result": {"value": {"fps": fps, "navigation": {"load": 120.0}}}}
+    ]
+
+
+class TestPerformanceCollector(unittest.TestCase):
+    """
+    Test converting the raw metrics into a time series.
+    """
+
+    def setUp(self):
+        self.cdp = MagicMock()
+        self.cdp.get_page.return_value = {"url": URL}
+
+    @patch("src.telemetry.time.monotonic")
+    def test_rates(self, monotonic):
+        """
+        Counters are reported per second, gauges as they are.
+        """
+        collector = PerformanceCollector(self.cdp, history=2)
+
+        self.cdp.call.side_effect = create_responses(10, 1.0, None)
+        monotonic.return_value = 100.0
+        first = collector.sample()
+
+        self.assertIsNone(first["layouts"])
+        self.assertIsNone(first["fps"])
+        # The frame counter only runs for a bounded window.
+        expression = self.cdp.call.call_args[0][1]["expression"]
+        self.assertTrue(expression.endswith("(1000.0)"))
+        self.assertEqual(1024, first["js_heap_used"])
+        self.assertEqual({"load": 120.0}, first["navigation"])
+
+        self.cdp.call.side_effect = create_responses(30, 6.0, 60.0)
+        monotonic.return_value = 110.0
+        second = collector.sample()
+
+        self.assertAlmostEqual(2.0, second["layouts"])
+        self.assertAlmostEqual(0.5, second["task_load"])
+        self.assertAlmostEqual(60.0, second["fps"])
+
+        # A new page starts the counters over.
+        self.cdp.get_page.return_value = {"url": "https://other.com/"}
+        self.cdp.call.side_effect = create_responses(1, 0.1, None)
+        monotonic.return_value = 120.0
+        third = collector.sample()
+
+        self.assertIsNone(third["fps"])
+        self.assertEqual([second, third], collector.get_samples())
+        self.assertEqual([third], collector.get_samples(second["timestamp"]))
+
+    def test_session(self):
+        """
+        Enables the performance domain for new sessions.
+        """
+        PerformanceCollector(self.cdp)
+
+        connection = MagicMock()
+        self.cdp.add_session_listener.call_args[0][0](connection)
+        connection.call.assert_called_once_with("Performance.enable", {"timeDomain": "timeTicks"})
+
+
+if __name__ == '__main__':
+    unittest.main()
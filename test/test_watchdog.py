@@ -0,0 +1,123 @@
+"""
+Test the frozen screen watchdog.
+"""
+
+import hashlib
+import io
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.watchdog import FreezeWatchdog, get_distance, get_hash
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def digest(data: bytes) -> int:
+    """
+    Hashes the fake frames, any change flips many bits.
+    """
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "big")
+
+
+def create_png(color, reverse: bool = False) -> bytes:
+    """
+    Returns a small png with a horizontal gradient in the given color.
+    """
+    image = Image.new("RGB", (64, 32))
+    for x in range(64):
+        position = 63 - x if reverse else x
+        for y in range(32):
+            image.putpixel((x, y), tuple(channel * position // 64 for channel in color))
+
+    data = io.BytesIO()
+    image.save(data, "png")
+    return data.getvalue()
+
+
+class TestFreezeWatchdog(unittest.TestCase):
+    """
+    Test detecting a frozen screen and the escalation.
+    """
+
+    def setUp(self):
+        self.display = MagicMock()
+        self.display.is_off.return_value = False
+        self.display.get_screenshot.return_value = b"frame"
+        self.browser = MagicMock()
+
+    @unittest.skipIf(Image is None, "requires pillow")
+    def test_hash(self):
+        """
+        Similar frames hash alike, different ones do not.
+        """
+        gradient = get_hash(create_png((255, 255, 255)))
+
+        self.assertEqual(0, get_distance(gradient, get_hash(create_png((250, 250, 250)))))
+        self.assertGreater(
+            get_distance(gradient, get_hash(create_png((255, 255, 255), True))), 200)
+
+    @patch("src.watchdog.get_hash", digest)
+    @patch("src.watchdog.time.monotonic")
+    def test_escalate(self, monotonic):
+        """
+        Reloads the browser first, then restarts the window manager.
+        """
+        watchdog = FreezeWatchdog(self.display, self.browser, freeze_timeout=60)
+
+        for now in (0, 30, 60):
+            monotonic.return_value = now
+            watchdog.check()
+
+        self.browser.reload.assert_called_once()
+        self.display.reload.assert_not_called()
+
+        for now in (70, 100, 130):
+            monotonic.return_value = now
+            watchdog.check()
+
+        self.display.reload.assert_called_once()
+        self.assertEqual(2, watchdog.get_counters()["freezes"])
+        self.assertEqual(1, watchdog.get_counters()["display_reloads"])
+        self.assertEqual(2, watchdog.get_counters()["backoff"])
+
+        # Content which never changes is restarted less and less often.
+        for now in range(160, 400, 30):
+            monotonic.return_value = now
+            watchdog.check()
+
+        self.assertEqual(2, self.display.reload.call_count)
+        self.assertEqual(4, watchdog.get_counters()["backoff"])
+
+        # A new timeout keeps the counters.
+        watchdog.set_freeze_timeout(120)
+        self.assertEqual(120, watchdog.get_freeze_timeout())
+        self.assertEqual(3, watchdog.get_counters()["freezes"])
+
+    @patch("src.watchdog.get_hash", digest)
+    @patch("src.watchdog.time.monotonic")
+    def test_changing(self, monotonic):
+        """
+        Changing content and a display which is off never trigger a reload.
+        """
+        watchdog = FreezeWatchdog(self.display, self.browser, freeze_timeout=60)
+
+        for now in range(0, 300, 30):
+            monotonic.return_value = now
+            self.display.get_screenshot.return_value = f"frame {now}".encode("utf-8")
+            watchdog.check()
+
+        self.display.is_off.return_value = True
+        self.display.get_screenshot.return_value = b"frame"
+        for now in range(300, 600, 30):
+            monotonic.return_value = now
+            watchdog.check()
+
+        self.browser.reload.assert_not_called()
+        self.assertEqual(10, watchdog.get_counters()["checks"])
+
+
+if __name__ == '__main__':
+    unittest.main()